@@ -1,44 +1,122 @@
-from flask import Flask, request
-from bot import main, setup_handlers
-from reminders import load_unsent_reminders
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Update
+
+from lifecycle import Lifecycle
+from reminders import purge_reminders
 import config
-from telegram.ext import Application
+import metrics
+import outbox
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+# Компоненты бота запускаются и останавливаются вместе с ASGI-сервером (см. lifespan)
+lifecycle = Lifecycle(webhook=True)
+
+async def index(request):
+    return PlainTextResponse("Bot is running!")
+
+async def metrics_endpoint(request):
+    """Метрики в текстовом формате Prometheus"""
+    # Часть gauge читает базу, поэтому собираем вне event loop
+    return PlainTextResponse(await run_in_threadpool(metrics.render), media_type='text/plain; version=0.0.4')
 
-# Создаем application
-application = Application.builder().token(config.BOT_TOKEN).build()
-setup_handlers(application)
+async def webhook(request):
+    """Обработка webhook от Telegram: проверяем секрет, ставим в очередь и сразу отвечаем"""
+    if not secrets.compare_digest(
+        request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), config.WEBHOOK_SECRET
+    ):
+        return Response(status_code=403)
+
+    try:
+        update = Update.de_json(await request.json(), lifecycle.application.bot)
+    except ValueError:
+        return Response(status_code=400)
+
+    try:
+        lifecycle.application.update_queue.put_nowait(update)
+    except asyncio.QueueFull:
+        # Очередь переполнена: Telegram повторит доставку позже
+        logger.warning("Очередь обновлений переполнена, обновление отклонено")
+        return Response(status_code=503, headers={'Retry-After': '1'})
+    return PlainTextResponse('ok')
 
-@app.route('/')
-def index():
-    return "Bot is running!"
+def is_admin(request):
+    return bool(config.ADMIN_TOKEN) and secrets.compare_digest(
+        request.headers.get('X-Admin-Token', ''), config.ADMIN_TOKEN
+    )
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Обработка webhook от Telegram"""
-    update = Update.de_json(request.get_json(), application.bot)
-    application.update_queue.put(update)
-    return 'ok'
+async def admin_purge(request):
+    """Массовая очистка напоминаний по чату и/или возрасту"""
+    if not is_admin(request):
+        return JSONResponse({'error': 'forbidden'}, status_code=403)
 
-def setup_webhook(app_instance):
-    """Настраивает webhook для бота"""
     try:
-        app_instance.bot.set_webhook(config.WEBHOOK_URL)
-        logger.info(f"Webhook set to: {config.WEBHOOK_URL}")
-    except Exception as e:
-        logger.error(f"Error setting webhook: {e}")
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    older_than_days = payload.get('older_than_days')
+    try:
+        count = await run_in_threadpool(
+            purge_reminders,
+            chat_id=payload.get('chat_id'),
+            older_than=timedelta(days=older_than_days) if older_than_days is not None else None
+        )
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    return JSONResponse({'deleted': count})
+
+async def admin_deliveries(request):
+    """Исходы доставок из outbox: счетчики по статусам и последние строки.
+
+    Фильтры в query string: status, reminder_id, chat_id, limit.
+    """
+    if not is_admin(request):
+        return JSONResponse({'error': 'forbidden'}, status_code=403)
+
+    params = request.query_params
+    try:
+        filters = {
+            'status': params.get('status'),
+            'reminder_id': int(params['reminder_id']) if 'reminder_id' in params else None,
+            'chat_id': int(params['chat_id']) if 'chat_id' in params else None,
+            'limit': min(int(params.get('limit', 100)), 1000),
+        }
+        deliveries = await run_in_threadpool(outbox.list_deliveries, **filters)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    counts = await run_in_threadpool(outbox.count_by_status)
+    return JSONResponse({'counts': counts, 'deliveries': deliveries})
+
+@asynccontextmanager
+async def lifespan(app):
+    # uvicorn по SIGTERM перестает принимать запросы и выходит отсюда:
+    # остановка дожидается принятых обновлений и досылает напоминания
+    await lifecycle.start()
+    yield
+    await lifecycle.stop()
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/metrics', metrics_endpoint),
+        Route('/webhook', webhook, methods=['POST']),
+        Route('/admin/purge', admin_purge, methods=['POST']),
+        Route('/admin/deliveries', admin_deliveries),
+    ],
+    lifespan=lifespan
+)
 
 if __name__ == "__main__":
-    # Загружаем неотправленные напоминания при запуске
-    load_unsent_reminders()
-    
-    # Настраиваем webhook
-    setup_webhook(application)
-    
-    # Запускаем Flask app
-    app.run(host='0.0.0.0', port=config.PORT)
+    # Один процесс и один event loop для ASGI-сервера и application
+    uvicorn.run(app, host='0.0.0.0', port=config.PORT)
@@ -0,0 +1,193 @@
+"""Архивация отправленных напоминаний.
+
+Таблицу ``reminders`` читают список, диспетчер и восстановление, поэтому в
+ней должны оставаться только неотправленные напоминания.
+:class:`ArchiveCompactor` в фоне переносит отправленные напоминания старше
+``ARCHIVE_AFTER_HOURS`` в ``reminders_archive``. Это и просроченные,
+которые восстановление пометило отправленными. Перенос идет пачками по
+``ARCHIVE_CHUNK`` строк, каждая пачка — в своей короткой транзакции, с
+паузой между ними, чтобы не забирать блокировку базы у живого трафика.
+Тот же проход удаляет строки архива и завершенные доставки outbox старше
+``ARCHIVE_RETENTION_DAYS``.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import DateTime, delete, insert, literal, select
+
+from database import SessionLocal, ArchivedReminder, Delivery, Reminder
+from timezones import utcnow
+import config
+import metrics
+import outbox
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED = metrics.Counter('helotime_archived_reminders_total', 'Напоминания, перенесенные в архив')
+
+_ARCHIVE_COLUMNS = ('id', 'user_id', 'chat_id', 'reminder_text', 'reminder_time', 'recurrence', 'archived_at')
+
+
+def _move_chunk(after_id, before, chunk):
+    """Переносит одну пачку, возвращает id перенесенных напоминаний"""
+    now = utcnow()
+    db_session = SessionLocal()
+    try:
+        ids = [reminder_id for reminder_id, in db_session.query(Reminder.id).filter(
+            Reminder.id > after_id,
+            Reminder.is_sent == True,
+            Reminder.reminder_time < before
+        ).order_by(Reminder.id).limit(chunk)]
+        if ids:
+            # До AUTOINCREMENT (см. database.ensure_autoincrement) SQLite мог
+            # выдать id уже архивированного напоминания новому: в архиве
+            # остается более позднее, иначе перенос падал бы на каждой пачке
+            reused = db_session.execute(delete(ArchivedReminder).where(
+                ArchivedReminder.id.in_(ids)
+            ).execution_options(synchronize_session=False)).rowcount
+            if reused:
+                logger.warning(f"Архив: {reused} id переиспользованы, в архиве заменены более поздними")
+            db_session.execute(insert(ArchivedReminder).from_select(_ARCHIVE_COLUMNS, select(
+                Reminder.id, Reminder.user_id, Reminder.chat_id, Reminder.reminder_text,
+                Reminder.reminder_time, Reminder.recurrence, literal(now, DateTime)
+            ).where(Reminder.id.in_(ids))))
+            db_session.query(Reminder).filter(Reminder.id.in_(ids)).delete(synchronize_session=False)
+        db_session.commit()
+        return ids
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def archive_sent(before=None, chunk=None, pause=None, stop=None):
+    """Переносит отправленные напоминания старше ``before`` в архив.
+
+    Пачки идут по возрастанию id, поэтому каждая следующая начинается там,
+    где кончилась предыдущая. ``stop`` (threading.Event) прерывает перенос
+    между пачками. Возвращает число перенесенных напоминаний.
+    """
+    before = before or utcnow() - timedelta(hours=config.ARCHIVE_AFTER_HOURS)
+    chunk = chunk or config.ARCHIVE_CHUNK
+    pause = config.ARCHIVE_PAUSE_SECONDS if pause is None else pause
+    moved = 0
+    after_id = 0
+    while stop is None or not stop.is_set():
+        ids = _move_chunk(after_id, before, chunk)
+        moved += len(ids)
+        ARCHIVED.inc(len(ids))
+        if len(ids) < chunk:
+            break
+        after_id = ids[-1]
+        time.sleep(pause)
+    return moved
+
+
+def _delete_chunked(table, *criteria, chunk=None, pause=0.0):
+    """Удаляет строки по условию пачками, возвращает их число"""
+    chunk = chunk or config.ARCHIVE_CHUNK
+    deleted = 0
+    while True:
+        db_session = SessionLocal()
+        try:
+            count = db_session.execute(delete(table).where(table.id.in_(
+                select(table.id).where(*criteria).limit(chunk).scalar_subquery()
+            )).execution_options(synchronize_session=False)).rowcount
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+        deleted += count
+        if count < chunk:
+            return deleted
+        time.sleep(pause)
+
+
+def prune(before=None, pause=None):
+    """Удаляет архив и завершенные доставки outbox старше ``before``.
+
+    Возвращает пару ``(удалено из архива, удалено доставок)``.
+    """
+    if before is None:
+        if not config.ARCHIVE_RETENTION_DAYS:
+            return 0, 0
+        before = utcnow() - timedelta(days=config.ARCHIVE_RETENTION_DAYS)
+    pause = config.ARCHIVE_PAUSE_SECONDS if pause is None else pause
+    archived = _delete_chunked(ArchivedReminder, ArchivedReminder.archived_at < before, pause=pause)
+    deliveries = _delete_chunked(
+        Delivery, Delivery.status.in_((outbox.SENT, outbox.DEAD)), Delivery.updated_at < before, pause=pause
+    )
+    return archived, deliveries
+
+
+def purge_archive(user_id=None, chat_id=None, older_than=None):
+    """Удаляет из архива напоминания пользователя, чата и/или старше ``older_than``"""
+    criteria = []
+    if user_id is not None:
+        criteria.append(ArchivedReminder.user_id == user_id)
+    if chat_id is not None:
+        criteria.append(ArchivedReminder.chat_id == chat_id)
+    if older_than is not None:
+        criteria.append(ArchivedReminder.reminder_time < utcnow() - older_than)
+    if not criteria:
+        raise ValueError("Нужно указать user_id, chat_id или older_than")
+    return _delete_chunked(ArchivedReminder, *criteria)
+
+
+def is_archived(reminder_id, user_id=None):
+    db_session = SessionLocal()
+    try:
+        query = db_session.query(ArchivedReminder.id).filter_by(id=reminder_id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return query.first() is not None
+    finally:
+        db_session.close()
+
+
+class ArchiveCompactor:
+    """Фоновый поток, раз в ``ARCHIVE_INTERVAL_SECONDS`` архивирующий отправленные напоминания"""
+
+    def __init__(self, interval=None):
+        self.interval = interval or config.ARCHIVE_INTERVAL_SECONDS
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='reminder-archive', daemon=True)
+        self._thread.start()
+        logger.info("Архивация отправленных напоминаний запущена")
+
+    def shutdown(self):
+        """Останавливает поток после текущей пачки"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def run_once(self):
+        started = time.monotonic()
+        moved = archive_sent(stop=self._stop)
+        archived, deliveries = prune() if not self._stop.is_set() else (0, 0)
+        logger.info(
+            f"Архивация: перенесено {moved} напоминаний, удалено из архива {archived}, "
+            f"доставок {deliveries} за {time.monotonic() - started:.2f} с"
+        )
+
+    def _run(self):
+        # Первый проход сразу: после долгого простоя накопилось больше всего
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка при архивации напоминаний: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,117 @@
+"""Архивация отправленных напоминаний: размер горячей таблицы и помехи трафику.
+
+В базу загружаются SENT отправленных и PENDING неотправленных напоминаний.
+Горячие запросы (страница списка, подсчет неотправленных, все напоминания
+пользователя) меряются до и после переноса в архив. Пока идет
+перенос, отдельный поток читает страницы списка, и по его задержке видно,
+насколько пачки с паузами мешают живому трафику.
+
+Запуск: python -m benchmarks.bench_archive [отправленных] [неотправленных]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'archive.db')}"
+)
+
+from sqlalchemy import insert
+
+from archive import archive_sent
+from database import engine, init_schema, SessionLocal, Reminder
+from timezones import utcnow
+
+USERS = 1000
+
+
+def prepare(sent, pending):
+    now = utcnow()
+    rows = [
+        {'user_id': i % USERS, 'chat_id': i % USERS, 'reminder_text': f'bench {i}',
+         'reminder_time': now - timedelta(days=2, minutes=i % 10000), 'is_sent': True}
+        for i in range(sent)
+    ] + [
+        {'user_id': i % USERS, 'chat_id': i % USERS, 'reminder_text': f'bench {i}',
+         'reminder_time': now + timedelta(minutes=i % 10000), 'is_sent': False}
+        for i in range(pending)
+    ]
+    with engine.begin() as conn:
+        for start in range(0, len(rows), 50000):
+            conn.execute(insert(Reminder), rows[start:start + 50000])
+
+
+def page(db_session, user_id):
+    return db_session.query(Reminder.id, Reminder.reminder_text, Reminder.reminder_time).filter_by(
+        user_id=user_id, is_sent=False
+    ).order_by(Reminder.reminder_time, Reminder.id).limit(11).all()
+
+
+def measure(repeat=200):
+    db_session = SessionLocal()
+    try:
+        timings = {}
+        started = time.perf_counter()
+        for i in range(repeat):
+            page(db_session, i % USERS)
+        timings['страница'] = (time.perf_counter() - started) / repeat
+        started = time.perf_counter()
+        for _ in range(20):
+            db_session.query(Reminder).filter(Reminder.is_sent == False).count()
+        timings['count'] = (time.perf_counter() - started) / 20
+        started = time.perf_counter()
+        db_session.query(Reminder.id).filter(Reminder.user_id == 1).count()
+        timings['по user_id'] = time.perf_counter() - started
+        return timings
+    finally:
+        db_session.close()
+
+
+def concurrent_reader(stop, latencies):
+    db_session = SessionLocal()
+    try:
+        user_id = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            page(db_session, user_id % USERS)
+            db_session.commit()
+            latencies.append(time.perf_counter() - started)
+            user_id += 1
+    finally:
+        db_session.close()
+
+
+def main():
+    sent = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    pending = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    init_schema()
+    prepare(sent, pending)
+    print(f"Отправленных {sent}, неотправленных {pending}")
+
+    before = measure()
+
+    stop = threading.Event()
+    latencies = []
+    reader = threading.Thread(target=concurrent_reader, args=(stop, latencies))
+    reader.start()
+    started = time.perf_counter()
+    moved = archive_sent(before=utcnow() - timedelta(days=1))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    reader.join()
+    latencies.sort()
+
+    after = measure()
+    print(f"Перенесено {moved} за {elapsed:.2f} с ({moved / elapsed:.0f} строк/с)")
+    print(f"Чтение во время переноса: p50 {latencies[len(latencies) // 2] * 1000:.2f} мс, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} мс, max {latencies[-1] * 1000:.2f} мс")
+    print(f"{'запрос':>12} | {'до, мс':>8} {'после, мс':>10}")
+    for name in before:
+        print(f"{name:>12} | {before[name] * 1000:>8.3f} {after[name] * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Отдельные HTTP-пулы против общего PooledRequest при всплесках отправки.
+
+Пайплайн отправляет ``--bursts`` всплесков по ``--burst`` напоминаний с
+паузой ``--pause`` секунд (больше 5 с keep-alive httpx по умолчанию), а
+обработчики в это время отвечают пользователям раз в 20 мс.
+
+* ``separate`` — как было: у пайплайна свой Bot в своем потоке с
+  ``HTTPXRequest(DELIVERY_CONCURRENCY)``, у Application — свой с настройками
+  PTB по умолчанию;
+* ``shared`` — один бот с :class:`bot_api.PooledRequest` в event loop
+  Application, как запускает lifecycle.
+
+Фейковый Bot API считает принятые TCP-соединения.
+
+Запуск: python -m benchmarks.bench_bot_api [--burst 150] [--bursts 3] [--pause 6]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bot_api.db')}"
+)
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.loadtest import percentile
+from database import SessionLocal, Reminder, init_schema
+from delivery import DeliveryPipeline
+from timezones import utcnow
+import bot_api
+import config
+
+CHATTER_CHAT = 10 ** 9
+
+
+def fill(count, tag):
+    db_session = SessionLocal()
+    try:
+        now = utcnow()
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': i, 'chat_id': i, 'reminder_text': f'{tag} {i}', 'reminder_time': now, 'is_sent': False}
+            for i in range(count)
+        ])
+        db_session.commit()
+        return [reminder_id for reminder_id, in db_session.query(Reminder.id).filter(
+            Reminder.reminder_text.like(f'{tag} %')
+        )]
+    finally:
+        db_session.close()
+
+
+async def chatter(bot, stop, latencies):
+    """Ответы обработчиков: sendMessage раз в 20 мс"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await bot.send_message(CHATTER_CHAT, "ответ")
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            latencies.append(float('inf'))
+        await asyncio.sleep(0.02)
+
+
+async def wait_sent(pipeline, target):
+    while pipeline.sent + pipeline.failed < target:
+        await asyncio.sleep(0.01)
+
+
+async def run_mode(mode, args):
+    api = FakeBotAPI(latency=0.02).start()
+    if mode == 'separate':
+        delivery_bot = Bot("123:bench", base_url=api.base_url,
+                           request=HTTPXRequest(connection_pool_size=config.DELIVERY_CONCURRENCY))
+        bot = Bot("123:bench", base_url=api.base_url, request=HTTPXRequest(connection_pool_size=256))
+    else:
+        bot = delivery_bot = Bot("123:bench", base_url=api.base_url, request=bot_api.PooledRequest(http2=False))
+    await bot.initialize()
+    pipeline = DeliveryPipeline(delivery_bot)
+    if mode == 'separate':
+        pipeline.start()
+    else:
+        await pipeline.start_async(bot)
+
+    stop, chatter_latencies = asyncio.Event(), []
+    chatter_task = asyncio.create_task(chatter(bot, stop, chatter_latencies))
+    timeouts = bot_api.POOL_TIMEOUTS.labels(bot_api.SEND).value
+    burst_seconds = []
+    for burst in range(args.bursts):
+        if burst:
+            await asyncio.sleep(args.pause)
+        reminder_ids = await asyncio.to_thread(fill, args.burst, f'{mode}-{burst}')
+        started = time.perf_counter()
+        pipeline.submit(reminder_ids)
+        await wait_sent(pipeline, args.burst * (burst + 1))
+        burst_seconds.append(time.perf_counter() - started)
+    stop.set()
+    await chatter_task
+
+    if mode == 'separate':
+        await asyncio.to_thread(pipeline.stop)
+    else:
+        await pipeline.stop_async()
+    await bot.shutdown()
+    api.stop()
+    chatter_latencies.sort()
+    return {
+        'connections': api.connections,
+        'burst': sum(burst_seconds) / len(burst_seconds),
+        'sent': pipeline.sent,
+        'p50': percentile(chatter_latencies, 0.5),
+        'p99': percentile(chatter_latencies, 0.99),
+        'timeouts': bot_api.POOL_TIMEOUTS.labels(bot_api.SEND).value - timeouts,
+    }
+
+
+async def main_async(args):
+    print(f"Всплесков {args.bursts} по {args.burst} напоминаний, пауза {args.pause} с; "
+          f"пул {config.BOT_API_POOL_SIZE}, keep-alive {config.BOT_API_KEEPALIVE_SECONDS:.0f} с")
+    print(f"{'пулы':>9} | {'соединений':>10} {'всплеск, с':>10} {'отправлено':>10} | "
+          f"{'ответы p50, мс':>14} {'p99, мс':>8} | нет места в пуле")
+    for mode in ('separate', 'shared'):
+        result = await run_mode(mode, args)
+        print(f"{mode:>9} | {result['connections']:>10} {result['burst']:>10.2f} {result['sent']:>10} | "
+              f"{result['p50']:>14.1f} {result['p99']:>8.1f} | {result['timeouts']:.0f}")
+    requests = sum(child.value for child in bot_api.REQUESTS._children.values())
+    connections = bot_api.CONNECTIONS.labels(bot_api.SEND).value
+    print(f"shared по метрикам: запросов {requests:.0f}, новых соединений {connections:.0f} "
+          f"(переиспользовано {1 - connections / requests:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--burst', type=int, default=150)
+    parser.add_argument('--bursts', type=int, default=3)
+    parser.add_argument('--pause', type=float, default=6)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    init_schema()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Кэш первой страницы напоминаний: задержка «Мои напоминания» и доля попаданий.
+
+Смесь операций как у живых пользователей: на каждое создание или удаление
+приходится несколько открытий списка. Сравнивается работа с кэшем и без.
+
+Запуск: python -m benchmarks.bench_cache [пользователей] [операций]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ.setdefault("REDIS_URL", "")
+
+from sqlalchemy import insert
+
+from database import engine, init_schema, Reminder
+import reminders
+
+PER_USER = 30
+READ_SHARE = 0.9
+
+
+def populate(users):
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(Reminder), [
+            {'user_id': user_id, 'chat_id': user_id, 'reminder_text': f'bench {user_id}-{i}',
+             'reminder_time': now + timedelta(hours=1, minutes=i), 'is_sent': False}
+            for user_id in range(users) for i in range(PER_USER)
+        ])
+
+
+def run(users, operations, cached):
+    random.seed(1)
+    cache = reminders.user_reminders
+    cache.clear()
+    cache.hits = cache.misses = 0
+    latencies = []
+    now = datetime.now()
+    for _ in range(operations):
+        # Активных пользователей немного: выбор с перекосом к первым
+        user_id = min(int(random.paretovariate(1.2)) - 1, users - 1)
+        if random.random() < READ_SHARE:
+            if not cached:
+                cache.clear()
+            started = time.perf_counter()
+            reminders.get_user_reminders_page(user_id)
+            latencies.append(time.perf_counter() - started)
+        else:
+            reminder_id = reminders.create_reminder(user_id, user_id, 'new', now + timedelta(days=1))
+            reminders.delete_reminder(reminder_id)
+    latencies.sort()
+    return latencies, cache.stats()
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    init_schema()
+    # Напоминания создаются через групповой писатель; диспетчер и отправка не нужны
+    reminders.writer.start()
+    populate(users)
+
+    print(f"{'кэш':>4} | {'p50, мс':>8} {'p99, мс':>8} | {'попадания':>9} {'память, КБ':>10}")
+    for cached in (False, True):
+        latencies, stats = run(users, operations, cached)
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{'да' if cached else 'нет':>4} | {p50:>8.3f} {p99:>8.3f} | "
+              f"{stats['hit_ratio']:>9.1%} {stats.get('memory_bytes', 0) / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Смешанная нагрузка чтение/запись на базу в разных профилях DB_PROFILE.
+
+Потоки, как пул базы, писатель и диспетчер бота, одновременно читают первую
+страницу напоминаний пользователя и вставляют напоминания (коммит на вставку).
+Для каждого профиля — своя база. PostgreSQL участвует, если задан
+BENCH_POSTGRES_URL.
+
+Запуск: python -m benchmarks.bench_db_profiles [потоков] [секунд] [доля записи]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, Reminder, make_engine
+
+USERS = 1000
+PRELOAD = 50000
+
+
+def prepare(engine):
+    Base.metadata.create_all(engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(Reminder.__table__.delete())
+        conn.execute(insert(Reminder), [
+            {'user_id': i % USERS, 'chat_id': 1, 'reminder_text': f'bench {i}',
+             'reminder_time': now + timedelta(minutes=i % 10000), 'is_sent': False}
+            for i in range(PRELOAD)
+        ])
+
+
+def run(engine, threads, seconds, write_share):
+    Session = sessionmaker(bind=engine)
+    counts = {'read': 0, 'write': 0, 'error': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = {'read': 0, 'write': 0, 'error': 0}
+        while time.perf_counter() < deadline:
+            session = Session()
+            try:
+                user_id = rng.randrange(USERS)
+                if rng.random() < write_share:
+                    session.add(Reminder(user_id=user_id, chat_id=1, reminder_text='new',
+                                         reminder_time=datetime.now() + timedelta(days=1)))
+                    session.commit()
+                    local['write'] += 1
+                else:
+                    session.query(Reminder.id, Reminder.reminder_text, Reminder.reminder_time).filter_by(
+                        user_id=user_id, is_sent=False
+                    ).order_by(Reminder.reminder_time, Reminder.id).limit(11).all()
+                    local['read'] += 1
+            except Exception:
+                session.rollback()
+                local['error'] += 1
+            finally:
+                session.close()
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return counts
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    write_share = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+
+    targets = [(f'sqlite {profile}', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}", profile)
+               for profile in ('default', 'tuned')]
+    if os.getenv('BENCH_POSTGRES_URL'):
+        targets += [(f'postgres {profile}', os.environ['BENCH_POSTGRES_URL'], profile)
+                    for profile in ('default', 'tuned')]
+
+    print(f"{'профиль':>16} | {'чтений/с':>9} {'записей/с':>9} {'ошибок':>7}")
+    for label, url, profile in targets:
+        engine = make_engine(url, profile)
+        prepare(engine)
+        counts = run(engine, threads, seconds, write_share)
+        engine.dispose()
+        print(f"{label:>16} | {counts['read'] / seconds:>9.0f} {counts['write'] / seconds:>9.0f} "
+              f"{counts['error']:>7}")
+
+
+if __name__ == "__main__":
+    main()
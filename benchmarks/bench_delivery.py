@@ -0,0 +1,74 @@
+"""Пропускная способность пайплайна отправки против локального фейкового Bot API.
+
+Запуск: python -m benchmarks.bench_delivery [кол-во] [чатов] [лимит сообщ/с]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from database import SessionLocal, Reminder, init_schema
+from delivery import DeliveryPipeline
+from timezones import utcnow
+
+
+def fill_table(count, chats):
+    db_session = SessionLocal()
+    try:
+        db_session.query(Reminder).delete()
+        now = utcnow()
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': i % chats, 'chat_id': i % chats, 'reminder_text': f'bench {i}',
+             'reminder_time': now, 'is_sent': False}
+            for i in range(count)
+        ])
+        db_session.commit()
+        return [reminder_id for reminder_id, in db_session.query(Reminder.id)]
+    finally:
+        db_session.close()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    logging.basicConfig(level=logging.WARNING)
+    init_schema()
+
+    api = FakeBotAPI(latency=0.02, flood_ratio=0.01).start()
+    reminder_ids = fill_table(count, chats)
+    pipeline = DeliveryPipeline(
+        Bot("123:bench", base_url=api.base_url, request=HTTPXRequest(connection_pool_size=100)),
+        global_rate=rate, concurrency=100
+    )
+    pipeline.start()
+
+    started = time.perf_counter()
+    pipeline.submit(reminder_ids)
+    pipeline.stop()
+    elapsed = time.perf_counter() - started
+
+    db_session = SessionLocal()
+    pending = db_session.query(Reminder).filter_by(is_sent=False).count()
+    db_session.close()
+    api.stop()
+
+    stats = pipeline.stats()
+    print(f"напоминаний: {count}, чатов: {chats}, лимит: {rate:.0f} сообщ/с")
+    print(f"отправлено: {stats['sent']}, ошибок: {stats['failed']}, повторов: {stats['retries']}, "
+          f"не отмечено: {pending}")
+    print(f"время: {elapsed:.2f} с, пропускная способность: {stats['sent'] / elapsed:.1f} сообщ/с, "
+          f"макс. задержка: {stats['max_lag']:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Сводки: напоминания одного чата в 09:00 одним сообщением.
+
+У ``--chats`` чатов наступает по ``--per-chat`` напоминаний сразу и еще одно
+через ``--later`` секунд, у стольких же чатов — по одному. Напоминания
+арендуются как диспетчером и проходят через пайплайн отправки с лимитами
+из config; Bot API подменен :class:`RecordingRequest` с задержкой 30 мс.
+Без сводок позднее напоминание ждет своего времени, со сводкой
+(``DIGEST_WINDOW_SECONDS``) уходит вместе с остальными.
+
+Запуск: python -m benchmarks.bench_digest [--chats 100] [--per-chat 3] [--later 30]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'digest.db')}"
+)
+
+from telegram import Bot
+
+from benchmarks.fake_bot_api import RecordingRequest
+from database import SessionLocal, Delivery, Reminder, init_schema
+from delivery import DeliveryPipeline, MESSAGES_SENT
+from dispatcher import claim_due_reminders
+from timezones import utcnow
+import config
+import metrics
+
+
+def fill(args, first_chat):
+    now = utcnow()
+    rows = []
+    for chat in range(first_chat, first_chat + args.chats):
+        rows += [{'reminder_time': now, 'chat_id': chat, 'reminder_text': f'дело {i}'} for i in range(args.per_chat)]
+        rows.append({'reminder_time': now + timedelta(seconds=args.later), 'chat_id': chat, 'reminder_text': 'позже'})
+    for chat in range(first_chat + args.chats, first_chat + 2 * args.chats):
+        rows.append({'reminder_time': now, 'chat_id': chat, 'reminder_text': 'одно'})
+    db_session = SessionLocal()
+    try:
+        db_session.bulk_insert_mappings(Reminder, [dict(row, user_id=row['chat_id'], is_sent=False) for row in rows])
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def check(first_chat, last_chat):
+    """Отправленные напоминания и сколько из них пришло в сводках"""
+    db_session = SessionLocal()
+    try:
+        sent = db_session.query(Reminder).filter(
+            Reminder.chat_id.between(first_chat, last_chat), Reminder.is_sent == True
+        ).count()
+        message_ids = [message_id for message_id, in db_session.query(Delivery.message_id).filter(
+            Delivery.chat_id.between(first_chat, last_chat), Delivery.status == 'sent'
+        )]
+        per_message = Counter(message_ids)
+        return sent, sum(count for count in per_message.values() if count > 1)
+    finally:
+        db_session.close()
+
+
+def run_mode(window, args, first_chat):
+    fill(args, first_chat)
+    recorder = RecordingRequest(latency=0.03)
+    bot = Bot(config.BOT_TOKEN, request=recorder, get_updates_request=RecordingRequest())
+    pipeline = DeliveryPipeline(bot, digest_window=window)
+    pipeline.start()
+    reminders, messages = metrics.REMINDERS_SENT.labels().value, MESSAGES_SENT.labels().value
+    started = time.perf_counter()
+    pipeline.submit(claim_due_reminders(pipeline.owner))
+    pipeline.stop()
+    elapsed = time.perf_counter() - started
+    sent, merged = check(first_chat, first_chat + 2 * args.chats)
+    reminders = metrics.REMINDERS_SENT.labels().value - reminders
+    messages = MESSAGES_SENT.labels().value - messages
+    return {
+        'calls': recorder.count('sendMessage'), 'elapsed': elapsed, 'sent': sent,
+        'ratio': reminders / messages if messages else 0, 'merged': merged,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--per-chat', type=int, default=3)
+    parser.add_argument('--later', type=float, default=30)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    init_schema()
+
+    total = args.chats * (args.per_chat + 2)
+    print(f"Чатов со сводкой {args.chats} по {args.per_chat} + 1 через {args.later:.0f} с, одиночных {args.chats}; "
+          f"всего {total}; лимит {config.DELIVERY_GLOBAL_RATE:.0f} сообщ/с, {config.DELIVERY_CHAT_RATE:.0f} в чат")
+    print(f"{'сводки':>7} | {'sendMessage':>11} {'за, с':>6} {'отправлено':>10} "
+          f"{'напом./сообщ.':>13} {'в сводках':>9}")
+    for index, (name, window) in enumerate((('нет', 0), ('60 с', 60))):
+        result = run_mode(window, args, 1 + index * 10 ** 6)
+        print(f"{name:>7} | {result['calls']:>11} {result['elapsed']:>6.1f} {result['sent']:>10} "
+              f"{result['ratio']:>13.2f} {result['merged']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Сравнение диспетчера на min-heap с заданием APScheduler на каждое напоминание.
+
+Запуск: python -m benchmarks.bench_dispatcher [10000,100000,1000000]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
+
+from database import SessionLocal, Reminder, init_schema
+from dispatcher import ReminderDispatcher
+
+SPREAD = timedelta(days=30)
+
+
+def noop(reminder_ids):
+    pass
+
+
+def reminder_times(count):
+    start = datetime.now() + timedelta(minutes=1)
+    step = SPREAD / count
+    return [start + step * i for i in range(count)]
+
+
+def bench_apscheduler(times):
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)
+    tracemalloc.start()
+    started = time.perf_counter()
+    for reminder_id, run_date in enumerate(times, 1):
+        scheduler.add_job(
+            noop,
+            trigger=DateTrigger(run_date=run_date),
+            args=[[reminder_id]],
+            id=f"reminder_{reminder_id}",
+            replace_existing=True
+        )
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    scheduler.shutdown(wait=False)
+    return elapsed, memory
+
+
+def fill_table(times):
+    db_session = SessionLocal()
+    try:
+        db_session.query(Reminder).delete()
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': 1, 'chat_id': 1, 'reminder_text': 'bench', 'reminder_time': t, 'is_sent': False}
+            for t in times
+        ])
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def bench_dispatcher(times):
+    fill_table(times)
+    dispatcher = ReminderDispatcher(noop)
+    tracemalloc.start()
+    started = time.perf_counter()
+    dispatcher._refill()
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    in_memory = len(dispatcher)
+    dispatcher.shutdown()
+    return elapsed, memory, in_memory
+
+
+def main():
+    sizes = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "10000,100000,1000000").split(",")]
+    init_schema()
+    print(f"{'N':>9} | {'APScheduler, с':>14} {'МБ':>8} | {'диспетчер, с':>12} {'МБ':>8} {'в памяти':>9}")
+    for count in sizes:
+        times = reminder_times(count)
+        aps_time, aps_memory = bench_apscheduler(times)
+        disp_time, disp_memory, in_memory = bench_dispatcher(times)
+        print(
+            f"{count:>9} | {aps_time:>14.2f} {aps_memory / 2**20:>8.1f} | "
+            f"{disp_time:>12.3f} {disp_memory / 2**20:>8.2f} {in_memory:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Задержка обработчиков (чтение списков и создание напоминаний) под нагрузкой: синхронные запросы к базе
+прямо в event loop против ограниченного пула потоков (repository).
+
+Обновления приходят с постоянной частотой независимо от обработки, задержка
+считается от момента прихода, поэтому учитывает и ожидание заблокированного loop.
+
+Сетевая задержка до базы (как у удаленного PostgreSQL) имитируется паузой
+перед каждым запросом.
+
+Запуск: python -m benchmarks.bench_handlers [обновлений/с] [всего обновлений] [RTT, мс]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from sqlalchemy import event
+
+from database import SessionLocal, Reminder, engine, init_schema
+import reminders
+import repository
+
+USERS = 200
+HEAVY_USER = 0
+HEAVY_SHARE = 0.1
+WRITE_SHARE = 0.3
+
+
+def fill_table():
+    db_session = SessionLocal()
+    try:
+        now = datetime.now() + timedelta(days=1)
+        rows = [{'user_id': HEAVY_USER, 'chat_id': 1, 'reminder_text': f'heavy {i}',
+                 'reminder_time': now + timedelta(minutes=i), 'is_sent': False} for i in range(2000)]
+        rows += [{'user_id': user_id, 'chat_id': 1, 'reminder_text': 'light',
+                  'reminder_time': now, 'is_sent': False} for user_id in range(1, USERS)]
+        db_session.bulk_insert_mappings(Reminder, rows)
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+async def handle_sync(user_id, write):
+    if write:
+        return reminders.create_reminder(user_id, 1, 'new', datetime.now() + timedelta(days=2))
+    return reminders.get_user_reminders(user_id)
+
+
+async def handle_async(user_id, write):
+    if write:
+        return await repository.create_reminder(user_id, 1, 'new', datetime.now() + timedelta(days=2))
+    return await repository.get_user_reminders(user_id)
+
+
+async def run(handler, rate, total):
+    latencies = []
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def update(arrival, user_id):
+        await handler(user_id, user_id != HEAVY_USER and random.random() < WRITE_SHARE)
+        if user_id != HEAVY_USER:
+            latencies.append(loop.time() - arrival)
+
+    tasks = []
+    for i in range(total):
+        arrival = started + i / rate
+        await asyncio.sleep(max(arrival - loop.time(), 0))
+        user_id = HEAVY_USER if random.random() < HEAVY_SHARE else random.randrange(1, USERS)
+        tasks.append(asyncio.create_task(update(arrival, user_id)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+    latencies.sort()
+    return {
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'rate': total / elapsed,
+    }
+
+
+def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 100
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rtt = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.002
+    init_schema()
+    # Напоминания создаются через групповой писатель; диспетчер и отправка не нужны
+    reminders.writer.start()
+    fill_table()
+    event.listen(engine, 'before_cursor_execute', lambda *args: time.sleep(rtt))
+    print(f"частота: {rate:.0f} обновлений/с, всего: {total}, RTT: {rtt * 1000:.0f} мс, доля тяжелых: {HEAVY_SHARE:.0%}, "
+          f"доля записей: {WRITE_SHARE:.0%}")
+    for label, handler in (('в event loop', handle_sync), ('через пул', handle_async)):
+        random.seed(1)
+        result = asyncio.run(run(handler, rate, total))
+        print(f"{label:>13}: p50 {result['p50']:.1f} мс, p99 {result['p99']:.1f} мс, "
+              f"{result['rate']:.0f} обновлений/с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Стоимость ответа на инлайн-запрос: прежняя сборка результатов против новой.
+
+Пользователи набирают текст по букве, поэтому одни и те же префиксы
+приходят снова и снова. Считаются процессорное время и выделенная память
+на один запрос (tracemalloc), без сетевого вызова answer().
+
+Запуск: python -m benchmarks.bench_inline [запросов]
+"""
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+from keyboards import get_inline_quick_reminders
+from timezones import get_zone
+import config
+import inline_handler
+
+PHRASES = ("купить хлеб завтра в 10", "позвонить маме через 2 часа", "отчет в пятницу в 18:00",
+           "take out trash tomorrow at 9am", "полить цветы")
+
+
+def legacy_results(query):
+    """Прежний handle_inline_query без вызова answer()"""
+    results = []
+    quick_reminders = [
+        {"title": "⏰ Напомнить через 1 час", "description": f"Напомнить: {query}", "time_data": "inline_1h"},
+        {"title": "⏰ Напомнить через 3 часа", "description": f"Напомнить: {query}", "time_data": "inline_3h"},
+        {"title": "✏️ Настроить время", "description": f"Установить свое время для: {query}",
+         "time_data": "inline_custom"},
+    ]
+    for reminder in quick_reminders:
+        results.append(
+            InlineQueryResultArticle(
+                id=str(uuid.uuid4()),
+                title=reminder["title"],
+                description=reminder["description"],
+                input_message_content=InputTextMessageContent(
+                    f"🔔 Напоминание: {query}\n\n"
+                    f"⏰ Время: {reminder['title'].replace('⏰ ', '').replace('✏️ ', '')}"
+                ),
+                reply_markup=get_inline_quick_reminders(inline_handler._text_key(query))
+            )
+        )
+    return results
+
+
+def keystrokes(count):
+    random.seed(1)
+    queries = []
+    while len(queries) < count:
+        phrase = random.choice(PHRASES)
+        queries.extend(phrase[:i] for i in range(1, len(phrase) + 1))
+    return queries[:count]
+
+
+def measure(build, queries):
+    tracemalloc.start()
+    started = time.process_time()
+    for query in queries:
+        build(query)
+    elapsed = time.process_time() - started
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size for stat in snapshot.statistics('filename'))
+    return elapsed / len(queries) * 1e6, allocated / len(queries), peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    queries = keystrokes(count)
+    now = datetime.now()
+    zone = get_zone(config.DEFAULT_TIMEZONE)
+    print(f"{'вариант':>8} | {'CPU, мкс/запрос':>15} {'удержано, Б/запрос':>18} {'пик, КБ':>8}")
+    for label, build in (('прежний', legacy_results),
+                         ('новый', lambda query: inline_handler.build_inline_results(query, zone, now))):
+        cpu, allocated, peak = measure(build, queries)
+        print(f"{label:>8} | {cpu:>15.1f} {allocated:>18.1f} {peak / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
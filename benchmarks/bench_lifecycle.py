@@ -0,0 +1,129 @@
+"""Холодный запуск и остановка по SIGTERM.
+
+Импорт модулей меряется в отдельных процессах: он не должен подключаться к
+базе, создавать ботов и запускать потоки. Затем бот запускается как в
+продакшене (``python -m bot``, polling) против фейкового Bot API:
+время до первого getUpdates — холодный запуск целиком, шаги берутся из лога
+Lifecycle. Затем бот запускается с уже наступившими напоминаниями и после
+первой отправки получает SIGTERM. С достаточным ``SHUTDOWN_DRAIN_SECONDS``
+очередь должна быть дослана до выхода. С коротким остаток досылает
+следующий запуск, когда истечет аренда, без дублей.
+
+Запуск: python -m benchmarks.bench_lifecycle [напоминаний]
+"""
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'lifecycle.db')}"
+)
+os.environ.setdefault("BOT_TOKEN", "123456:lifecycle")
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+MODULES = ("config", "database", "reminders", "repository", "bot", "app")
+LEASE_SECONDS = 3
+
+
+def import_time(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.01)
+
+
+def start_bot(api, drain_seconds):
+    env = dict(
+        os.environ, BOT_API_URL=api.base_url, SHUTDOWN_DRAIN_SECONDS=str(drain_seconds),
+        DISPATCH_LEASE_SECONDS=str(LEASE_SECONDS), DISPATCH_SWEEP_SECONDS="1",
+        OUTBOX_RETRY_BASE_SECONDS="1", OUTBOX_POLL_SECONDS="1",
+    )
+    polls = api.count("getUpdates")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bot"], env=env, stderr=subprocess.PIPE, text=True
+    )
+    wait_for(lambda: api.count("getUpdates") > polls)
+    return process, time.perf_counter() - started
+
+
+def stop_bot(process):
+    started = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    log = process.communicate(timeout=120)[1]
+    return time.perf_counter() - started, log
+
+
+def add_due_reminders(count, tag):
+    from database import SessionLocal, Reminder, init_schema
+    from timezones import utcnow
+
+    init_schema()
+    db_session = SessionLocal()
+    try:
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': i, 'chat_id': i, 'reminder_text': f'{tag} {i}', 'reminder_time': utcnow(), 'is_sent': False}
+            for i in range(count)
+        ])
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def sent_texts(api, tag):
+    with api._lock:
+        return Counter(
+            params.get("text", "").rsplit("\n", 1)[-1] for method, params in api.calls
+            if method == "sendMessage" and tag in params.get("text", "")
+        )
+
+
+def drain(api, count, drain_seconds, tag):
+    """Наступившие напоминания, запуск, SIGTERM после первой отправки"""
+    add_due_reminders(count, tag)
+    process, _ = start_bot(api, drain_seconds)
+    wait_for(lambda: sent_texts(api, tag))
+    stop_seconds, log = stop_bot(process)
+    return len(sent_texts(api, tag)), stop_seconds, log
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print("Импорт модуля в новом процессе:")
+    for module in MODULES:
+        print(f"{module:>12}: {import_time(module) * 1000:7.1f} мс")
+
+    api = FakeBotAPI(latency=0.02).start()
+    process, cold = start_bot(api, 30)
+    _, log = stop_bot(process)
+    steps = re.search(r"Бот запущен за .*", log)
+    print(f"Холодный запуск до первого getUpdates: {cold:.2f} с; {steps.group(0) if steps else ''}")
+
+    sent, stop_seconds, _ = drain(api, count, 30, 'full')
+    print(f"SIGTERM, дослать до 30 с: отправлено {sent} из {count}, остановка {stop_seconds:.2f} с")
+
+    sent, stop_seconds, _ = drain(api, count, 0.5, 'short')
+    print(f"SIGTERM, дослать до 0.5 с: отправлено {sent} из {count}, остановка {stop_seconds:.2f} с")
+    process, _ = start_bot(api, 30)
+    wait_for(lambda: len(sent_texts(api, 'short')) >= count, timeout=LEASE_SECONDS * 20)
+    stop_bot(process)
+    duplicates = sum(n - 1 for n in sent_texts(api, 'short').values())
+    print(f"После перезапуска: отправлено {len(sent_texts(api, 'short'))} из {count}, дублей {duplicates}")
+    api.stop()
+
+
+if __name__ == "__main__":
+    main()
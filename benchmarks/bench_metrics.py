@@ -0,0 +1,86 @@
+"""Накладные расходы метрик на горячем пути.
+
+Сравнивает обработчик и SQL-запрос с инструментированием и без, а также
+стоимость отдельных операций записи и выгрузки /metrics. Завершается с
+ошибкой, если запись метрики дороже бюджета.
+
+Запуск: python -m benchmarks.bench_metrics [итераций]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from sqlalchemy import create_engine, text
+
+import metrics
+
+# Бюджет на одну запись метрики, на обертку вокруг обработчика и на SQL-запрос
+# (большую часть последнего занимает сам механизм событий SQLAlchemy), микросекунды
+OPERATION_BUDGET_US = 5
+HANDLER_BUDGET_US = 10
+SQL_BUDGET_US = 30
+
+
+def per_call(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def handler(update, context):
+    return None
+
+
+async def per_await(callback, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await callback(None, None)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    counter = metrics.Counter('bench_total', 'bench')
+    histogram = metrics.Histogram('bench_seconds', 'bench', ['kind']).labels('x')
+
+    results = {
+        'Counter.inc': per_call(counter.inc, iterations),
+        'Histogram.observe': per_call(lambda: histogram.observe(0.003), iterations),
+    }
+    bare = asyncio.run(per_await(handler, iterations))
+    timed = asyncio.run(per_await(metrics.instrument_handler(handler), iterations))
+    results['обертка обработчика'] = timed - bare
+
+    plain = create_engine(os.environ["DATABASE_URL"])
+    instrumented = create_engine(os.environ["DATABASE_URL"])
+    metrics.instrument_engine(instrumented)
+    queries = iterations // 20
+    with plain.connect() as a, instrumented.connect() as b:
+        base = per_call(lambda: a.execute(text('SELECT 1')), queries)
+        results['SQL-запрос (доп.)'] = per_call(lambda: b.execute(text('SELECT 1')), queries) - base
+
+    results['выгрузка /metrics'] = per_call(metrics.render, 1000)
+
+    for name, cost in results.items():
+        print(f"{name:>22}: {cost:8.2f} мкс")
+
+    over = [name for name in ('Counter.inc', 'Histogram.observe') if results[name] > OPERATION_BUDGET_US]
+    if results['обертка обработчика'] > HANDLER_BUDGET_US:
+        over.append('обертка обработчика')
+    if results['SQL-запрос (доп.)'] > SQL_BUDGET_US:
+        over.append('SQL-запрос')
+    if over:
+        print(f"Превышен бюджет: {', '.join(over)}")
+        sys.exit(1)
+    print("В пределах бюджета")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Несколько процессов-воркеров разбирают общую таблицу reminders через аренду строк.
+
+Каждый воркер — настоящий путь отправки: :class:`ReminderDispatcher`
+подгружает окно и арендует наступившие напоминания, :class:`DeliveryPipeline`
+шлет их через свой token bucket, записывает исходы в outbox и помечает
+напоминания отправленными. Bot API подменен
+:class:`~benchmarks.fake_bot_api.RecordingRequest` с задержкой ответа.
+Напоминания наступают одновременно у всех воркеров, поэтому они
+соревнуются за одни и те же строки. По записанным sendMessage считаются
+дубли и пропуски для каждого числа воркеров.
+
+Запуск: python -m benchmarks.bench_multiworker [напоминаний] [воркеры через запятую] [лимит сообщ/с на воркер]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+# Пропущенное окном подбирает sweep; ждать его 30 с по умолчанию незачем
+os.environ.setdefault("DISPATCH_SWEEP_SECONDS", "1")
+os.environ.setdefault("OUTBOX_POLL_SECONDS", "1")
+
+API_LATENCY = 0.02
+# Напоминания наступают через столько секунд после старта воркеров
+LEAD_SECONDS = 2
+
+
+def unsent():
+    from sqlalchemy import func, select
+    from database import SessionLocal, Reminder
+
+    db_session = SessionLocal()
+    try:
+        return db_session.execute(select(func.count(Reminder.id)).where(Reminder.is_sent == False)).scalar()
+    finally:
+        db_session.close()
+
+
+def worker(owner, rate, queue, ready, go):
+    import logging
+
+    from telegram import Bot
+
+    from benchmarks.fake_bot_api import RecordingRequest
+    from delivery import DeliveryPipeline
+    from dispatcher import ReminderDispatcher
+
+    logging.basicConfig(level=logging.WARNING)
+    recorder = RecordingRequest(latency=API_LATENCY)
+    pipeline = DeliveryPipeline(
+        Bot("123:bench", request=recorder, get_updates_request=RecordingRequest()),
+        owner=owner, global_rate=rate, digest_window=0
+    )
+    dispatcher = ReminderDispatcher(pipeline.submit, owner=owner)
+    pipeline.start()
+    ready.release()
+    go.wait()
+    dispatcher.start()
+    # Напоминание помечается отправленным после записи исхода: когда
+    # неотправленных не осталось, все отправки всех воркеров завершены
+    while unsent():
+        time.sleep(0.05)
+    dispatcher.shutdown()
+    pipeline.stop()
+    queue.put([
+        params["text"].rsplit("\n", 1)[-1] for method, params in recorder.calls if method == "sendMessage"
+    ])
+
+
+def fill_table(count, due):
+    from database import SessionLocal, Reminder
+
+    db_session = SessionLocal()
+    try:
+        db_session.query(Reminder).delete()
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': i, 'chat_id': i, 'reminder_text': f'bench {i}', 'reminder_time': due, 'is_sent': False}
+            for i in range(count)
+        ])
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def run(count, workers, rate):
+    from database import init_schema
+    from timezones import utcnow
+
+    init_schema()
+    fill_table(0, None)
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    ready = context.Semaphore(0)
+    go = context.Event()
+    processes = [
+        context.Process(target=worker, args=(f"bench-{i}", rate, queue, ready, go))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # Время импорта и запуска процессов не учитываем
+    for _ in processes:
+        ready.acquire()
+    fill_table(count, utcnow() + timedelta(seconds=LEAD_SECONDS))
+    go.set()
+    started = time.perf_counter() + LEAD_SECONDS
+    sent = [text for _ in processes for text in queue.get()]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return sent, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    worker_counts = [int(n) for n in (sys.argv[2] if len(sys.argv) > 2 else "1,2,4,8").split(",")]
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 500
+    print(f"напоминаний: {count}, лимит: {rate:.0f} сообщ/с на воркер, задержка Bot API: {API_LATENCY * 1000:.0f} мс")
+    print(f"{'воркеров':>8} | {'отправлено':>10} {'дублей':>7} {'пропущено':>9} | {'сообщ/с':>8} {'ускорение':>9}")
+    baseline = None
+    for workers in worker_counts:
+        sent, elapsed = run(count, workers, rate)
+        duplicates = sum(n - 1 for n in Counter(sent).values() if n > 1)
+        missing = len({f'bench {i}' for i in range(count)} - set(sent))
+        rate_sent = len(sent) / elapsed
+        baseline = baseline or rate_sent
+        print(f"{workers:>8} | {len(sent):>10} {duplicates:>7} {missing:>9} | "
+              f"{rate_sent:>8.0f} {rate_sent / baseline:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
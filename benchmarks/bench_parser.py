@@ -0,0 +1,62 @@
+"""Микробенчмарк разбора времени: прежний parse_time_input против time_parser.
+
+Перед замером сверяет результаты на случайно сгенерированных фразах,
+которые понимал прежний парсер: новый должен давать то же время.
+
+Запуск: python -m benchmarks.bench_parser [итераций]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import time_parser
+from tests.reference_parser import old_parse_time_input, random_phrase
+
+
+def check_equivalence(samples=5000):
+    rng = random.Random(42)
+    now = datetime(2024, 3, 13, 14, 7, 30, 123)
+    mismatches = []
+    for _ in range(samples):
+        phrase = random_phrase(rng)
+        expected = old_parse_time_input(phrase, now)
+        actual = time_parser.parse(phrase, now)
+        if expected != actual:
+            mismatches.append((phrase, expected, actual))
+    return mismatches
+
+
+def measure(func, phrases, iterations):
+    now = datetime.now()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for phrase in phrases:
+            func(phrase, now)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for phrase in phrases:
+        func(phrase, now)
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed / (iterations * len(phrases)) * 1e6, allocated / len(phrases)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    mismatches = check_equivalence()
+    print(f"расхождений с прежним парсером: {len(mismatches)}")
+    for phrase, expected, actual in mismatches[:10]:
+        print(f"  {phrase!r}: было {expected}, стало {actual}")
+
+    phrases = ["Через 2 часа", "Завтра в 15:30", "25.12.2030 18:00", "Сегодня вечером", "привет"]
+    time_parser.parse(phrases[0])
+    for label, func in (('прежний', old_parse_time_input), ('time_parser', time_parser.parse)):
+        per_call, allocated = measure(func, phrases, iterations)
+        print(f"{label:>12}: {per_call:.2f} мкс/вызов, пик памяти {allocated:.0f} Б/вызов")
+
+
+if __name__ == "__main__":
+    main()
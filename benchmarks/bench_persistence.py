@@ -0,0 +1,175 @@
+"""Стоимость хранения состояния диалогов: без хранения, PicklePersistence и SQLPersistence.
+
+Виртуальные пользователи создают напоминания через диалог (как сценарий
+``create`` в loadtest), Application запущено и сохраняет состояние раз в
+``--interval`` секунд. В хранилище заранее лежит состояние ``--stored``
+неактивных пользователей: PicklePersistence перезаписывает его целиком при
+каждом изменении, SQLPersistence пишет только изменившиеся строки.
+
+Затем две реплики с общей базой обрабатывают шаги каждого диалога по
+очереди: без хранения в базе диалог на второй реплике обрывается.
+
+Запуск: python -m benchmarks.bench_persistence [--users 50] [--updates 3000] [--stored 20000]
+"""
+import argparse
+import asyncio
+import os
+import pickle
+import tempfile
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'persistence.db')}"
+)
+os.environ.setdefault("BOT_TOKEN", "123456:persistence")
+
+from sqlalchemy import insert
+from telegram.ext import Application, PicklePersistence
+
+from benchmarks.fake_bot_api import RecordingRequest
+from benchmarks.loadtest import LoadTest, percentile
+from bot import setup_handlers, WAITING_TIME
+from database import engine, init_schema, BotState
+import config
+import persistence
+import reminders
+
+
+class CountingPicklePersistence(PicklePersistence):
+    """PicklePersistence, считающий перезаписи файла"""
+
+    dumps = 0
+
+    def _dump_singlefile(self):
+        self.dumps += 1
+        super()._dump_singlefile()
+
+
+def seed_pickle(path, stored):
+    with open(path, 'wb') as output:
+        pickle.dump({
+            'user_data': {user_id: {'reminder_text': f'черновик {user_id}'} for user_id in range(stored)},
+            'chat_data': {}, 'bot_data': {}, 'callback_data': None,
+            'conversations': {'create_reminder': {(user_id, user_id): WAITING_TIME for user_id in range(stored)}},
+        }, output, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def seed_sql(stored):
+    version = time.time_ns()
+    with engine.begin() as conn:
+        conn.execute(insert(BotState), [
+            {'kind': persistence.USER, 'key': str(user_id),
+             'data': persistence._dumps({'reminder_text': f'черновик {user_id}'}), 'version': version}
+            for user_id in range(stored)
+        ] + [
+            {'kind': persistence.CONVERSATION + 'create_reminder', 'key': persistence._conversation_key((user_id, user_id)),
+             'data': str(WAITING_TIME), 'version': version}
+            for user_id in range(stored)
+        ])
+
+
+def build(recorder, store):
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .request(recorder)
+        .get_updates_request(RecordingRequest())
+        .updater(None)
+    )
+    if store is not None:
+        builder = builder.persistence(store)
+    application = builder.build()
+    setup_handlers(application)
+    return application
+
+
+async def run_mode(mode, args):
+    store = None
+    if mode == 'pickle':
+        path = os.path.join(tempfile.mkdtemp(), 'state.pickle')
+        seed_pickle(path, args.stored)
+        store = CountingPicklePersistence(path, update_interval=args.interval)
+    elif mode == 'sql':
+        store = persistence.SQLPersistence(update_interval=args.interval)
+
+    recorder = RecordingRequest()
+    application = build(recorder, store)
+    await application.initialize()
+    await application.start()
+    writes = persistence.STATE_WRITES.labels().value
+    load = LoadTest(application, recorder, {'create': 1})
+    elapsed = await load.run(args.users, args.updates)
+    await application.stop()
+    await application.shutdown()
+
+    if mode == 'pickle':
+        writes = f"{store.dumps} перезаписей файла по {os.path.getsize(path) // 1024} КБ"
+    elif mode == 'sql':
+        writes = f"{persistence.STATE_WRITES.labels().value - writes:.0f} строк"
+    else:
+        writes = '—'
+    latencies = sorted(load.latencies['create'])
+    return len(latencies), elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99), load.errors, writes
+
+
+async def alternate(args, use_sql):
+    """Шаги каждого диалога по очереди на двух репликах; возвращает число созданных напоминаний"""
+    recorders = [RecordingRequest(), RecordingRequest()]
+    replicas = [
+        build(recorder, persistence.SQLPersistence(update_interval=60) if use_sql else None)
+        for recorder in recorders
+    ]
+    for application in replicas:
+        await application.initialize()
+    loads = [LoadTest(application, recorder, {'create': 1}) for application, recorder in zip(replicas, recorders)]
+    steps = ("📅 Создать напоминание", "купить хлеб", "завтра в 10:00")
+    for user_id in range(500000, 500000 + args.users):
+        for step, text in enumerate(steps):
+            replica = step % 2
+            await loads[replica].message('create', user_id, text)
+            if use_sql:
+                # Между шагами пользователя проходит больше PERSISTENCE_UPDATE_INTERVAL
+                await replicas[replica].update_persistence()
+                await replicas[replica].persistence.flush()
+    for application in replicas:
+        await application.shutdown()
+    return sum(
+        1 for recorder in recorders for name, params in recorder.calls
+        if name == 'sendMessage' and params.get('text', '').startswith('✅')
+    )
+
+
+async def main_async(args):
+    seed_sql(args.stored)
+    print(f"Пользователей {args.users}, обновлений {args.updates}, в хранилище {args.stored} неактивных, "
+          f"запись раз в {args.interval} с")
+    print(f"{'хранение':>8} | {'обн./с':>7} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>6} | запись")
+    baseline = None
+    for mode in ('none', 'pickle', 'sql'):
+        count, elapsed, p50, p99, errors, writes = await run_mode(mode, args)
+        per_update = elapsed / count * 1e6
+        baseline = baseline or per_update
+        print(f"{mode:>8} | {count / elapsed:>7.0f} {p50:>8.2f} {p99:>8.2f} {errors:>6} | {writes}; "
+              f"+{per_update - baseline:.0f} мкс на обновление")
+
+    for use_sql, name in ((False, 'без хранения'), (True, 'SQLPersistence')):
+        created = await alternate(args, use_sql)
+        print(f"Две реплики по очереди, {name}: создано {created} из {args.users} напоминаний")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=3000)
+    parser.add_argument('--stored', type=int, default=20000, help="неактивных пользователей в хранилище")
+    parser.add_argument('--interval', type=float, default=0.2, help="период записи состояния, с")
+    args = parser.parse_args()
+
+    init_schema()
+    # Напоминания создаются через групповой писатель; диспетчер и отправка не нужны
+    reminders.writer.start()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Всплеск 09:00 на фоне живых пользователей: общий лимит Bot API с очередями и без.
+
+В 09:00 наступают ``--spike`` напоминаний, и пайплайн отправляет их через
+бота Application, как в lifecycle. В это же время ``--users``
+пользователей открывают «Мои напоминания» и листают список кнопкой —
+ответы обработчиков и ответы на нажатия. Все запросы делят лимит
+``BOT_API_RATE``; Bot API подменен :class:`RecordingRequest` с задержкой
+сети ``--latency``.
+
+* ``fifo`` — общий лимит одной очередью: ответ пользователю ждет уже
+  вставшие в очередь напоминания;
+* ``priority`` — :class:`bot_api.PriorityRateLimiter` с весами из config.
+
+Для сравнения тот же трафик пользователей меряется без всплеска.
+
+Запуск: python -m benchmarks.bench_priority [--spike 300] [--users 5] [--think 1]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'priority.db')}"
+)
+os.environ.setdefault("BOT_TOKEN", "123456:priority")
+
+from telegram.ext import Application
+
+from benchmarks.fake_bot_api import RecordingRequest
+from benchmarks.loadtest import LoadTest, percentile
+from bot import setup_handlers
+from database import SessionLocal, Reminder, init_schema
+from delivery import DeliveryPipeline
+from timezones import utcnow
+import bot_api
+import config
+
+CHATTER_USER = 1000
+
+
+class FifoRateLimiter(bot_api.PriorityRateLimiter):
+    """Тот же лимит, но все запросы в одной очереди"""
+
+    @staticmethod
+    def lane_of(endpoint, rate_limit_args):
+        return bot_api.BULK
+
+
+def seed(users):
+    """У каждого пользователя две страницы будущих напоминаний"""
+    later = utcnow() + timedelta(days=30)
+    db_session = SessionLocal()
+    try:
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': CHATTER_USER + user, 'chat_id': CHATTER_USER + user, 'reminder_text': f'дело {i}',
+             'reminder_time': later + timedelta(hours=i), 'is_sent': False}
+            for user in range(users) for i in range(15)
+        ])
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def due_reminders(count, tag):
+    now = utcnow()
+    db_session = SessionLocal()
+    try:
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': i, 'chat_id': i, 'reminder_text': f'{tag} {i}', 'reminder_time': now, 'is_sent': False}
+            for i in range(1, count + 1)
+        ])
+        db_session.commit()
+        return [reminder_id for reminder_id, in db_session.query(Reminder.id).filter(
+            Reminder.reminder_text.like(f'{tag} %')
+        )]
+    finally:
+        db_session.close()
+
+
+async def chatter(load, user_id, think, stop):
+    while not stop.is_set():
+        await load.message('ответ', user_id, "📋 Мои напоминания")
+        await load.callback('кнопка', user_id, 'list_next_1')
+        await asyncio.sleep(think)
+
+
+async def run_mode(mode, args):
+    recorder = RecordingRequest(latency=args.latency)
+    limiter = FifoRateLimiter() if mode == 'fifo' else bot_api.PriorityRateLimiter()
+    application = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .request(recorder)
+        .get_updates_request(RecordingRequest())
+        .rate_limiter(limiter)
+        .updater(None)
+        .build()
+    )
+    setup_handlers(application)
+    await application.initialize()
+    await application.start()
+    load = LoadTest(application, recorder, {})
+    pipeline = DeliveryPipeline(None)
+    await pipeline.start_async(application.bot)
+
+    stop = asyncio.Event()
+    users = [
+        asyncio.create_task(chatter(load, CHATTER_USER + user, args.think, stop))
+        for user in range(args.users)
+    ]
+    started = time.perf_counter()
+    spike = args.spike if mode != 'quiet' else 0
+    if spike:
+        pipeline.submit(await asyncio.to_thread(due_reminders, spike, mode))
+        while pipeline.sent + pipeline.failed < spike:
+            await asyncio.sleep(0.05)
+    else:
+        await asyncio.sleep(args.quiet)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*users)
+
+    await pipeline.stop_async()
+    await application.stop()
+    await application.shutdown()
+    result = {'elapsed': elapsed, 'sent': pipeline.sent}
+    for scenario in ('ответ', 'кнопка'):
+        latencies = sorted(load.latencies[scenario])
+        result[scenario] = (percentile(latencies, 0.5), percentile(latencies, 0.99), latencies[-1] * 1000)
+    return result
+
+
+async def main_async(args):
+    seed(args.users)
+    print(f"Всплеск {args.spike} напоминаний, {args.users} пользователей с паузой {args.think} с, "
+          f"лимит {config.BOT_API_RATE:.0f} запр/с, задержка сети {args.latency * 1000:.0f} мс")
+    print(f"{'режим':>8} | {'отправлено':>10} {'за, с':>6} | "
+          f"{'ответ p50/p99/max, мс':>22} | {'кнопка p50/p99/max, мс':>23}")
+    for mode in ('quiet', 'fifo', 'priority'):
+        result = await run_mode(mode, args)
+        print(f"{mode:>8} | {result['sent']:>10} {result['elapsed']:>6.1f} | "
+              + " | ".join(f"{'/'.join(f'{value:.0f}' for value in result[scenario]):>22}"
+                           for scenario in ('ответ', 'кнопка')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--spike', type=int, default=300)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--think', type=float, default=1, help="пауза пользователя между действиями, с")
+    parser.add_argument('--latency', type=float, default=0.03, help="задержка Bot API, с")
+    parser.add_argument('--quiet', type=float, default=5, help="длительность прогона без всплеска, с")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    init_schema()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Задержка основных запросов к reminders по мере роста таблицы, с индексами и без.
+
+Запуск: python -m benchmarks.bench_queries [100000,1000000,3000000]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from sqlalchemy import insert
+
+from database import Base, engine, ensure_indexes, init_schema, Reminder
+from dispatcher import ReminderDispatcher
+import reminders
+
+USERS = 10000
+CHUNK = 50000
+REPEAT = 50
+
+
+def grow(current, target):
+    now = datetime.now()
+    with engine.begin() as conn:
+        for start in range(current, target, CHUNK):
+            conn.execute(insert(Reminder), [
+                {'user_id': random.randrange(USERS), 'chat_id': 1, 'reminder_text': f'bench {i}',
+                 'reminder_time': now + timedelta(minutes=random.randrange(-43200, 43200)),
+                 'is_sent': random.random() < 0.7}
+                for i in range(start, min(start + CHUNK, target))
+            ])
+
+
+def measure(func):
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - started) / REPEAT * 1000
+
+
+def run_queries():
+    heavy_user = random.randrange(USERS)
+    dispatcher = ReminderDispatcher(lambda ids: None)
+    return {
+        'список': measure(lambda: reminders.get_user_reminders(heavy_user)),
+        # Сбрасываем кэш первой страницы, чтобы измерять сам запрос
+        'страница': measure(lambda: (reminders.user_reminders.clear(),
+                                     reminders.get_user_reminders_page(heavy_user, limit=10))),
+        'окно': measure(lambda: (setattr(dispatcher, '_horizon', None), dispatcher._refill())),
+    }
+
+
+def drop_indexes():
+    for index in Base.metadata.tables['reminders'].indexes:
+        index.drop(bind=engine)
+
+
+def main():
+    sizes = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "100000,1000000,3000000").split(",")]
+    init_schema()
+    print(f"{'строк':>9} | {'индексы':>8} | {'список, мс':>10} {'страница, мс':>12} {'окно, мс':>9}")
+    current = 0
+    for size in sizes:
+        grow(current, size)
+        current = size
+        for label in ('есть', 'нет'):
+            if label == 'нет':
+                drop_indexes()
+            result = run_queries()
+            print(f"{size:>9} | {label:>8} | {result['список']:>10.2f} "
+                  f"{result['страница']:>12.2f} {result['окно']:>9.2f}")
+        ensure_indexes(engine)
+
+
+if __name__ == "__main__":
+    main()
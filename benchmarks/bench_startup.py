@@ -0,0 +1,93 @@
+"""Время и пиковая память восстановления при запуске: прежняя загрузка всех
+неотправленных строк с заданием APScheduler на каждую против массового UPDATE
+просроченных и потоковой загрузки ближайшего окна.
+
+Запуск: python -m benchmarks.bench_startup [строк]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
+
+from database import SessionLocal, Reminder, init_schema
+from dispatcher import ReminderDispatcher
+import reminders
+
+
+def fill_table(count):
+    db_session = SessionLocal()
+    try:
+        db_session.query(Reminder).delete()
+        now = datetime.now()
+        step = timedelta(days=30) / count
+        # Половина — давно просроченные, половина — на месяц вперед
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': i, 'chat_id': i, 'reminder_text': 'bench', 'is_sent': False,
+             'reminder_time': now - timedelta(days=1) - step * i if i % 2 else now + step * i}
+            for i in range(count)
+        ])
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def old_recovery():
+    """Прежний load_unsent_reminders с заданием APScheduler на каждое напоминание"""
+    scheduler = BackgroundScheduler()
+    scheduler.start(paused=True)
+    db_session = SessionLocal()
+    try:
+        for reminder in db_session.query(Reminder).filter_by(is_sent=False).all():
+            if reminder.reminder_time > datetime.now():
+                scheduler.add_job(
+                    lambda reminder_id: None,
+                    trigger=DateTrigger(run_date=reminder.reminder_time),
+                    args=[reminder.id],
+                    id=f"reminder_{reminder.id}",
+                    replace_existing=True
+                )
+            else:
+                reminder.is_sent = True
+        db_session.commit()
+    finally:
+        db_session.close()
+    scheduler.shutdown(wait=False)
+
+
+def new_recovery():
+    reminders.load_unsent_reminders()
+    dispatcher = ReminderDispatcher(lambda ids: None)
+    dispatcher._refill()
+
+
+def measure(recovery):
+    tracemalloc.start()
+    started = time.perf_counter()
+    recovery()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    init_schema()
+    print(f"строк: {count} (половина просрочена)")
+    for label, recovery in (('прежнее', old_recovery), ('потоковое', new_recovery)):
+        fill_table(count)
+        elapsed, peak = measure(recovery)
+        print(f"{label:>10}: {elapsed:.2f} с, пик памяти {peak / 2**20:.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
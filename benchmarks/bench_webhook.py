@@ -0,0 +1,98 @@
+"""Пропускная способность webhook-приема: поток обновлений воспроизводится
+с возрастающей частотой через ASGI-приложение, ответы бота уходят в фейковый Bot API.
+
+Запуск: python -m benchmarks.bench_webhook ["" | файл.jsonl с обновлениями] [частоты через запятую]
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+api = FakeBotAPI().start()
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ["BOT_API_URL"] = api.base_url
+os.environ.setdefault("BOT_TOKEN", "123:bench")
+os.environ.setdefault("WEBHOOK_SECRET", "bench")
+# Меряем прием и обработку обновлений, а не лимит Bot API
+os.environ.setdefault("BOT_API_RATE", "0")
+
+import httpx
+
+import app as webhook_app
+import config
+
+DURATION = 5
+
+
+def synthetic_updates():
+    """Запись потока: команды, кнопки меню и просмотр списка"""
+    texts = ["/start", "/help", "📋 Мои напоминания", "/my_reminders", "привет"]
+    for update_id in itertools.count(1):
+        text = texts[update_id % len(texts)]
+        user = {"id": update_id % 500 + 1, "is_bot": False, "first_name": "U"}
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else []
+        yield {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text, "entities": entities,
+            "from": user, "chat": {"id": user["id"], "type": "private"},
+        }}
+
+
+def recorded_updates(path):
+    with open(path) as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    return itertools.cycle(updates)
+
+
+async def replay(client, updates, rate):
+    accepted = rejected = 0
+    sent_before = api.count("sendMessage")
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    total = int(rate * DURATION)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": config.WEBHOOK_SECRET}
+
+    async def post(update):
+        nonlocal accepted, rejected
+        response = await client.post("/webhook", json=update, headers=headers)
+        if response.status_code == 200:
+            accepted += 1
+        else:
+            rejected += 1
+
+    tasks = []
+    for i in range(total):
+        await asyncio.sleep(max(started + i / rate - loop.time(), 0))
+        tasks.append(asyncio.create_task(post(next(updates))))
+    await asyncio.gather(*tasks)
+    while not webhook_app.lifecycle.application.update_queue.empty():
+        await asyncio.sleep(0.05)
+    elapsed = loop.time() - started
+    processed = api.count("sendMessage") - sent_before
+    return accepted, rejected, processed / elapsed
+
+
+async def main():
+    updates = recorded_updates(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] else synthetic_updates()
+    rates = [int(r) for r in (sys.argv[2] if len(sys.argv) > 2 else "100,250,500,1000,2000").split(",")]
+    logging.disable(logging.WARNING)
+
+    async with webhook_app.lifespan(webhook_app.app):
+        transport = httpx.ASGITransport(app=webhook_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'частота':>8} | {'принято':>8} {'отклонено':>9} | {'обработано/с':>12}")
+            for rate in rates:
+                accepted, rejected, throughput = await replay(client, updates, rate)
+                print(f"{rate:>8} | {accepted:>8} {rejected:>9} | {throughput:>12.0f}")
+    api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
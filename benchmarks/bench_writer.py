@@ -0,0 +1,80 @@
+"""Вставка напоминаний при всплеске: коммит на каждую строку против групповой записи.
+
+Задачи asyncio одновременно создают напоминания, как обработчики во время
+всплеска нажатий. Прежний путь — сессия и коммит на каждую вставку в пуле
+потоков, новый — repository.create_reminder через ReminderWriter.
+
+Запуск: python -m benchmarks.bench_writer [вставок на уровень] [уровни через запятую]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+
+from database import SessionLocal, Reminder, init_schema
+import reminders
+import repository
+
+
+def old_create_reminder(user_id, chat_id, text, time):
+    """Прежний reminders.create_reminder: отдельная транзакция на строку"""
+    db_session = SessionLocal()
+    try:
+        reminder = Reminder(user_id=user_id, chat_id=chat_id, reminder_text=text, reminder_time=time)
+        db_session.add(reminder)
+        db_session.commit()
+        reminders.schedule_reminder(reminder.id, time)
+        return reminder.id
+    except Exception:
+        db_session.rollback()
+        return None
+    finally:
+        db_session.close()
+
+
+async def old_path(user_id, when):
+    return await repository.run_db(old_create_reminder, user_id, user_id, 'burst', when)
+
+
+async def new_path(user_id, when):
+    return await repository.create_reminder(user_id, user_id, 'burst', when)
+
+
+async def run(create, concurrency, total):
+    when = datetime.now() + timedelta(days=1)
+    counter = iter(range(total))
+    ids = []
+
+    async def worker():
+        for i in counter:
+            ids.append(await create(i, when))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    failed = sum(reminder_id is None for reminder_id in ids)
+    return total / elapsed, failed, len(set(ids) - {None})
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    levels = [int(n) for n in (sys.argv[2] if len(sys.argv) > 2 else "1,10,100").split(",")]
+    init_schema()
+    reminders.writer.start()
+
+    print(f"{'параллельно':>11} | {'прежний, вст/с':>14} {'ошибок':>6} | {'групповой, вст/с':>16} {'ошибок':>6}")
+    for concurrency in levels:
+        old_rate, old_failed, _ = asyncio.run(run(old_path, concurrency, total))
+        new_rate, new_failed, unique = asyncio.run(run(new_path, concurrency, total))
+        assert unique == total - new_failed, "id повторяются"
+        print(f"{concurrency:>11} | {old_rate:>14.0f} {old_failed:>6} | {new_rate:>16.0f} {new_failed:>6}")
+
+
+if __name__ == "__main__":
+    main()
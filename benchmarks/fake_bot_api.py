@@ -0,0 +1,158 @@
+"""Локальный фейковый Bot API для бенчмарков.
+
+:class:`FakeBotAPI` — HTTP-сервер, отвечающий на любой метод успешным ответом,
+по желанию с задержкой и долей ответов 429 (flood control).
+:class:`RecordingRequest` — то же без сети: подставляется в Bot вместо
+HTTPXRequest и записывает исходящие вызовы.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0, flood_ratio=0.0, retry_after=1):
+        self.latency = latency
+        self.flood_ratio = flood_ratio
+        self.retry_after = retry_after
+        self.calls = []
+        # Принятые TCP-соединения: по ним видно, переиспользует ли клиент пул
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, method):
+        with self._lock:
+            return sum(1 for name, _ in self.calls if name == method)
+
+    def _response(self, method, params):
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method == "getUpdates":
+            # Длинный опрос без обновлений; держим недолго, чтобы остановка была быстрой
+            with self._lock:
+                self.calls.append((method, params))
+            time.sleep(min(float(params.get("timeout") or 0), 0.5))
+            return 200, {"ok": True, "result": []}
+        if method in ("setWebhook", "deleteWebhook"):
+            return 200, {"ok": True, "result": True}
+        if method == "sendMessage" and self.flood_ratio and random.random() < self.flood_ratio:
+            return 429, {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        with self._lock:
+            self.calls.append((method, params))
+        chat_id = int(params.get("chat_id", 1) or 1)
+        return 200, {"ok": True, "result": {
+            "message_id": len(self.calls), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }}
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with api._lock:
+                    api.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    params = json.loads(body) if body else {}
+                except ValueError:
+                    # HTTPXRequest шлет параметры формой
+                    params = dict(parse_qsl(body.decode()))
+                if api.latency:
+                    time.sleep(api.latency)
+                status, payload = api._response(self.path.rsplit("/", 1)[-1], params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class RecordingRequest(BaseRequest):
+    """Транспорт Bot API в памяти: записывает вызовы и сразу отвечает успехом"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def count(self, method):
+        return sum(1 for name, _ in self.calls if name == method)
+
+    def last(self, method, chat_id=None):
+        """Параметры последнего вызова метода (для чата ``chat_id``)"""
+        for name, params in reversed(self.calls):
+            if name == method and (chat_id is None or params.get("chat_id") == chat_id):
+                return params
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 1) or 1)
+            result = {
+                "message_id": params.get("message_id", self._message_id), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+            }
+            markup = params.get("reply_markup")
+            if isinstance(markup, dict) and "inline_keyboard" in markup:
+                result["reply_markup"] = markup
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
@@ -0,0 +1,304 @@
+"""Синтетическая нагрузка на бота без Telegram.
+
+Обновления собираются как настоящие JSON-обновления Bot API и подаются прямо
+в Application, настроенный через ``bot.setup_handlers``; исходящие вызовы
+записывает :class:`~benchmarks.fake_bot_api.RecordingRequest`. Виртуальные
+пользователи выполняют сценарии по заданной смеси:
+
+* ``create`` — диалог создания напоминания (кнопка, текст, время);
+* ``list`` — «Мои напоминания» и листание вперед;
+* ``callback`` — удаление напоминания кнопкой со страницы списка;
+* ``inline`` — инлайн-запрос, набираемый по буквам.
+
+После обработчиков через путь отправки (``DeliveryPipeline``) проходят
+``--deliver`` наступивших напоминаний. Прогон можно профилировать:
+``--profile cprofile`` сохраняет .prof (snakeviz, flameprof),
+``--profile sample`` — семплы стеков всех потоков в folded-формате для
+flamegraph.pl и speedscope.
+
+Запуск: python -m benchmarks.loadtest --users 50 --updates 5000 \\
+        --mix create=3,list=3,callback=1,inline=3 --profile sample --out load.folded
+"""
+import argparse
+import asyncio
+import cProfile
+import itertools
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load.db')}"
+)
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+# Ожидание следующей буквы измеряло бы сон, а не работу обработчика
+os.environ.setdefault("INLINE_DEBOUNCE_SECONDS", "0")
+
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from benchmarks.fake_bot_api import RecordingRequest
+from bot import setup_handlers
+from database import SessionLocal, Reminder, init_schema
+from delivery import DeliveryPipeline
+from timezones import utcnow
+import config
+import reminders
+
+TEXTS = ("купить хлеб", "позвонить маме", "отчет по проекту", "полить цветы", "take out the trash")
+TIMES = ("через 2 часа", "завтра в 10:00", "в пятницу в 18:00", "25.12 в 9:30",
+         "tomorrow at 9am", "каждый день в 9:00")
+
+
+class SamplingProfiler:
+    """Периодически снимает стеки всех потоков и считает одинаковые.
+
+    Простаивающие потоки (ожидание в пуле, select event loop) пропускаются.
+    """
+
+    IDLE = ('wait', 'select', 'poll', '_worker')
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or frame.f_code.co_name in self.IDLE:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write_folded(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+class LoadTest:
+    def __init__(self, application, recorder, mix, seed=1):
+        self.application = application
+        self.recorder = recorder
+        self.scenarios = list(mix)
+        self.weights = list(mix.values())
+        self.random = random.Random(seed)
+        self.latencies = defaultdict(list)
+        self.errors = 0
+        self._update_ids = itertools.count(1)
+        self._remaining = 0
+        application.add_error_handler(self._on_error)
+
+    async def _on_error(self, update, context):
+        self.errors += 1
+
+    async def process(self, scenario, payload):
+        update = Update.de_json({'update_id': next(self._update_ids), **payload}, self.application.bot)
+        started = time.perf_counter()
+        await self.application.process_update(update)
+        self.latencies[scenario].append(time.perf_counter() - started)
+        self._remaining -= 1
+
+    @staticmethod
+    def _user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+    def _message(self, user_id, text, message_id=None):
+        return {
+            'message_id': message_id or next(self._update_ids), 'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'}, 'from': self._user(user_id), 'text': text,
+        }
+
+    async def message(self, scenario, user_id, text):
+        await self.process(scenario, {'message': self._message(user_id, text)})
+
+    async def callback(self, scenario, user_id, data):
+        await self.process(scenario, {'callback_query': {
+            'id': str(next(self._update_ids)), 'from': self._user(user_id), 'chat_instance': str(user_id),
+            'data': data, 'message': self._message(user_id, '📋 Ваши напоминания', message_id=1),
+        }})
+
+    def _last_buttons(self, user_id, prefix):
+        params = self.recorder.last('sendMessage', user_id)
+        markup = (params or {}).get('reply_markup') or {}
+        return [button['callback_data'] for row in markup.get('inline_keyboard', ())
+                for button in row if button.get('callback_data', '').startswith(prefix)]
+
+    # --- Сценарии ---
+
+    async def create(self, user_id):
+        await self.message('create', user_id, "📅 Создать напоминание")
+        await self.message('create', user_id, self.random.choice(TEXTS))
+        await self.message('create', user_id, self.random.choice(TIMES))
+
+    async def list(self, user_id):
+        await self.message('list', user_id, "📋 Мои напоминания")
+        for data in self._last_buttons(user_id, 'list_next_')[:1]:
+            await self.callback('list', user_id, data)
+
+    async def callback_delete(self, user_id):
+        await self.message('callback', user_id, "📋 Мои напоминания")
+        buttons = self._last_buttons(user_id, 'list_del_')
+        if buttons:
+            await self.callback('callback', user_id, self.random.choice(buttons))
+
+    async def inline(self, user_id):
+        phrase = f"{self.random.choice(TEXTS)} {self.random.choice(TIMES)}"
+        for end in range(3, len(phrase) + 1, 3):
+            await self.process('inline', {'inline_query': {
+                'id': str(next(self._update_ids)), 'from': self._user(user_id), 'query': phrase[:end], 'offset': '',
+            }})
+
+    async def _user_loop(self, user_id):
+        actions = {'create': self.create, 'list': self.list, 'callback': self.callback_delete, 'inline': self.inline}
+        while self._remaining > 0:
+            scenario = self.random.choices(self.scenarios, self.weights)[0]
+            await actions[scenario](user_id)
+
+    async def run(self, users, updates):
+        self._remaining = updates
+        started = time.perf_counter()
+        await asyncio.gather(*(self._user_loop(1000 + user) for user in range(users)))
+        return time.perf_counter() - started
+
+
+async def deliver(count, users):
+    """Прогоняет ``count`` наступивших напоминаний через пайплайн отправки"""
+    now = utcnow()
+    db_session = SessionLocal()
+    try:
+        db_session.bulk_insert_mappings(Reminder, [
+            {'user_id': 1000 + i % users, 'chat_id': 1000 + i % users, 'reminder_text': f'load {i}',
+             'reminder_time': now - timedelta(seconds=1), 'is_sent': False}
+            for i in range(count)
+        ])
+        db_session.commit()
+        ids = [reminder_id for reminder_id, in db_session.query(Reminder.id).filter(
+            Reminder.reminder_text.like('load %'), Reminder.is_sent == False
+        )]
+    finally:
+        db_session.close()
+
+    recorder = RecordingRequest()
+    bot = Bot(config.BOT_TOKEN, request=recorder, get_updates_request=RecordingRequest())
+    # Лимиты Telegram не проверяем: меряем собственную стоимость отправки
+    pipeline = DeliveryPipeline(bot, global_rate=10 ** 6, chat_rate=10 ** 6)
+    await bot.initialize()
+    started = time.perf_counter()
+    # Пайплайн не запускается: его пачки выполняются прямо здесь, чтобы
+    # профилировщик видел путь отправки целиком
+    for start in range(0, len(ids), pipeline.batch_size):
+        await pipeline._deliver(ids[start:start + pipeline.batch_size])
+    elapsed = time.perf_counter() - started
+    await bot.shutdown()
+    return recorder.count('sendMessage'), elapsed
+
+
+def percentile(values, share):
+    return values[min(int(len(values) * share), len(values) - 1)] * 1000 if values else 0.0
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('create', 'list', 'callback', 'inline'):
+            raise argparse.ArgumentTypeError(f"Неизвестный сценарий: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def main_async(args):
+    recorder = RecordingRequest(latency=args.api_latency / 1000)
+    application = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .request(recorder)
+        .get_updates_request(RecordingRequest())
+        .updater(None)
+        .build()
+    )
+    setup_handlers(application)
+    await application.initialize()
+
+    load = LoadTest(application, recorder, args.mix, args.seed)
+    elapsed = await load.run(args.users, args.updates)
+    sent, delivery_elapsed = await deliver(args.deliver, args.users) if args.deliver else (0, 0.0)
+    await application.shutdown()
+    return load, recorder, elapsed, sent, delivery_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=50, help="виртуальных пользователей одновременно")
+    parser.add_argument('--updates', type=int, default=5000, help="всего обновлений")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('create=3,list=3,callback=1,inline=3'))
+    parser.add_argument('--deliver', type=int, default=1000, help="напоминаний через путь отправки")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="задержка Bot API, мс")
+    parser.add_argument('--profile', choices=('none', 'cprofile', 'sample'), default='none')
+    parser.add_argument('--interval', type=float, default=0.005, help="период семплирования, с")
+    parser.add_argument('--out', help="файл профиля (.prof или .folded)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    init_schema()
+    # Напоминания создаются через групповой писатель; диспетчер и отправка не нужны
+    reminders.writer.start()
+
+    profiler = None
+    if args.profile == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif args.profile == 'sample':
+        profiler = SamplingProfiler(args.interval)
+        profiler.start()
+
+    load, recorder, elapsed, sent, delivery_elapsed = asyncio.run(main_async(args))
+
+    if args.profile == 'cprofile':
+        profiler.disable()
+        out = args.out or 'loadtest.prof'
+        profiler.dump_stats(out)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        print(f"Профиль cProfile: {out}")
+    elif args.profile == 'sample':
+        profiler.stop()
+        out = args.out or 'loadtest.folded'
+        profiler.write_folded(out)
+        print(f"Семплы стеков ({sum(profiler.stacks.values())}): {out}")
+
+    total = sum(len(values) for values in load.latencies.values())
+    print(f"Обновлений: {total} за {elapsed:.2f} с ({total / elapsed:.0f}/с), ошибок: {load.errors}")
+    print(f"{'сценарий':>9} | {'обновл.':>7} {'p50, мс':>8} {'p95, мс':>8} {'p99, мс':>8}")
+    for scenario, values in sorted(load.latencies.items()):
+        values.sort()
+        print(f"{scenario:>9} | {len(values):>7} {percentile(values, 0.5):>8.2f} "
+              f"{percentile(values, 0.95):>8.2f} {percentile(values, 0.99):>8.2f}")
+    calls = Counter(name for name, _ in recorder.calls)
+    print("Вызовы Bot API: " + ", ".join(f"{name} {count}" for name, count in calls.most_common()))
+    if sent:
+        print(f"Отправка: {sent} напоминаний за {delivery_elapsed:.2f} с ({sent / delivery_elapsed:.0f}/с)")
+
+
+if __name__ == "__main__":
+    main()
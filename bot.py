@@ -1,15 +1,33 @@
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ConversationHandler, InlineQueryHandler
+from datetime import datetime, timedelta
+
+from telegram import InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
+from telegram.ext import CommandHandler, MessageHandler, filters, CallbackQueryHandler, ConversationHandler, InlineQueryHandler, TypeHandler
 import config
-from reminders import create_reminder, get_user_reminders, delete_reminder, delete_all_user_reminders, calculate_time_from_text
-from keyboards import get_main_keyboard, get_quick_time_keyboard, get_cancel_keyboard, remove_keyboard, get_reminder_actions_keyboard
+from reminders import calculate_time_from_text
+from repository import create_reminder, get_user_reminders_page, delete_reminder, complete_reminder, delete_all_user_reminders, get_user_zone, set_user_zone
+from keyboards import get_main_keyboard, get_quick_time_keyboard, get_cancel_keyboard, remove_keyboard, get_reminder_actions_keyboard, get_reminders_page_keyboard, is_digest_keyboard
 from inline_handler import handle_inline_query, handle_inline_callback
-from datetime import datetime, timedelta
-import re
+from lifecycle import Lifecycle
+import metrics
+from persistence import SQLPersistence, SyncedConversationHandler
+import recurrence
+import time_parser
+from timezones import local_now, resolve_zone_name, to_local, to_utc
 
 # Состояния для ConversationHandler
 WAITING_TEXT, WAITING_TIME = range(2)
 
+# Курсор страницы в callback_data: микросекунды от эпохи и id напоминания
+CURSOR_EPOCH = datetime(1970, 1, 1)
+# Длина текста напоминания в списке: страница целиком укладывается в 4096 символов
+# даже если экранирование Markdown удвоит текст (REMINDERS_PAGE_SIZE не больше 30)
+LIST_ITEM_TEXT_LIMIT = max(min(200, (3600 // config.REMINDERS_PAGE_SIZE - 60) // 2), 1)
+# Курсор первой страницы в кнопках удаления: перед ней листать некуда
+FIRST_PAGE = 'first'
+
+
 # Обработка неизвестных команд
 UNKNOWN_COMMAND_RESPONSE = """
 🤖 Я бот-напоминалка! Вот что я умею:
@@ -19,6 +37,7 @@ UNKNOWN_COMMAND_RESPONSE = """
 /help - Помощь
 /remind - Создать напоминание
 /my_reminders - Мои напоминания
+/timezone - Часовой пояс
 
 *Быстрые действия через меню:*
 📅 Создать напоминание
@@ -72,9 +91,13 @@ async def help_command(update: Update, context):
     • Завтра в 15:30
     • 25.12.2023 18:00
     • Сегодня вечером
+    • В пятницу в 18:00
+    • Tomorrow at 9am
+    • Каждый день в 9:00, по будням в 8:00
 
     *Быстрые команды:*
     /my_reminders - показать все напоминания
+    /timezone - ваш часовой пояс (например, `/timezone Europe/Moscow` или `/timezone UTC+3`)
     /cancel - отменить текущее действие
 
     *Инлайн-режим:*
@@ -136,29 +159,100 @@ async def button_handler(update: Update, context):
         )
         return ConversationHandler.END
 
+def encode_cursor(cursor):
+    reminder_time, reminder_id = cursor
+    return f"{(reminder_time - CURSOR_EPOCH) // timedelta(microseconds=1)}_{reminder_id}"
+
+def decode_cursor(data):
+    micros, reminder_id = data.split('_')
+    return CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(reminder_id)
+
+async def render_reminders_page(user_id, after=None, before=None):
+    """Текст и кнопки одной страницы напоминаний или (None, None), если их нет"""
+    reminders, prev_cursor, next_cursor = await get_user_reminders_page(user_id, after, before)
+    if not reminders:
+        return None, None
+    zone = await get_user_zone(user_id)
+
+    lines = ["📋 *Ваши напоминания:*"]
+    for number, reminder in enumerate(reminders, 1):
+        text = reminder.reminder_text
+        if len(text) > LIST_ITEM_TEXT_LIMIT:
+            text = text[:LIST_ITEM_TEXT_LIMIT - 1] + "…"
+        time_str = to_local(reminder.reminder_time, zone).strftime('%d.%m.%Y %H:%M')
+        if reminder.recurrence:
+            # Для повторяющихся показываем ближайшее срабатывание
+            time_str += f" 🔁 {recurrence.describe(reminder.recurrence)}"
+        lines.append(f"{number}. {escape_markdown(text)}\n   ⏰ {time_str}")
+
+    keyboard = get_reminders_page_keyboard(
+        reminders,
+        encode_cursor((reminders[0].reminder_time, reminders[0].id)) if prev_cursor else FIRST_PAGE,
+        encode_cursor(prev_cursor) if prev_cursor else None,
+        encode_cursor(next_cursor) if next_cursor else None
+    )
+    return "\n\n".join(lines), keyboard
+
 async def show_user_reminders(update: Update, context):
-    """Показывает напоминания пользователя"""
+    """Показывает первую страницу напоминаний пользователя"""
     user_id = update.effective_user.id
-    reminders = get_user_reminders(user_id)
+    text, keyboard = await render_reminders_page(user_id)
     
-    if not reminders:
+    if not text:
         await update.message.reply_text(
             "📭 У вас нет активных напоминаний",
             reply_markup=get_main_keyboard()
         )
         return
     
-    text = "📋 *Ваши напоминания:*\n\n"
-    for reminder in reminders:
-        time_str = reminder.reminder_time.strftime('%d.%m.%Y %H:%M')
-        text += f"• {reminder.reminder_text}\n  ⏰ {time_str}\n\n"
-    
-    await update.message.reply_text(text, parse_mode='Markdown')
+    await update.message.reply_text(text, reply_markup=keyboard, parse_mode='Markdown')
+
+async def handle_reminders_page_callback(query, data):
+    """Листание и удаление на странице «Мои напоминания»"""
+    user_id = query.from_user.id
+    action, _, payload = data[len('list_'):].partition('_')
+    deleted = True
+
+    if action == 'next':
+        text, keyboard = await render_reminders_page(user_id, after=decode_cursor(payload))
+    elif action == 'prev':
+        text, keyboard = await render_reminders_page(user_id, before=decode_cursor(payload))
+    else:
+        reminder_id, _, page = payload.partition('_')
+        if not reminder_id.isdigit():
+            return
+        deleted = await delete_reminder(int(reminder_id), user_id)
+        if page == FIRST_PAGE:
+            text, keyboard = await render_reminders_page(user_id)
+        else:
+            # Перерисовываем текущую страницу начиная с ее первого напоминания
+            first_time, first_id = decode_cursor(page)
+            text, keyboard = await render_reminders_page(user_id, after=(first_time, first_id - 1))
+            if not text:
+                # Удалили последнее напоминание на странице: показываем предыдущую
+                text, keyboard = await render_reminders_page(user_id, before=(first_time, first_id))
+        if text and not deleted:
+            text = "❌ Напоминание не найдено\n\n" + text
+
+    if not text and action == 'prev':
+        # Более ранние напоминания удалены: возвращаемся к первой странице
+        text, keyboard = await render_reminders_page(user_id)
+    if not text:
+        await query.edit_message_text(
+            "📭 У вас нет активных напоминаний" if deleted else "❌ Напоминание не найдено"
+        )
+        return
+    try:
+        await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
+    except BadRequest as e:
+        # Страница не изменилась (например, повторное нажатие)
+        if 'not modified' not in str(e):
+            raise
 
 async def delete_all_reminders(update: Update, context):
     """Удаляет все напоминания пользователя"""
     user_id = update.effective_user.id
-    count = delete_all_user_reminders(user_id)
+    count = await delete_all_user_reminders(user_id)
     
     await update.message.reply_text(
         f"✅ Удалено {count} напоминаний",
@@ -178,7 +272,8 @@ async def receive_reminder_text(update: Update, context):
             "• Через 2 часа\n"
             "• Завтра в 15:30\n" 
             "• 25.12.2023 18:00\n"
-            "• Сегодня вечером",
+            "• Сегодня вечером\n"
+            "• Каждый день в 9:00",
             reply_markup=get_cancel_keyboard()
         )
         return WAITING_TIME
@@ -189,12 +284,13 @@ async def create_quick_reminder(update: Update, context):
     chat_id = update.message.chat_id
     reminder_text = context.user_data['reminder_text']
     
-    # Время уже выбрано через кнопку
+    # Время уже выбрано через кнопку и считается в поясе пользователя
     time_text = context.user_data.get('quick_time')
-    reminder_time = calculate_time_from_text(time_text)
+    zone = await get_user_zone(user_id)
+    reminder_time = calculate_time_from_text(time_text, local_now(zone))
     
     if reminder_time:
-        reminder_id = create_reminder(user_id, chat_id, reminder_text, reminder_time)
+        reminder_id = await create_reminder(user_id, chat_id, reminder_text, to_utc(reminder_time, zone))
         
         if reminder_id:
             await update.message.reply_text(
@@ -226,27 +322,37 @@ async def receive_reminder_time(update: Update, context):
     chat_id = update.message.chat_id
     reminder_text = context.user_data['reminder_text']
     
-    # Парсим время
-    reminder_time = parse_time_input(time_text)
+    # Парсим время в поясе пользователя: сначала повторяющееся
+    # («каждый день в 9:00»), затем разовое
+    zone = await get_user_zone(user_id)
+    now = local_now(zone)
+    rule = None
+    parsed = time_parser.parse_recurrence(time_text, now)
+    if parsed:
+        reminder_time, rule = parsed
+    else:
+        reminder_time = parse_time_input(time_text, now)
     
     if not reminder_time:
         await update.message.reply_text(
             "❌ Не могу распознать время. Попробуйте еще раз:\n"
             "• Через 2 часа\n"
             "• Завтра в 15:30\n"
-            "• 25.12.2023 18:00",
+            "• 25.12.2023 18:00\n"
+            "• Каждый день в 9:00",
             reply_markup=get_cancel_keyboard()
         )
         return WAITING_TIME
     
-    # Создаем напоминание
-    reminder_id = create_reminder(user_id, chat_id, reminder_text, reminder_time)
+    # Создаем напоминание; в базе время хранится в UTC
+    reminder_id = await create_reminder(user_id, chat_id, reminder_text, to_utc(reminder_time, zone), rule)
     
     if reminder_id:
+        repeat_str = f"\n🔁 *Повтор:* {recurrence.describe(rule)}" if rule else ""
         await update.message.reply_text(
             f"✅ Напоминание создано!\n\n"
             f"📝 *Текст:* {reminder_text}\n"
-            f"⏰ *Время:* {reminder_time.strftime('%d.%m.%Y %H:%M')}",
+            f"⏰ *Время:* {reminder_time.strftime('%d.%m.%Y %H:%M')}{repeat_str}",
             parse_mode='Markdown',
             reply_markup=get_main_keyboard()
         )
@@ -259,68 +365,90 @@ async def receive_reminder_time(update: Update, context):
     context.user_data.clear()
     return ConversationHandler.END
 
-def parse_time_input(time_text):
+def parse_time_input(time_text, now=None):
     """Парсит текстовый ввод времени"""
-    now = datetime.now()
-    
-    # Через X часов/минут
-    match = re.search(r'через\s+(\d+)\s*(час|часа|часов|ч|минут|минуты|мин)', time_text.lower())
-    if match:
-        value = int(match.group(1))
-        unit = match.group(2)
-        
-        if unit in ['час', 'часа', 'часов', 'ч']:
-            return now + timedelta(hours=value)
-        else:
-            return now + timedelta(minutes=value)
-    
-    # Завтра в X:Y
-    match = re.search(r'завтра\s+в\s+(\d+):(\d+)', time_text.lower())
-    if match:
-        hour, minute = int(match.group(1)), int(match.group(2))
-        tomorrow = now + timedelta(days=1)
-        return tomorrow.replace(hour=hour, minute=minute, second=0, microsecond=0)
-    
-    # Дата и время (DD.MM.YYYY HH:MM)
-    match = re.search(r'(\d{1,2})\.(\d{1,2})\.(\d{4})\s+(\d{1,2}):(\d{2})', time_text)
-    if match:
-        day, month, year, hour, minute = map(int, match.groups())
-        return datetime(year, month, day, hour, minute)
-    
-    # Сегодня вечером/утром
-    if "сегодня вечером" in time_text.lower():
-        return now.replace(hour=19, minute=0, second=0, microsecond=0)
-    elif "сегодня утром" in time_text.lower():
-        return now.replace(hour=9, minute=0, second=0, microsecond=0)
-    elif "завтра утром" in time_text.lower():
-        return (now + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
-    
-    return None
+    return time_parser.parse(time_text, now)
+
+async def timezone_command(update: Update, context):
+    """Показывает или меняет часовой пояс пользователя: /timezone Europe/Moscow"""
+    user_id = update.effective_user.id
+    if not context.args:
+        zone = await get_user_zone(user_id)
+        await update.message.reply_text(
+            f"🌍 Ваш часовой пояс: *{escape_markdown(zone.key)}*, сейчас {local_now(zone).strftime('%d.%m.%Y %H:%M')}\n\n"
+            "Чтобы сменить, отправьте `/timezone Europe/Moscow` или `/timezone UTC+3`",
+            parse_mode='Markdown'
+        )
+        return
+
+    name = resolve_zone_name(' '.join(context.args))
+    if name is None:
+        await update.message.reply_text(
+            "❌ Не знаю такой часовой пояс. Примеры: `Europe/Moscow`, `Asia/Yekaterinburg`, `UTC+3`",
+            parse_mode='Markdown'
+        )
+        return
+
+    if await set_user_zone(user_id, name):
+        zone = await get_user_zone(user_id)
+        await update.message.reply_text(
+            f"✅ Часовой пояс: *{escape_markdown(name)}*, сейчас {local_now(zone).strftime('%d.%m.%Y %H:%M')}\n"
+            "Новые напоминания будут считаться в этом поясе",
+            parse_mode='Markdown'
+        )
+    else:
+        await update.message.reply_text("❌ Не удалось сохранить часовой пояс")
+
+async def show_reminder_action(query, text, failed=False):
+    """Итог нажатия ✅/❌ под напоминанием.
+
+    Сообщение с одним напоминанием заменяется итогом. В сводке остальные
+    напоминания остаются: убирается только строка кнопок нажатого, а об
+    ошибке сообщается отдельным сообщением.
+    """
+    reply_markup = query.message.reply_markup if query.message else None
+    if not is_digest_keyboard(reply_markup):
+        await query.edit_message_text(text)
+    elif failed:
+        await query.message.reply_text(text)
+    else:
+        rows = [row for row in reply_markup.inline_keyboard
+                if all(button.callback_data != query.data for button in row)]
+        await query.edit_message_reply_markup(InlineKeyboardMarkup(rows) if rows else None)
 
 async def handle_callback_query(update: Update, context):
     """Обработка callback от инлайн-кнопок"""
     query = update.callback_query
+    data = query.data
+    
+    # Кнопки инлайн-режима отвечают на нажатие сами
+    if data.startswith('inline_'):
+        await handle_inline_callback(update, context)
+        return
+    
     await query.answer()
+    user_id = query.from_user.id
+    action, _, reminder_id = data.partition('_')
     
-    data = query.data
+    if action in ('done', 'delete') and not reminder_id.isdigit():
+        # Подделанные или испорченные callback_data
+        return
     
-    if data.startswith('done_'):
-        reminder_id = int(data.split('_')[1])
-        if delete_reminder(reminder_id):
-            await query.edit_message_text("✅ Напоминание выполнено!")
+    if action == 'done':
+        # Только свое напоминание: id из кнопки мог быть подделан
+        if await complete_reminder(int(reminder_id), user_id):
+            await show_reminder_action(query, "✅ Напоминание выполнено!")
         else:
-            await query.edit_message_text("❌ Ошибка при выполнении напоминания")
+            await show_reminder_action(query, "❌ Ошибка при выполнении напоминания", failed=True)
             
-    elif data.startswith('delete_'):
-        reminder_id = int(data.split('_')[1])
-        if delete_reminder(reminder_id):
-            await query.edit_message_text("✅ Напоминание удалено!")
+    elif action == 'delete':
+        if await delete_reminder(int(reminder_id), user_id):
+            await show_reminder_action(query, "✅ Напоминание удалено!")
         else:
-            await query.edit_message_text("❌ Ошибка при удалении напоминания")
+            await show_reminder_action(query, "❌ Ошибка при удалении напоминания", failed=True)
     
-    # Обработка инлайн-режима
-    elif data.startswith('inline_'):
-        await handle_inline_callback(update, context)
+    elif data.startswith('list_'):
+        await handle_reminders_page_callback(query, data)
 
 async def cancel(update: Update, context):
     """Отмена текущего действия"""
@@ -342,54 +470,58 @@ async def quick_time_handler(update: Update, context):
 
 def setup_handlers(application):
     """Настройка обработчиков"""
+    # Время и ошибки каждого обработчика попадают в метрики (см. metrics.py)
+    timed = metrics.instrument_handler
     
     # Conversation Handler для создания напоминаний
-    conv_handler = ConversationHandler(
+    conv_handler = SyncedConversationHandler(
         entry_points=[
-            MessageHandler(filters.Regex('^(📅 Создать напоминание|⏰ Быстрое напоминание)$'), button_handler),
-            CommandHandler('remind', button_handler)
+            MessageHandler(filters.Regex('^(📅 Создать напоминание|⏰ Быстрое напоминание)$'), timed(button_handler)),
+            CommandHandler('remind', timed(button_handler))
         ],
         states={
-            WAITING_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_reminder_text)],
-            WAITING_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_reminder_time)],
+            WAITING_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(receive_reminder_text))],
+            WAITING_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(receive_reminder_time))],
         },
-        fallbacks=[CommandHandler('cancel', cancel), MessageHandler(filters.Regex('^❌ Отмена$'), cancel)]
+        fallbacks=[CommandHandler('cancel', timed(cancel)), MessageHandler(filters.Regex('^❌ Отмена$'), timed(cancel))],
+        name='create_reminder',
+        persistent=application.persistence is not None
     )
     
+    # Состояние диалога могла изменить другая реплика: подтягиваем его до всех обработчиков
+    if isinstance(application.persistence, SQLPersistence):
+        application.persistence.register(conv_handler)
+        application.add_handler(TypeHandler(Update, application.persistence.sync), group=-1)
+    
     # Основные обработчики
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("my_reminders", show_user_reminders))
+    application.add_handler(CommandHandler("start", timed(start)))
+    application.add_handler(CommandHandler("help", timed(help_command)))
+    application.add_handler(CommandHandler("my_reminders", timed(show_user_reminders)))
+    application.add_handler(CommandHandler("timezone", timed(timezone_command)))
     
     # Обработчики кнопок и callback
     application.add_handler(conv_handler)
-    application.add_handler(CallbackQueryHandler(handle_callback_query))
+    application.add_handler(CallbackQueryHandler(timed(handle_callback_query)))
     
     # Инлайн-режим
-    application.add_handler(InlineQueryHandler(handle_inline_query))
+    application.add_handler(InlineQueryHandler(timed(handle_inline_query)))
     
     # Обработка обычных сообщений (кнопки главного меню)
-    application.add_handler(MessageHandler(filters.Regex('^(📋 Мои напоминания|❌ Удалить все|🔙 Назад)$'), button_handler))
+    application.add_handler(MessageHandler(filters.Regex('^(📋 Мои напоминания|❌ Удалить все|🔙 Назад)$'), timed(button_handler)))
     
     # Обработка быстрого выбора времени
     application.add_handler(MessageHandler(
         filters.Regex('^(⏱ Через 1 час|⏱ Через 3 часа|🌅 Завтра утром|🌆 Сегодня вечером)$'),
-        quick_time_handler
+        timed(quick_time_handler)
     ))
     
     # Обработка неизвестных команд и текста
-    application.add_handler(MessageHandler(filters.COMMAND, handle_unknown_command))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_unknown_text))
+    application.add_handler(MessageHandler(filters.COMMAND, timed(handle_unknown_command)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed(handle_unknown_text)))
 
 def main():
-    """Основная функция"""
-    application = Application.builder().token(config.BOT_TOKEN).build()
-    
-    # Настраиваем обработчики
-    setup_handlers(application)
-    
-    # Запускаем бота с polling
-    application.run_polling()
+    """Основная функция: бот с polling до SIGINT или SIGTERM"""
+    Lifecycle().run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,256 @@
+"""HTTP-транспорт запросов к Bot API.
+
+Все исходящие вызовы процесса — ответы обработчиков и отправка
+напоминаний — идут через один :class:`PooledRequest` бота Application
+(см. ``lifecycle.build_application``), long polling ``getUpdates`` — через
+свой пул из одного соединения, чтобы висящий запрос не занимал место
+отправок.
+
+Пул настраивается в config: размер ``BOT_API_POOL_SIZE``, ожидание
+свободного соединения ``BOT_API_POOL_TIMEOUT``, простой соединения
+``BOT_API_KEEPALIVE_SECONDS`` (у httpx по умолчанию 5 с, и между
+всплесками соединения закрывались бы и открывались заново). HTTP/2
+включается, если установлен пакет ``h2``: тогда все запросы мультиплексируются
+в одно TLS-соединение.
+
+Общий лимит ``BOT_API_RATE`` запросов в секунду делит
+:class:`PriorityRateLimiter`: ответ на нажатие кнопки не ждет, пока уйдут
+сотни напоминаний, наступивших в 09:00.
+
+Метрики: длительность запроса по методу Bot API, число запросов и новых
+соединений по пулу (их отношение — доля переиспользования), запросы в
+полете и отказы из-за занятого пула, ожидание лимита по очередям.
+"""
+import asyncio
+import importlib.util
+import time
+from collections import deque
+
+import httpx
+from telegram.error import RetryAfter, TimedOut
+from telegram.ext import BaseRateLimiter
+from telegram.request import HTTPXRequest
+
+import config
+import metrics
+
+SEND = 'send'
+UPDATES = 'updates'
+
+# Очереди лимитера в порядке приоритета
+CALLBACK = 'callback'
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (CALLBACK, INTERACTIVE, BULK)
+# Клиент Telegram показывает индикатор загрузки, пока не придет ответ
+ANSWER_METHODS = frozenset({'answerCallbackQuery', 'answerInlineQuery'})
+# Служебные вызовы при запуске лимит не расходуют
+UNLIMITED_METHODS = frozenset({'getMe', 'setWebhook', 'deleteWebhook', 'getWebhookInfo'})
+
+REQUEST_SECONDS = metrics.Histogram('helotime_bot_api_seconds', 'Длительность запроса к Bot API', ('method',))
+REQUESTS = metrics.Counter('helotime_bot_api_requests_total', 'Запросы к Bot API', ('pool', 'method'))
+CONNECTIONS = metrics.Counter('helotime_bot_api_connections_total', 'Новые соединения с Bot API', ('pool',))
+IN_FLIGHT = metrics.Gauge('helotime_bot_api_in_flight', 'Запросы к Bot API в полете', ('pool',))
+POOL_TIMEOUTS = metrics.Counter(
+    'helotime_bot_api_pool_timeouts_total', 'Запросы, не дождавшиеся свободного соединения', ('pool',)
+)
+QUEUE_SECONDS = metrics.Histogram('helotime_bot_api_queue_seconds', 'Ожидание лимита Bot API', ('lane',))
+QUEUED = metrics.Gauge('helotime_bot_api_queued', 'Запросы, ждущие лимита Bot API', ('lane',))
+
+
+def http2_available():
+    return importlib.util.find_spec('h2') is not None
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """Транспорт httpx, считающий установленные соединения через trace httpcore"""
+
+    def __init__(self, pool, **kwargs):
+        super().__init__(**kwargs)
+        self._connections = CONNECTIONS.labels(pool)
+
+    async def handle_async_request(self, request):
+        request.extensions['trace'] = self._trace
+        return await super().handle_async_request(request)
+
+    async def _trace(self, event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            self._connections.inc()
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest с настраиваемым keep-alive, HTTP/2 и метриками"""
+
+    def __init__(self, pool=SEND, connection_pool_size=None, pool_timeout=None, http2=None, **kwargs):
+        self.pool = pool
+        self._pool_size = connection_pool_size or config.BOT_API_POOL_SIZE
+        http2 = config.BOT_API_HTTP2 if http2 is None else http2
+        self._in_flight = IN_FLIGHT.labels(pool)
+        self._pool_timeouts = POOL_TIMEOUTS.labels(pool)
+        super().__init__(
+            connection_pool_size=self._pool_size,
+            pool_timeout=config.BOT_API_POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+            http_version='2' if http2 and http2_available() else '1.1',
+            **kwargs
+        )
+
+    def _build_client(self):
+        # HTTPXRequest не дает задать keepalive_expiry, а собственный
+        # транспорт httpx использует вместо limits и http2 клиента. HTTP/1.1
+        # оставлен включенным: HTTP/2 выбирается через ALPN, а без TLS
+        # (локальный Bot API сервер) остается HTTP/1.1
+        kwargs = dict(self._client_kwargs, transport=_CountingTransport(
+            self.pool,
+            http1=True,
+            http2=self.http_version != '1.1',
+            limits=httpx.Limits(
+                max_connections=self._pool_size,
+                max_keepalive_connections=self._pool_size,
+                keepalive_expiry=config.BOT_API_KEEPALIVE_SECONDS,
+            ),
+        ))
+        return httpx.AsyncClient(**kwargs)
+
+    async def do_request(self, url, method, *args, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        REQUESTS.labels(self.pool, endpoint).inc()
+        self._in_flight.inc()
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except TimedOut as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                self._pool_timeouts.inc()
+            raise
+        finally:
+            self._in_flight.dec()
+            REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """Общий лимит запросов к Bot API с очередями по приоритету.
+
+    Запрос попадает в очередь ``callback`` (ответы на нажатия и
+    inline-запросы), ``bulk`` (``rate_limit_args={'lane': 'bulk'}`` — так
+    шлет пайплайн напоминаний) или ``interactive`` (все остальное). Пока
+    токены есть и никто не ждет, запрос уходит сразу. Иначе токены
+    раздаются взвешенной справедливой очередью: непустые очереди получают
+    доли лимита пропорционально весам, так что ответ на нажатие ждет
+    несколько токенов, а не всю пачку напоминаний, и напоминания при этом
+    не голодают. Ответ 429 ставит на паузу все очереди на ``retry_after``.
+    """
+
+    def __init__(self, rate=None, weights=None):
+        self.rate = rate or config.BOT_API_RATE
+        self.weights = weights or {
+            CALLBACK: config.LANE_WEIGHT_CALLBACK,
+            INTERACTIVE: config.LANE_WEIGHT_INTERACTIVE,
+            BULK: config.LANE_WEIGHT_BULK,
+        }
+        # Запас на секунду: после простоя первые запросы не ждут
+        self.capacity = max(self.rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lanes = {lane: deque() for lane in LANES}
+        self._waiting = 0
+        # Виртуальное время взвешенной очереди: время начала последнего
+        # выданного токена и окончания последнего токена каждой очереди
+        self._virtual = 0.0
+        self._finish = dict.fromkeys(LANES, 0.0)
+        self._handle = None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for lane in LANES:
+            while self._lanes[lane]:
+                self._lanes[lane].popleft().cancel()
+                QUEUED.labels(lane).dec()
+        self._waiting = 0
+
+    @staticmethod
+    def lane_of(endpoint, rate_limit_args):
+        if endpoint in ANSWER_METHODS:
+            return CALLBACK
+        if rate_limit_args and rate_limit_args.get('lane') in LANES:
+            return rate_limit_args['lane']
+        return INTERACTIVE
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint in UNLIMITED_METHODS:
+            return await callback(*args, **kwargs)
+        lane = self.lane_of(endpoint, rate_limit_args)
+        started = time.perf_counter()
+        if self._waiting or not self._take():
+            await self._enqueue(lane)
+        QUEUE_SECONDS.labels(lane).observe(time.perf_counter() - started)
+        try:
+            return await callback(*args, **kwargs)
+        except RetryAfter as e:
+            self._pause(e.retry_after)
+            raise
+
+    def _take(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now < self._paused_until or self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def _enqueue(self, lane):
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(future)
+        self._waiting += 1
+        QUEUED.labels(lane).inc()
+        self._schedule(0)
+        # Отмененный запрос остается в очереди и пропускается при раздаче
+        await future
+
+    def _schedule(self, delay):
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _next_lane(self):
+        # Очередь, чей следующий токен раньше всех закончится в виртуальном
+        # времени; при равенстве — более приоритетная
+        return min(
+            (lane for lane in LANES if self._lanes[lane]),
+            key=lambda lane: (max(self._finish[lane], self._virtual) + 1 / self.weights[lane], LANES.index(lane))
+        )
+
+    def _release(self):
+        """Раздает накопившиеся токены ждущим и планирует следующую раздачу"""
+        self._handle = None
+        while self._waiting:
+            lane = self._next_lane()
+            future = self._lanes[lane][0]
+            if not future.done() and not self._take():
+                break
+            self._lanes[lane].popleft()
+            self._waiting -= 1
+            QUEUED.labels(lane).dec()
+            if future.done():
+                continue
+            start = max(self._finish[lane], self._virtual)
+            self._finish[lane] = start + 1 / self.weights[lane]
+            self._virtual = start
+            future.set_result(None)
+        if self._waiting:
+            now = time.monotonic()
+            self._schedule(max(self._paused_until - now, (1 - self._tokens) / self.rate, 0))
+
+
+def build_requests():
+    """Пара ``(запросы, getUpdates)`` для ``Application.builder()``"""
+    return PooledRequest(SEND), PooledRequest(UPDATES, connection_pool_size=1)
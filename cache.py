@@ -0,0 +1,306 @@
+"""Кэш списков напоминаний пользователей.
+
+Первая страница «Мои напоминания» меняется только при создании, удалении и
+отправке напоминаний, поэтому читается из кэша, а эти операции явно сбрасывают
+запись пользователя. Записи — компактные namedtuple вместо ORM-объектов.
+
+По умолчанию кэш живет в памяти процесса (LRU с ограничением размера и TTL).
+Если задан ``REDIS_URL`` и установлен пакет ``redis``, используется общий
+кэш в Redis, чтобы сброс на одной реплике был виден остальным.
+"""
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+import config
+import metrics
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+ReminderRecord = namedtuple('ReminderRecord', 'id chat_id reminder_text reminder_time recurrence')
+
+
+def _record_size(record):
+    return (
+        sys.getsizeof(record) + sys.getsizeof(record.reminder_text)
+        + sys.getsizeof(record.reminder_time) + sys.getsizeof(record.recurrence)
+    )
+
+
+class UserReminderCache:
+    """LRU-кэш списков напоминаний по user_id с TTL.
+
+    Чтобы чтение, начатое до сброса, не вернуло в кэш устаревший список,
+    :meth:`set` принимает поколение, полученное через :meth:`generation`
+    до запроса к базе: после сброса поколение меняется и запись отбрасывается.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or config.USER_CACHE_SIZE
+        self.ttl = config.USER_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._generation = 0
+        self._base_generation = 0
+        self._memory = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._generations.get(user_id, self._base_generation)
+
+    def get(self, user_id):
+        """Список записей пользователя или None, если его нет в кэше"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id, records, generation=None):
+        records = tuple(records)
+        size = sum(_record_size(record) for record in records)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(user_id, self._base_generation):
+                return
+            if user_id in self._entries:
+                self._drop(user_id)
+            self._entries[user_id] = (time.monotonic() + self.ttl, records, size)
+            self._memory += size
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            self._generation += 1
+            for user_id in user_ids:
+                self._generations[user_id] = self._generation
+                if user_id in self._entries:
+                    self._drop(user_id)
+            # Поколения нужны только для чтений, идущих прямо сейчас
+            if len(self._generations) > self.maxsize:
+                self._base_generation = self._generation
+                self._generations.clear()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._base_generation = self._generation
+            self._generations.clear()
+            self._entries.clear()
+            self._memory = 0
+
+    def stats(self):
+        """Доля попаданий, размер и оценка занимаемой памяти"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else 0.0,
+                'size': len(self._entries),
+                'memory_bytes': self._memory,
+            }
+
+    def _drop(self, user_id):
+        self._memory -= self._entries.pop(user_id)[2]
+
+
+class RedisUserReminderCache:
+    """Общий для реплик кэш списков напоминаний в Redis"""
+
+    def __init__(self, url, ttl=None, prefix='helotime:reminders:'):
+        self._client = redis.Redis.from_url(url)
+        self.ttl = config.USER_CACHE_TTL if ttl is None else ttl
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, user_id):
+        return f'{self._prefix}{user_id}'
+
+    def generation(self, user_id):
+        # Гонку чтения со сбросом в Redis ограничивает TTL записи
+        return None
+
+    def get(self, user_id):
+        try:
+            payload = self._client.get(self._key(user_id))
+        except redis.RedisError as e:
+            logger.warning(f"Кэш Redis недоступен: {e}")
+            payload = None
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return tuple(
+            ReminderRecord(reminder_id, chat_id, text, datetime.fromisoformat(reminder_time), rule)
+            for reminder_id, chat_id, text, reminder_time, rule in json.loads(payload)
+        )
+
+    def set(self, user_id, records, generation=None):
+        payload = json.dumps([
+            (record.id, record.chat_id, record.reminder_text, record.reminder_time.isoformat(), record.recurrence)
+            for record in records
+        ])
+        try:
+            self._client.set(self._key(user_id), payload, ex=self.ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Кэш Redis недоступен: {e}")
+
+    def invalidate(self, *user_ids):
+        if not user_ids:
+            return
+        try:
+            self._client.delete(*(self._key(user_id) for user_id in user_ids))
+        except redis.RedisError as e:
+            logger.warning(f"Не удалось сбросить кэш Redis: {e}")
+
+    def clear(self):
+        try:
+            keys = list(self._client.scan_iter(match=f'{self._prefix}*', count=1000))
+            if keys:
+                self._client.delete(*keys)
+        except redis.RedisError as e:
+            logger.warning(f"Не удалось очистить кэш Redis: {e}")
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else 0.0,
+            }
+
+
+class UserZoneCache:
+    """LRU-кэш часовых поясов пользователей (ZoneInfo) с TTL.
+
+    Смену пояса на другой реплике эта увидит не позже чем через ``ttl``.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or config.USER_CACHE_SIZE
+        self.ttl = config.USER_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, zone):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, zone)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class InlineTextCache:
+    """Тексты напоминаний из инлайн-запросов по короткому ключу, LRU с TTL.
+
+    В callback_data кнопки помещается только 64 байта, а у нажатия кнопки
+    под сообщением инлайн-режима нет самого сообщения: текст приходится
+    хранить на сервере до нажатия.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or config.INLINE_TEXT_CACHE_SIZE
+        self.ttl = config.INLINE_TEXT_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def set_many(self, texts):
+        """Запоминает тексты из словаря ``{ключ: текст}``"""
+        with self._lock:
+            expires = time.monotonic() + self.ttl
+            for key, text in texts.items():
+                self._entries[key] = (expires, text)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class RedisInlineTextCache:
+    """Общее для реплик хранилище текстов инлайн-запросов в Redis"""
+
+    def __init__(self, url, ttl=None, prefix='helotime:inline:'):
+        self._client = redis.Redis.from_url(url)
+        self.ttl = config.INLINE_TEXT_TTL if ttl is None else ttl
+        self._prefix = prefix
+
+    def get(self, key):
+        try:
+            payload = self._client.get(f'{self._prefix}{key}')
+        except redis.RedisError as e:
+            logger.warning(f"Кэш Redis недоступен: {e}")
+            return None
+        return payload.decode() if payload is not None else None
+
+    def set_many(self, texts):
+        try:
+            with self._client.pipeline(transaction=False) as pipeline:
+                for key, text in texts.items():
+                    pipeline.set(f'{self._prefix}{key}', text, ex=int(self.ttl))
+                pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Кэш Redis недоступен: {e}")
+
+
+def _create_cache():
+    if config.REDIS_URL:
+        if redis is not None:
+            logger.info("Кэш списков напоминаний: Redis")
+            return RedisUserReminderCache(config.REDIS_URL)
+        logger.warning("REDIS_URL задан, но пакет redis не установлен: используется кэш в памяти")
+    return UserReminderCache()
+
+
+user_reminders = _create_cache()
+user_zones = UserZoneCache()
+inline_texts = (
+    RedisInlineTextCache(config.REDIS_URL) if config.REDIS_URL and redis is not None else InlineTextCache()
+)
+
+metrics.Counter('helotime_user_cache_hits_total', 'Попадания в кэш списков напоминаний',
+                function=lambda: user_reminders.stats()['hits'])
+metrics.Counter('helotime_user_cache_misses_total', 'Промахи кэша списков напоминаний',
+                function=lambda: user_reminders.stats()['misses'])
+metrics.Gauge('helotime_user_cache_memory_bytes', 'Оценка памяти кэша списков напоминаний',
+              function=lambda: user_reminders.stats().get('memory_bytes', 0))
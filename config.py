@@ -1,6 +1,134 @@
+import hashlib
+import hmac
 import os
+import socket
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "") + "/webhook"
+# Секрет заголовка X-Telegram-Bot-Api-Secret-Token. Без него webhook принял бы
+# поддельные обновления от любого, кто знает адрес, поэтому по умолчанию он
+# выводится из токена бота: одинаковый у всех реплик и неугадываемый без токена
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hmac.new(
+    BOT_TOKEN.encode(), b"helotime-webhook-secret", hashlib.sha256
+).hexdigest()
+# Ограничение очереди входящих обновлений и параллельной обработки в webhook-режиме
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 64))
 PORT = int(os.getenv("PORT", 5000))
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///reminders.db")
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")
+# Общий HTTP-пул запросов к Bot API (ответы обработчиков и отправка напоминаний).
+# Соединения держатся открытыми BOT_API_KEEPALIVE_SECONDS между всплесками;
+# HTTP/2 включается, если установлен пакет h2. Для getUpdates отдельный пул
+BOT_API_POOL_SIZE = int(os.getenv("BOT_API_POOL_SIZE", 64))
+BOT_API_POOL_TIMEOUT = float(os.getenv("BOT_API_POOL_TIMEOUT", 5))
+BOT_API_KEEPALIVE_SECONDS = float(os.getenv("BOT_API_KEEPALIVE_SECONDS", 60))
+BOT_API_HTTP2 = os.getenv("BOT_API_HTTP2", "true").lower() in ("1", "true", "yes")
+# Общий лимит запросов к Bot API (0 — без лимита) и веса очередей: ответы на
+# нажатия кнопок, ответы обработчиков и отправка напоминаний делят его в
+# пропорции весов, пока все три очереди не пусты
+BOT_API_RATE = float(os.getenv("BOT_API_RATE", 30))
+LANE_WEIGHT_CALLBACK = float(os.getenv("LANE_WEIGHT_CALLBACK", 16))
+LANE_WEIGHT_INTERACTIVE = float(os.getenv("LANE_WEIGHT_INTERACTIVE", 4))
+LANE_WEIGHT_BULK = float(os.getenv("LANE_WEIGHT_BULK", 1))
+# Токен для служебного API (/admin/...); пустой токен отключает его
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Размер пачки при массовом удалении: короткие транзакции вместо одной длинной
+BULK_DELETE_CHUNK = int(os.getenv("BULK_DELETE_CHUNK", 1000))
+
+# Диспетчер напоминаний: в памяти держим только ближайшее окно
+DISPATCH_WINDOW_MINUTES = int(os.getenv("DISPATCH_WINDOW_MINUTES", 10))
+# Несколько процессов делят напоминания через аренду строк в базе
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+DISPATCH_LEASE_SECONDS = int(os.getenv("DISPATCH_LEASE_SECONDS", 300))
+DISPATCH_SWEEP_SECONDS = int(os.getenv("DISPATCH_SWEEP_SECONDS", 30))
+DISPATCH_CLAIM_LIMIT = int(os.getenv("DISPATCH_CLAIM_LIMIT", 500))
+# Восстановление после перезапуска: опоздавшие не дольше чем на GRACE минут
+# напоминания доставляются, более старые помечаются отправленными
+CATCHUP_GRACE_MINUTES = int(os.getenv("CATCHUP_GRACE_MINUTES", 60))
+RECOVERY_CHUNK = int(os.getenv("RECOVERY_CHUNK", 10000))
+
+# Отправка напоминаний: лимиты Telegram ~30 сообщений/с всего и ~1/с на чат
+DELIVERY_BATCH_SIZE = int(os.getenv("DELIVERY_BATCH_SIZE", 100))
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", 30))
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", 30))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", 1))
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", 3))
+DELIVERY_RETRY_BACKOFF = float(os.getenv("DELIVERY_RETRY_BACKOFF", 1))
+# Сводка: напоминания одного чата, наступающие в пределах DIGEST_WINDOW_SECONDS,
+# уходят одним сообщением (не больше DIGEST_MAX_ITEMS в сообщении) с кнопками
+# для каждого. Более поздние из них приходят раньше своего времени
+DIGEST_ENABLED = os.getenv("DIGEST_ENABLED", "false").lower() in ("1", "true", "yes")
+DIGEST_WINDOW_SECONDS = float(os.getenv("DIGEST_WINDOW_SECONDS", 60))
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", 10))
+
+# Outbox доставок: неудачная отправка повторяется через
+# OUTBOX_RETRY_BASE_SECONDS * 2^(попытка-1) (не дольше OUTBOX_RETRY_MAX_SECONDS),
+# после OUTBOX_MAX_ATTEMPTS попыток строка становится dead
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 30))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 3600))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 10))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+
+# Архив: отправленные напоминания старше ARCHIVE_AFTER_HOURS раз в
+# ARCHIVE_INTERVAL_SECONDS переносятся из reminders в reminders_archive
+# пачками по ARCHIVE_CHUNK с паузой ARCHIVE_PAUSE_SECONDS между ними.
+# Архив и завершенные доставки outbox хранятся ARCHIVE_RETENTION_DAYS дней (0 — бессрочно)
+ARCHIVE_AFTER_HOURS = float(os.getenv("ARCHIVE_AFTER_HOURS", 24))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
+ARCHIVE_CHUNK = int(os.getenv("ARCHIVE_CHUNK", 1000))
+ARCHIVE_PAUSE_SECONDS = float(os.getenv("ARCHIVE_PAUSE_SECONDS", 0.2))
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", 90))
+
+# Состояние диалогов и user_data в базе: изменения пишутся пачкой раз в
+# PERSISTENCE_UPDATE_INTERVAL секунд, поэтому несколько webhook-процессов
+# могут вести одного пользователя по очереди
+PERSISTENCE_ENABLED = os.getenv("PERSISTENCE_ENABLED", "true").lower() in ("1", "true", "yes")
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", 1))
+
+# Сколько при остановке (SIGTERM) ждать, пока пайплайн дошлет уже взятые
+# напоминания; держать меньше срока, который платформа дает на остановку
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", 20))
+
+# Пул потоков для запросов к базе из асинхронных обработчиков
+DB_WORKERS = int(os.getenv("DB_WORKERS", 8))
+
+# Профиль подключения к базе: tuned (WAL и прагмы SQLite, настроенный пул
+# PostgreSQL) или default (настройки SQLAlchemy по умолчанию)
+DB_PROFILE = os.getenv("DB_PROFILE", "tuned")
+# Пул соединений: пул потоков базы плюс писатель, диспетчер, отправка и восстановление
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", DB_WORKERS + 4))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+
+# Групповая запись новых напоминаний: до WRITE_BATCH_SIZE строк одной
+# транзакцией, первая вставка ждет остальные не дольше WRITE_BATCH_DELAY_MS
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 500))
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", 2))
+
+# Инлайн-режим: сколько Telegram кэширует ответ, общий ли он для всех
+# пользователей и сколько ждать следующей буквы перед ответом
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 30))
+INLINE_IS_PERSONAL = os.getenv("INLINE_IS_PERSONAL", "false").lower() in ("1", "true", "yes")
+INLINE_DEBOUNCE_SECONDS = float(os.getenv("INLINE_DEBOUNCE_SECONDS", 0.3))
+# Тексты инлайн-запросов для кнопок под отправленным сообщением: сколько
+# хранить и сколько последних помнить (с REDIS_URL они общие для реплик)
+INLINE_TEXT_TTL = int(os.getenv("INLINE_TEXT_TTL", 24 * 3600))
+INLINE_TEXT_CACHE_SIZE = int(os.getenv("INLINE_TEXT_CACHE_SIZE", 100000))
+
+# Пояс пользователей, не выбравших свой командой /timezone
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+
+# Напоминаний на одной странице «Мои напоминания»: не больше 30, иначе на
+# текст каждого в 4096 символах сообщения почти не остается места
+REMINDERS_PAGE_SIZE = min(max(int(os.getenv("REMINDERS_PAGE_SIZE", 10)), 1), 30)
+
+# Кэш списков напоминаний пользователей; с REDIS_URL он общий для всех реплик
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+REDIS_URL = os.getenv("REDIS_URL", "")
@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean
+from sqlalchemy import (
+    create_engine, event, inspect, Column, Integer, BigInteger, String, DateTime, Boolean, Index,
+    UniqueConstraint, text
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import config
+import metrics
 
 Base = declarative_base()
 
@@ -12,12 +18,224 @@ class Reminder(Base):
     user_id = Column(Integer, nullable=False)
     chat_id = Column(Integer, nullable=False)
     reminder_text = Column(String, nullable=False)
+    # Наивное UTC; в пояс пользователя переводится только при разборе и показе
     reminder_time = Column(DateTime, nullable=False)
     is_sent = Column(Boolean, default=False)
+    # Правило повторения (см. recurrence.py); reminder_time — ближайшее срабатывание
+    recurrence = Column(String, nullable=True)
+    # Аренда напоминания воркером на время отправки
+    lease_owner = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
 
-# Создаем базу данных
-engine = create_engine(config.DATABASE_URL)
-Base.metadata.create_all(engine)
+    __table_args__ = (
+        # Список напоминаний пользователя: user_id, is_sent с сортировкой по времени
+        Index('ix_reminders_user_pending', 'user_id', 'is_sent', 'reminder_time', 'id'),
+        # Частичный индекс только по неотправленным: окно диспетчера и восстановление
+        Index(
+            'ix_reminders_pending_time', 'reminder_time',
+            sqlite_where=text('is_sent = 0'),
+            postgresql_where=text('is_sent = false')
+        ),
+        # Id не переиспользуются после переноса строки с наибольшим id в архив:
+        # на них ссылаются архив, outbox и кнопки уже отправленных сообщений
+        {'sqlite_autoincrement': True},
+    )
+
+class UserSettings(Base):
+    __tablename__ = 'user_settings'
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    # Имя пояса IANA, например Europe/Moscow (см. timezones.py)
+    timezone = Column(String, nullable=False)
+
+class BotState(Base):
+    """Состояние PTB (user_data, состояния диалогов) в JSON, см. persistence.py"""
+    __tablename__ = 'bot_state'
+
+    # user или conversation:<имя диалога>
+    kind = Column(String, primary_key=True)
+    # user_id или JSON-ключ диалога, например [chat_id, user_id]
+    key = Column(String, primary_key=True)
+    data = Column(String, nullable=False)
+    # Метка записи (time_ns записавшего процесса): по ней реплики замечают чужие изменения
+    version = Column(BigInteger, nullable=False)
+
+class ArchivedReminder(Base):
+    """Отправленное напоминание, перенесенное из reminders (см. archive.py)"""
+    __tablename__ = 'reminders_archive'
+
+    # id из reminders сохраняется: на него ссылаются deliveries и кнопки сообщений
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False)
+    chat_id = Column(Integer, nullable=False)
+    reminder_text = Column(String, nullable=False)
+    reminder_time = Column(DateTime, nullable=False)
+    recurrence = Column(String, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_reminders_archive_user', 'user_id'),
+        Index('ix_reminders_archive_archived_at', 'archived_at'),
+    )
+
+class Delivery(Base):
+    """Строка outbox: одно срабатывание напоминания и исход его отправки (см. outbox.py)"""
+    __tablename__ = 'deliveries'
+
+    id = Column(Integer, primary_key=True)
+    reminder_id = Column(Integer, nullable=False)
+    # Время срабатывания: у повторяющегося напоминания их много
+    scheduled_for = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    chat_id = Column(Integer, nullable=False)
+    reminder_text = Column(String, nullable=False)
+    # sending, sent, pending (ждет повтора) или dead
+    status = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_retry_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    message_id = Column(BigInteger, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Срабатывание отправляется не больше одного раза
+        UniqueConstraint('reminder_id', 'scheduled_for', name='uq_deliveries_occurrence'),
+        # Выборка повторов: pending с наступившим next_retry_at
+        Index('ix_deliveries_retry', 'status', 'next_retry_at'),
+        Index('ix_deliveries_chat', 'chat_id', 'id'),
+    )
+
+def ensure_columns(bind):
+    """Добавляет недостающие (nullable) колонки в уже существующие таблицы"""
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=bind.dialect)
+                with bind.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def ensure_autoincrement(bind):
+    """Перестраивает reminders в SQLite-базе, созданной без AUTOINCREMENT.
+
+    Без него SQLite выдает новой строке наибольший id, если строку с ним
+    перенесли в архив. Счетчик после перестройки не меньше id в архиве.
+    """
+    if bind.dialect.name != 'sqlite':
+        return
+    table = Reminder.__table__
+    with bind.begin() as conn:
+        sql = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'reminders'"
+        )).scalar()
+        if sql is not None and 'AUTOINCREMENT' not in sql.upper():
+            columns = ', '.join(column.name for column in table.columns)
+            conn.execute(text('ALTER TABLE reminders RENAME TO reminders_legacy'))
+            # Индексы переехали вместе с таблицей; create ниже создаст их заново
+            for index in table.indexes:
+                conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+            table.create(conn)
+            conn.execute(text(f'INSERT INTO reminders ({columns}) SELECT {columns} FROM reminders_legacy'))
+            conn.execute(text('DROP TABLE reminders_legacy'))
+        archived_max = conn.execute(text('SELECT MAX(id) FROM reminders_archive')).scalar()
+        if archived_max is not None:
+            updated = conn.execute(text(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = 'reminders'"
+            ), {'seq': archived_max}).rowcount
+            if not updated:
+                conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('reminders', :seq)"),
+                             {'seq': archived_max})
+
+def ensure_indexes(bind):
+    """Создает недостающие индексы на уже существующей базе"""
+    for index in Base.metadata.tables['reminders'].indexes:
+        index.create(bind=bind, checkfirst=True)
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL: читатели не блокируют писателя и наоборот; NORMAL в WAL
+        # делает fsync только при чекпоинте, не на каждый коммит
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.execute(f'PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}')
+        # Отрицательное значение — размер кэша страниц в КиБ
+        cursor.execute(f'PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+def make_engine(url, profile=None):
+    """Создает движок с настройками профиля ``DB_PROFILE``.
+
+    ``default`` — настройки SQLAlchemy по умолчанию; ``tuned`` — WAL и
+    прагмы для файловой SQLite или настроенный пул для PostgreSQL.
+    """
+    profile = profile or config.DB_PROFILE
+    if profile == 'default':
+        return create_engine(url)
+    if profile != 'tuned':
+        raise ValueError(f"Неизвестный профиль базы: {profile}")
+
+    if url.startswith('sqlite'):
+        if ':memory:' in url or url.rstrip('/') in ('sqlite:', 'sqlite:/'):
+            # База в памяти живет в одном соединении: прагмы и пул ей не нужны
+            return create_engine(url)
+        # Соединения из пула переходят между потоками (пул базы, писатель,
+        # диспетчер, отправка), поэтому проверка потока pysqlite отключена;
+        # cached_statements — кэш подготовленных запросов на соединение
+        engine = create_engine(
+            url,
+            poolclass=QueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            connect_args={
+                'check_same_thread': False,
+                'timeout': config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+                'cached_statements': config.DB_STATEMENT_CACHE_SIZE,
+            }
+        )
+        event.listen(engine, 'connect', _sqlite_pragmas)
+        return engine
+
+    # PostgreSQL: пул под число потоков, проверка соединения перед выдачей
+    # и кэш скомпилированных запросов SQLAlchemy (psycopg2 не умеет
+    # серверные подготовленные выражения)
+    options = {}
+    if make_url(url).get_driver_name() == 'psycopg2':
+        # Пакетный executemany есть только у psycopg2, другие драйверы этот аргумент не принимают
+        options['executemany_mode'] = 'values_plus_batch'
+    return create_engine(
+        url,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_use_lifo=True,
+        query_cache_size=config.DB_STATEMENT_CACHE_SIZE * 4,
+        **options
+    )
+
+def init_schema(bind=None):
+    """Создает недостающие таблицы, колонки и индексы.
+
+    Вызывается при запуске (см. lifecycle.py), а не при импорте: служебные
+    скрипты и бенчмарки не должны трогать живую базу, просто импортируя модуль.
+    """
+    bind = bind or engine
+    Base.metadata.create_all(bind)
+    ensure_columns(bind)
+    ensure_autoincrement(bind)
+    ensure_indexes(bind)
+
+# Движок не подключается к базе до первого запроса
+engine = make_engine(config.DATABASE_URL)
+metrics.instrument_engine(engine)
 
 # Создаем фабрику сессий
 SessionLocal = sessionmaker(bind=engine)
@@ -0,0 +1,585 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from cache import user_reminders
+from database import SessionLocal, Reminder, UserSettings
+from dispatcher import claim_chat_reminders
+from timezones import utcnow, zone_of
+import config
+import metrics
+import outbox
+import recurrence
+
+logger = logging.getLogger(__name__)
+
+MESSAGES_SENT = metrics.Counter('helotime_reminder_messages_total', 'Отправленные сообщения с напоминаниями')
+metrics.Gauge(
+    'helotime_digest_ratio', 'Напоминаний на одно отправленное сообщение',
+    function=lambda: metrics.REMINDERS_SENT.labels().value / max(MESSAGES_SENT.labels().value, 1)
+)
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не более ``rate`` операций в секунду"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def idle(self):
+        """Корзина полна, то есть давно не использовалась"""
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+def _load_batch(reminder_ids, until):
+    """Загружает неотправленные напоминания пачки, наступающие до ``until``, одним запросом.
+
+    Пояс пользователя нужен, чтобы перенести повторяющееся напоминание
+    на то же местное время. Ограничение по времени отсекает повторяющееся
+    напоминание, которое уже ушло в сводке и перенесено на следующий раз.
+    """
+    db_session = SessionLocal()
+    try:
+        return db_session.query(
+            Reminder.id, Reminder.user_id, Reminder.chat_id,
+            Reminder.reminder_text, Reminder.reminder_time, Reminder.recurrence,
+            UserSettings.timezone
+        ).outerjoin(
+            UserSettings, UserSettings.user_id == Reminder.user_id
+        ).filter(
+            Reminder.id.in_(reminder_ids),
+            Reminder.is_sent == False,
+            Reminder.reminder_time <= until
+        ).all()
+    finally:
+        db_session.close()
+
+
+def _mark_sent(reminder_ids, rescheduled=()):
+    """Помечает пачку напоминаний отправленными одним UPDATE и снимает аренду.
+
+    Повторяющиеся напоминания из ``rescheduled`` (словари с ``id`` и новым
+    ``reminder_time``) в той же транзакции переносятся на следующее срабатывание.
+    """
+    db_session = SessionLocal()
+    try:
+        if reminder_ids:
+            db_session.query(Reminder).filter(
+                Reminder.id.in_(reminder_ids)
+            ).update({
+                Reminder.is_sent: True,
+                Reminder.lease_owner: None,
+                Reminder.lease_until: None
+            }, synchronize_session=False)
+        if rescheduled:
+            db_session.bulk_update_mappings(Reminder, [
+                dict(mapping, lease_owner=None, lease_until=None) for mapping in rescheduled
+            ])
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+# Предел длины сообщения Telegram в UTF-16 символах
+MESSAGE_TEXT_LIMIT = 4096
+DIGEST_HEADER = "🔔 **Напоминания!**\n\n"
+
+
+def _text_length(text):
+    """Длина текста так, как ее считает Telegram"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+async def _run_db(func, *args):
+    """Обращение к базе в ограниченном пуле потоков базы, а не в пуле по умолчанию"""
+    from repository import run_db
+
+    return await run_db(func, *args)
+
+
+def _digest_line(number, reminder):
+    """Строка сводки; текст экранирован: в чужом тексте разметка не нужна"""
+    from telegram.helpers import escape_markdown
+
+    return f"{number}. {escape_markdown(reminder.reminder_text)}"
+
+
+class Digest:
+    """Напоминания одного чата, отправляемые одним сообщением"""
+
+    def __init__(self, reminders):
+        self.reminders = reminders
+        self.chat_id = reminders[0].chat_id
+        self.user_id = reminders[0].user_id
+        self.reminder_time = min(reminder.reminder_time for reminder in reminders)
+
+    def __len__(self):
+        return len(self.reminders)
+
+    def __str__(self):
+        return f"Сводка {', '.join(str(reminder.id) for reminder in self.reminders)}"
+
+
+def _group_digests(reminders, max_items):
+    """Напоминания одного чата — в сводки до ``max_items`` и до предела длины сообщения.
+
+    Одиночные напоминания остаются как есть.
+    """
+    by_chat = {}
+    for reminder in reminders:
+        by_chat.setdefault(reminder.chat_id, []).append(reminder)
+    items = []
+
+    def flush(chunk):
+        if chunk:
+            items.append(Digest(chunk) if len(chunk) > 1 else chunk[0])
+
+    for chat_reminders in by_chat.values():
+        chat_reminders.sort(key=lambda reminder: (reminder.reminder_time, reminder.id))
+        chunk, length = [], _text_length(DIGEST_HEADER)
+        for reminder in chat_reminders:
+            line = _text_length(_digest_line(len(chunk) + 1, reminder)) + 1
+            if chunk and (len(chunk) >= max_items or length + line > MESSAGE_TEXT_LIMIT):
+                flush(chunk)
+                chunk, length = [], _text_length(DIGEST_HEADER)
+                line = _text_length(_digest_line(1, reminder)) + 1
+            chunk.append(reminder)
+            length += line
+        flush(chunk)
+    return items
+
+
+class DeliveryPipeline:
+    """Асинхронная отправка напоминаний пачками с учетом лимитов Telegram.
+
+    Работает в event loop Application (:meth:`start_async`) и шлет через его
+    бота, то есть через общий HTTP-пул (см. bot_api.py), или в отдельном
+    потоке со своим event loop и ботом (:meth:`start`). Диспетчер передает
+    наступившие напоминания через :meth:`submit`, пайплайн собирает их в
+    пачки, отправляет параллельно через общий и поканальный token bucket
+    и помечает всю пачку отправленной одним запросом. С ``digest_window``
+    напоминания одного чата, наступающие в пределах окна, уходят одной
+    сводкой (:class:`Digest`). Исход каждой отправки
+    записывается в outbox (см. outbox.py); раз в ``OUTBOX_POLL_SECONDS``
+    пайплайн повторяет неудачные отправки из outbox через те же лимиты.
+    """
+
+    def __init__(self, bot, batch_size=None, concurrency=None, global_rate=None,
+                 chat_rate=None, max_retries=None, retry_backoff=None, owner=None,
+                 digest_window=None, digest_max_items=None):
+        self._bot = bot
+        self.owner = owner or config.WORKER_ID
+        self.batch_size = batch_size or config.DELIVERY_BATCH_SIZE
+        self.concurrency = concurrency or config.DELIVERY_CONCURRENCY
+        self.max_retries = config.DELIVERY_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = config.DELIVERY_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self._chat_rate = chat_rate or config.DELIVERY_CHAT_RATE
+        if digest_window is None:
+            digest_window = config.DIGEST_WINDOW_SECONDS if config.DIGEST_ENABLED else 0
+        self.digest_window = timedelta(seconds=digest_window)
+        self.digest_max_items = digest_max_items or config.DIGEST_MAX_ITEMS
+        self._global_bucket = TokenBucket(global_rate or config.DELIVERY_GLOBAL_RATE)
+        self._chat_buckets = {}
+        self._queue = None
+        self._loop = None
+        self._thread = None
+        self._task = None
+        # Бота, созданного для пайплайна, пайплайн и закрывает; бот Application — нет
+        self._owns_bot = True
+        # Аргументы лимитера бота Application: напоминания идут в очередь bulk
+        self._send_kwargs = {}
+        self._ready = threading.Event()
+        # Остановка не дождалась очереди: новые отправки больше не начинаем
+        self._closing = threading.Event()
+        self._started_at = None
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_throughput = 0.0
+
+    def start(self, bot=None):
+        """Запускает поток с event loop пайплайна; ``bot`` заменяет бота из конструктора"""
+        if self._thread is not None:
+            return
+        if bot is not None:
+            self._bot = bot
+        if self._bot is None:
+            raise RuntimeError("Пайплайну отправки не передан бот")
+        self._thread = threading.Thread(target=self._run, name='reminder-delivery', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        logger.info("Пайплайн отправки напоминаний запущен")
+
+    async def start_async(self, bot):
+        """Запускает пайплайн задачей текущего event loop с чужим ботом.
+
+        Бот уже инициализирован владельцем (Application) и закрывается им
+        же после остановки пайплайна. Если у бота есть лимитер
+        (:class:`bot_api.PriorityRateLimiter`), напоминания уступают ему
+        место перед ответами пользователям.
+        """
+        if self._task is not None:
+            return
+        from bot_api import BULK
+
+        self._bot = bot
+        self._owns_bot = False
+        if getattr(bot, 'rate_limiter', None) is not None:
+            self._send_kwargs = {'rate_limit_args': {'lane': BULK}}
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._started_at = time.monotonic()
+        self._task = self._loop.create_task(self._main())
+        logger.info("Пайплайн отправки напоминаний запущен")
+
+    async def stop_async(self, timeout=None):
+        """То же, что :meth:`stop`, для пайплайна из :meth:`start_async`"""
+        if self._task is None:
+            return True
+        await self._queue.put(None)
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        if not done:
+            self._closing.set()
+            await self._task
+        self._task = None
+        return bool(done)
+
+    def stop(self, timeout=None):
+        """Останавливает пайплайн после отправки уже принятых напоминаний.
+
+        Если за ``timeout`` секунд очередь не разобрана, новые отправки не
+        начинаются: пайплайн дожидается уже идущих запросов, записывает их
+        исходы и выходит. Неначатые отправки текущей пачки уходят в outbox на
+        повтор, остальные напоминания остаются арендованными в базе, и после
+        истечения аренды их подберет другой воркер или следующий запуск.
+        Возвращает True, если очередь разобрана целиком.
+        """
+        if self._thread is None:
+            return True
+        asyncio.run_coroutine_threadsafe(self._queue.put(None), self._loop)
+        self._thread.join(timeout)
+        drained = not self._thread.is_alive()
+        if not drained:
+            self._closing.set()
+            self._thread.join()
+        self._thread = None
+        return drained
+
+    def submit(self, reminder_ids):
+        """Ставит напоминания в очередь на отправку (потокобезопасно)"""
+        if self._loop is None:
+            raise RuntimeError("Пайплайн отправки не запущен")
+        for reminder_id in reminder_ids:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, reminder_id)
+
+    @property
+    def queue_size(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        """Пропускная способность и задержка отправки"""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'queue_size': self.queue_size,
+            'throughput': self.sent / elapsed if elapsed else 0.0,
+            'last_throughput': self.last_throughput,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+        }
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._started_at = time.monotonic()
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self):
+        if self._owns_bot:
+            try:
+                await self._bot.initialize()
+            except Exception as e:
+                logger.error(f"Не удалось инициализировать бота для отправки: {e}")
+
+        retries = asyncio.create_task(self._retry_loop())
+        try:
+            while not self._closing.is_set():
+                batch, stopping = await self._next_batch()
+                if batch and not self._closing.is_set():
+                    await self._deliver(batch)
+                if stopping:
+                    break
+        finally:
+            retries.cancel()
+            if self._owns_bot:
+                await self._bot.shutdown()
+
+    async def _next_batch(self):
+        """Ждет первое напоминание и добирает пачку из уже накопившихся"""
+        batch = []
+        reminder_id = await self._queue.get()
+        while reminder_id is not None:
+            batch.append(reminder_id)
+            if len(batch) >= self.batch_size or self._queue.empty():
+                return batch, False
+            reminder_id = self._queue.get_nowait()
+        return batch, True
+
+    async def _deliver(self, reminder_ids):
+        until = utcnow() + self.digest_window
+        try:
+            reminders = await _run_db(_load_batch, reminder_ids, until)
+            if self.digest_window and reminders:
+                reminders += await _run_db(self._load_digest_siblings, reminders, until)
+            # Строки outbox заводятся до отправки; уже известные срабатывания
+            # (например, закрыть напоминание в прошлый раз не удалось) не шлем
+            opened = await _run_db(outbox.open_deliveries, self.owner, reminders)
+        except Exception as e:
+            # Аренда истечет, и напоминания подберут снова
+            logger.error(f"Ошибка при загрузке напоминаний {reminder_ids}: {e}")
+            return
+
+        started = time.monotonic()
+        to_send = [reminder for reminder in reminders if reminder.id in opened]
+        if self.digest_window:
+            items = _group_digests(to_send, self.digest_max_items)
+            item_results = await self._send_all(items, self._send_item)
+            to_send, results = [], []
+            for item, item_result in zip(items, item_results):
+                to_send += item.reminders if isinstance(item, Digest) else [item]
+                results += item_result
+        else:
+            results = await self._send_all(to_send)
+        sent_ids = [reminder.id for reminder, (result, _) in zip(to_send, results) if result is True]
+        try:
+            await _run_db(outbox.record_outcomes, [
+                outbox.outcome(opened[reminder.id], 1, result, detail)
+                for reminder, (result, detail) in zip(to_send, results)
+            ])
+        except Exception as e:
+            # Строки останутся в sending и после аренды уйдут на повтор
+            logger.error(f"Ошибка при записи исходов доставки {[r.id for r in to_send]}: {e}")
+
+        # Напоминание закрываем при любом исходе: повторы — забота outbox
+        done_ids = [reminder.id for reminder in reminders if not reminder.recurrence]
+        now = utcnow()
+        rescheduled = [
+            {'id': reminder.id, 'reminder_time': recurrence.next_occurrence_utc(
+                reminder.recurrence, reminder.reminder_time, zone_of(reminder.timezone), now
+            )}
+            for reminder in reminders if reminder.recurrence
+        ]
+
+        if reminders:
+            try:
+                await _run_db(_mark_sent, done_ids, rescheduled)
+                # Отправленные пропадают из списка, у повторяющихся меняется время
+                user_reminders.invalidate(*{reminder.user_id for reminder in reminders})
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении статуса напоминаний {[r.id for r in reminders]}: {e}")
+
+        elapsed = time.monotonic() - started
+        if elapsed:
+            self.last_throughput = len(sent_ids) / elapsed
+        self._drop_idle_buckets()
+        logger.info(
+            f"Отправлено {len(sent_ids)} из {len(reminders)} напоминаний за {elapsed:.2f} с "
+            f"({self.last_throughput:.1f} сообщ/с), "
+            f"задержка до {self.max_lag:.1f} с, в очереди {self.queue_size}"
+        )
+
+    def _load_digest_siblings(self, reminders, until):
+        """Берет в аренду и загружает напоминания тех же чатов, наступающие до ``until``"""
+        loaded = {reminder.id for reminder in reminders}
+        claimed = claim_chat_reminders(self.owner, list({reminder.chat_id for reminder in reminders}), until)
+        siblings = [reminder_id for reminder_id in claimed if reminder_id not in loaded]
+        return _load_batch(siblings, until) if siblings else []
+
+    async def _send_all(self, reminders, send=None):
+        send = send or self._send
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(reminder):
+            async with semaphore:
+                return await send(reminder)
+
+        return await asyncio.gather(*(limited(reminder) for reminder in reminders))
+
+    async def _send_item(self, item):
+        """Отправляет напоминание или сводку; исходы по каждому напоминанию.
+
+        Сводку, которую Telegram отклонил (BadRequest), отправляет по
+        одному: иначе из-за одного текста пропали бы все напоминания сводки.
+        """
+        from telegram.error import BadRequest
+        from keyboards import get_digest_actions_keyboard
+
+        if not isinstance(item, Digest):
+            return [await self._send(item)]
+        text = DIGEST_HEADER + "\n".join(
+            _digest_line(number, reminder) for number, reminder in enumerate(item.reminders, 1)
+        )
+        reply_markup = get_digest_actions_keyboard([reminder.id for reminder in item.reminders])
+        try:
+            result = await self._send_message(
+                item, str(item), len(item), text, reply_markup, raise_bad_request=True
+            )
+        except BadRequest as e:
+            logger.warning(f"{item}: сводка отклонена ({e}), отправляем по одному")
+            return [await self._send(reminder) for reminder in item.reminders]
+        return [result] * len(item)
+
+    async def _retry_loop(self):
+        while True:
+            await asyncio.sleep(config.OUTBOX_POLL_SECONDS)
+            try:
+                await self._retry()
+            except Exception as e:
+                logger.error(f"Ошибка при повторе доставок из outbox: {e}")
+
+    async def _retry(self):
+        """Повторяет одну пачку неудачных отправок из outbox"""
+        deliveries = await _run_db(outbox.claim_retries, self.owner, None)
+        if not deliveries:
+            return
+        results = await self._send_all(deliveries)
+        outcomes = [
+            outbox.outcome(delivery.delivery_id, delivery.attempts, result, detail)
+            for delivery, (result, detail) in zip(deliveries, results)
+        ]
+        await _run_db(outbox.record_outcomes, outcomes)
+        statuses = [mapping['status'] for mapping in outcomes]
+        logger.info(
+            f"Повтор из outbox: отправлено {statuses.count(outbox.SENT)} из {len(deliveries)}, "
+            f"отложено {statuses.count(outbox.PENDING)}, отказано {statuses.count(outbox.DEAD)}"
+        )
+
+    async def _send(self, reminder):
+        """Отправляет одно напоминание с повторами при ограничениях Telegram.
+
+        Возвращает пару ``(результат, подробности)``: ``(True, message_id)``
+        при успехе, ``(None, ошибка)`` если напоминание недоставляемо и
+        ``(False, ошибка)``, если стоит попробовать позже.
+        """
+        from telegram.helpers import escape_markdown
+        from keyboards import get_reminder_actions_keyboard
+
+        # Текст пользователя экранирован, как и в сводке: иначе «_» или «*»
+        # ломают разметку и Telegram отклоняет сообщение
+        return await self._send_message(
+            reminder, f"Напоминание {reminder.id}", 1,
+            f"🔔 **Напоминание!**\n\n{escape_markdown(reminder.reminder_text)}",
+            get_reminder_actions_keyboard(reminder.id)
+        )
+
+    async def _send_message(self, reminder, name, count, text, reply_markup, raise_bad_request=False):
+        """Отправка сообщения о ``count`` напоминаниях; исход как у :meth:`_send`.
+
+        С ``raise_bad_request`` BadRequest не считается недоставкой, а
+        пробрасывается вызывающему.
+        """
+        # telegram импортируется только в работающем пайплайне: модули
+        # отправки импортируют и служебные скрипты, которым Bot API не нужен
+        from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+        chat_bucket = self._chat_buckets.get(reminder.chat_id)
+        if chat_bucket is None:
+            chat_bucket = self._chat_buckets[reminder.chat_id] = TokenBucket(self._chat_rate, capacity=1)
+
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if not self._closing.is_set():
+                await chat_bucket.acquire()
+                await self._global_bucket.acquire()
+            if self._closing.is_set():
+                return False, error or "Воркер остановлен до отправки"
+            started = time.perf_counter()
+            try:
+                message = await self._bot.send_message(
+                    chat_id=reminder.chat_id,
+                    text=text,
+                    reply_markup=reply_markup,
+                    parse_mode='Markdown',
+                    **self._send_kwargs
+                )
+            except RetryAfter as e:
+                metrics.TELEGRAM_ERRORS.labels('retry_after').inc()
+                delay = e.retry_after
+                error = str(e)
+            except (Forbidden, BadRequest) as e:
+                metrics.TELEGRAM_ERRORS.labels(type(e).__name__.lower()).inc()
+                if raise_bad_request and isinstance(e, BadRequest):
+                    raise
+                metrics.REMINDERS_FAILED.inc(count)
+                logger.error(f"{name}: недоставляемо ({e})")
+                self.failed += count
+                return None, str(e)
+            except NetworkError as e:
+                metrics.TELEGRAM_ERRORS.labels('network').inc()
+                delay = self.retry_backoff * 2 ** attempt
+                error = str(e)
+                logger.warning(f"Сетевая ошибка при отправке ({name}): {e}")
+            except Exception as e:
+                metrics.TELEGRAM_ERRORS.labels('other').inc()
+                metrics.REMINDERS_FAILED.inc(count)
+                logger.error(f"Ошибка при отправке ({name}): {e}")
+                self.failed += count
+                return False, str(e)
+            else:
+                metrics.SEND_SECONDS.observe(time.perf_counter() - started)
+                self.sent += count
+                self.last_lag = (utcnow() - reminder.reminder_time).total_seconds()
+                self.max_lag = max(self.max_lag, self.last_lag)
+                metrics.REMINDERS_SENT.inc(count)
+                MESSAGES_SENT.inc()
+                metrics.DISPATCH_LAG_SECONDS.observe(max(self.last_lag, 0))
+                logger.info(f"{name}: отправлено пользователю {reminder.user_id}")
+                return True, message.message_id
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                metrics.DELIVERY_RETRIES.inc()
+                await asyncio.sleep(delay)
+
+        logger.error(f"{name}: не отправлено после {self.max_retries + 1} попыток")
+        metrics.REMINDERS_FAILED.inc(count)
+        self.failed += count
+        return False, error
+
+    def _drop_idle_buckets(self):
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.idle]:
+            del self._chat_buckets[chat_id]
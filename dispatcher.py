@@ -0,0 +1,264 @@
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from sqlalchemy import or_, select, update
+
+from database import SessionLocal, Reminder
+from timezones import utcnow
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def claim_due_reminders(owner, reminder_ids=None, limit=None):
+    """Берет в аренду наступившие напоминания, чтобы их отправил только этот воркер.
+
+    Аренда истекает через ``DISPATCH_LEASE_SECONDS``: если воркер упал,
+    напоминание заберет другой. Напоминания, опоздавшие больше чем на
+    ``CATCHUP_GRACE_MINUTES``, не берутся: их закрывает восстановление.
+    Возвращает id полученных напоминаний.
+    """
+    now = utcnow()
+    criteria = [
+        Reminder.reminder_time <= now,
+        or_(Reminder.lease_until == None, Reminder.lease_until < now),
+    ]
+    if reminder_ids is not None:
+        criteria.append(Reminder.id.in_(reminder_ids))
+    return _claim(owner, now, criteria, limit)
+
+
+def claim_chat_reminders(owner, chat_ids, until, limit=None):
+    """Берет в аренду напоминания чатов ``chat_ids``, наступающие до ``until``.
+
+    Нужна сводке (см. ``DeliveryPipeline``): напоминания чата, которые
+    наступят в пределах ``DIGEST_WINDOW_SECONDS``, уходят одним сообщением
+    с уже наступившими. Напоминания, которые этот воркер уже арендовал,
+    тоже возвращаются.
+    """
+    now = utcnow()
+    criteria = [
+        Reminder.chat_id.in_(chat_ids),
+        Reminder.reminder_time <= until,
+        or_(Reminder.lease_until == None, Reminder.lease_until < now, Reminder.lease_owner == owner),
+    ]
+    return _claim(owner, now, criteria, limit)
+
+
+def _claim(owner, now, criteria, limit=None):
+    lease_until = now + timedelta(seconds=config.DISPATCH_LEASE_SECONDS)
+    candidates = select(Reminder.id).where(
+        Reminder.is_sent == False,
+        Reminder.reminder_time >= now - timedelta(minutes=config.CATCHUP_GRACE_MINUTES),
+        *criteria
+    ).order_by(
+        Reminder.reminder_time
+    ).limit(limit or config.DISPATCH_CLAIM_LIMIT)
+
+    db_session = SessionLocal()
+    try:
+        if db_session.bind.dialect.name == 'postgresql':
+            # Параллельные воркеры пропускают строки, уже захваченные другими
+            claimed = db_session.execute(
+                update(Reminder)
+                .where(Reminder.id.in_(candidates.with_for_update(skip_locked=True).scalar_subquery()))
+                .values(lease_owner=owner, lease_until=lease_until)
+                .returning(Reminder.id)
+            ).scalars().all()
+        else:
+            # SQLite: один UPDATE сериализуется блокировкой базы и заново
+            # проверяет условие аренды, поэтому строку получит только один воркер
+            db_session.execute(
+                update(Reminder)
+                .where(Reminder.id.in_(candidates.scalar_subquery()))
+                .values(lease_owner=owner, lease_until=lease_until)
+                .execution_options(synchronize_session=False)
+            )
+            claimed = db_session.execute(
+                select(Reminder.id).where(
+                    Reminder.lease_owner == owner,
+                    Reminder.lease_until == lease_until,
+                    Reminder.is_sent == False
+                )
+            ).scalars().all()
+        db_session.commit()
+        return claimed
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка при аренде напоминаний: {e}")
+        return []
+    finally:
+        db_session.close()
+
+
+class ReminderDispatcher:
+    """Диспетчер напоминаний на min-heap.
+
+    В памяти держит только напоминания ближайших ``window_minutes`` минут,
+    более поздние подгружаются из таблицы ``reminders`` по мере приближения,
+    поэтому память не зависит от общего числа будущих напоминаний.
+    Наступившие напоминания арендуются в базе (см. :func:`claim_due_reminders`)
+    и передаются в ``callback`` списком id, поэтому несколько процессов
+    могут работать с одной базой без повторной отправки.
+    """
+
+    def __init__(self, callback, window_minutes=None, owner=None):
+        self._callback = callback
+        self.owner = owner or config.WORKER_ID
+        self._window = timedelta(minutes=window_minutes or config.DISPATCH_WINDOW_MINUTES)
+        self._heap = []
+        self._scheduled = {}
+        self._horizon = None
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def start(self):
+        """Запускает поток диспетчера"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='reminder-dispatcher', daemon=True)
+        self._thread.start()
+        logger.info("Диспетчер напоминаний запущен")
+
+    def shutdown(self):
+        """Останавливает поток диспетчера"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def schedule(self, reminder_id, reminder_time):
+        """Ставит напоминание в очередь, если оно попадает в текущее окно.
+
+        Более поздние напоминания не держим в памяти: они будут загружены
+        из базы при следующем пополнении окна.
+        """
+        with self._cond:
+            if self._horizon is None or reminder_time > self._horizon:
+                return False
+            self._push(reminder_id, reminder_time)
+            self._cond.notify()
+            return True
+
+    def schedule_many(self, reminders):
+        """Ставит в очередь пачку пар ``(id, время)`` за один захват блокировки.
+
+        Возвращает число напоминаний, попавших в текущее окно.
+        """
+        with self._cond:
+            if self._horizon is None:
+                return 0
+            scheduled = 0
+            for reminder_id, reminder_time in reminders:
+                if reminder_time <= self._horizon:
+                    self._push(reminder_id, reminder_time)
+                    scheduled += 1
+            if scheduled:
+                self._cond.notify()
+            return scheduled
+
+    def cancel(self, reminder_id):
+        """Снимает напоминание с очереди"""
+        with self._cond:
+            return self._scheduled.pop(reminder_id, None) is not None
+
+    def cancel_many(self, reminder_ids):
+        """Снимает с очереди пачку напоминаний за один захват блокировки"""
+        with self._cond:
+            return sum(self._scheduled.pop(reminder_id, None) is not None for reminder_id in reminder_ids)
+
+    def _push(self, reminder_id, reminder_time):
+        if self._scheduled.get(reminder_id) == reminder_time:
+            return
+        self._scheduled[reminder_id] = reminder_time
+        heapq.heappush(self._heap, (reminder_time, reminder_id))
+
+    def _refill(self):
+        """Подгружает из базы напоминания следующего окна"""
+        with self._cond:
+            start = self._horizon or utcnow()
+            horizon = utcnow() + self._window
+            # Сдвигаем горизонт до запроса: напоминания, созданные во время
+            # загрузки, попадут в очередь через schedule(), дубли отсечет _push
+            self._horizon = horizon
+
+        loaded = 0
+        db_session = SessionLocal()
+        try:
+            # Читаем окно потоком, пачками по RECOVERY_CHUNK строк
+            result = db_session.execute(
+                select(Reminder.id, Reminder.reminder_time).where(
+                    Reminder.is_sent == False,
+                    Reminder.reminder_time > start,
+                    Reminder.reminder_time <= horizon
+                ).execution_options(stream_results=True)
+            )
+            for rows in result.partitions(config.RECOVERY_CHUNK):
+                with self._cond:
+                    for reminder_id, reminder_time in rows:
+                        self._push(reminder_id, reminder_time)
+                    self._cond.notify()
+                loaded += len(rows)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке окна напоминаний: {e}")
+            with self._cond:
+                self._horizon = start
+            return
+        finally:
+            db_session.close()
+        logger.info(f"Загружено {loaded} напоминаний до {horizon}")
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            reminder_time, reminder_id = heapq.heappop(self._heap)
+            # Отмененные и перенесенные записи удаляем лениво
+            if self._scheduled.get(reminder_id) == reminder_time:
+                del self._scheduled[reminder_id]
+                due.append(reminder_id)
+        return due
+
+    def _run(self):
+        next_refill = next_sweep = utcnow()
+        while True:
+            if utcnow() >= next_refill:
+                self._refill()
+                next_refill = utcnow() + self._window / 2
+
+            with self._cond:
+                if not self._running:
+                    break
+                now = utcnow()
+                due = self._pop_due(now)
+                sweep = now >= next_sweep
+                if not due and not sweep:
+                    wake_at = min(next_refill, next_sweep)
+                    if self._heap:
+                        wake_at = min(wake_at, self._heap[0][0])
+                    self._cond.wait(max((wake_at - now).total_seconds(), 0))
+                    continue
+
+            claimed = claim_due_reminders(self.owner, due) if due else []
+            if sweep:
+                # Подбираем напоминания, созданные другими воркерами внутри
+                # текущего окна или брошенные упавшими воркерами
+                swept = claim_due_reminders(self.owner)
+                claimed += swept
+                # Если взяли полную пачку, сразу добираем следующую
+                if len(swept) < config.DISPATCH_CLAIM_LIMIT:
+                    next_sweep = utcnow() + timedelta(seconds=config.DISPATCH_SWEEP_SECONDS)
+
+            if claimed:
+                try:
+                    self._callback(claimed)
+                except Exception as e:
+                    logger.error(f"Ошибка при передаче напоминаний {claimed} на отправку: {e}")
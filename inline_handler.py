@@ -1,92 +1,176 @@
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from functools import lru_cache
+
 from telegram import Update, InlineQueryResultArticle, InputTextMessageContent
 from telegram.ext import ContextTypes, InlineQueryHandler
-import uuid
-from datetime import datetime, timedelta
-from reminders import create_reminder, calculate_time_from_text
-from keyboards import get_inline_quick_reminders
+from reminders import calculate_time_from_text
+from repository import create_reminder, get_inline_text, get_user_zone, remember_inline_texts
+from keyboards import get_inline_quick_reminders, get_inline_time_suggestion_keyboard
+from timezones import local_now, to_local, to_utc
+import config
+import time_parser
+
+# Быстрые варианты: заголовок, описание, время в тексте сообщения
+QUICK_OPTIONS = (
+    ("quick_1h", "⏰ Напомнить через 1 час", "Напомнить: {}", "Через 1 час"),
+    ("quick_3h", "⏰ Напомнить через 3 часа", "Напомнить: {}", "Через 3 часа"),
+    ("custom", "✏️ Настроить время", "Установить свое время для: {}", "Настроить время"),
+)
+
+# id последнего инлайн-запроса каждого пользователя, ожидающего ответа
+_pending_queries = {}
+
+def _result_id(kind, text):
+    """Детерминированный id результата: одинаковый для одинакового запроса"""
+    return hashlib.blake2b(f"{kind}\0{text}".encode(), digest_size=16).hexdigest()
+
+def _text_key(text):
+    """Короткий ключ текста напоминания для callback_data (не больше 64 байт)"""
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+@lru_cache(maxsize=4096)
+def _quick_results(text):
+    keyboard = get_inline_quick_reminders(_text_key(text))
+    return tuple(
+        InlineQueryResultArticle(
+            id=_result_id(kind, text),
+            title=title,
+            description=description.format(text),
+            input_message_content=InputTextMessageContent(
+                f"🔔 Напоминание: {text}\n\n⏰ Время: {time_label}"
+            ),
+            reply_markup=keyboard
+        )
+        for kind, title, description, time_label in QUICK_OPTIONS
+    )
+
+@lru_cache(maxsize=4096)
+def _time_suggestion(text, now, zone):
+    """Вариант со временем, найденным в самом запросе («купить хлеб завтра в 10»).
+
+    ``now`` — местное время пояса ``zone``; в кнопке время передается как
+    метка UTC, поэтому вариант зависит от пояса. Возвращает пару
+    ``(результат, текст напоминания)`` или None.
+    """
+    reminder_time, span = time_parser.find(text, now)
+    if reminder_time is None or reminder_time <= now:
+        return None
+
+    # span относится к нормализованному тексту; если нормализация изменила
+    # только регистр, вырезаем найденное время из исходного текста
+    collapsed = ' '.join(text.split())
+    normalized = time_parser.normalize(text)
+    source = collapsed if len(collapsed) == len(normalized) else normalized
+    reminder_text = ' '.join((source[:span[0]] + source[span[1]:]).split()).strip(' ,.-') or collapsed
+    time_str = reminder_time.strftime('%d.%m.%Y %H:%M')
+
+    return InlineQueryResultArticle(
+        id=_result_id(f"time_{time_str}", text),
+        title=f"🕒 {time_str}",
+        description=f"Напомнить: {reminder_text}",
+        input_message_content=InputTextMessageContent(
+            f"🔔 Напоминание: {reminder_text}\n\n⏰ Время: {time_str}"
+        ),
+        reply_markup=get_inline_time_suggestion_keyboard(
+            int(to_utc(reminder_time, zone).replace(tzinfo=timezone.utc).timestamp()),
+            _text_key(reminder_text)
+        )
+    ), reminder_text
+
+def build_inline_results(text, zone, now=None):
+    """Результаты инлайн-запроса в поясе ``zone``; одинаковые запросы в пределах минуты не пересобираются.
+
+    Возвращает пару ``(результаты, тексты)``: тексты по ключам из кнопок
+    нужно сохранить до их нажатия (см. :func:`repository.remember_inline_texts`).
+    """
+    now = (now or local_now(zone)).replace(second=0, microsecond=0)
+    suggestion = _time_suggestion(text, now, zone)
+    results = _quick_results(text)
+    texts = {_text_key(text): text}
+    if suggestion is None:
+        return results, texts
+    article, reminder_text = suggestion
+    texts[_text_key(reminder_text)] = reminder_text
+    return (article,) + results, texts
 
 async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка инлайн-запросов"""
-    query = update.inline_query.query
+    inline_query = update.inline_query
+    query = inline_query.query.strip()
     
     if not query:
         return
+
+    # Пока пользователь печатает, Telegram шлет запрос на каждую букву:
+    # отвечаем только на последний. Без параллельной обработки обновлений
+    # ожидание лишь задержало бы очередь, поэтому там оно не нужно
+    user_id = inline_query.from_user.id
+    if config.INLINE_DEBOUNCE_SECONDS and context.application.concurrent_updates > 1:
+        _pending_queries[user_id] = inline_query.id
+        await asyncio.sleep(config.INLINE_DEBOUNCE_SECONDS)
+        if _pending_queries.get(user_id) != inline_query.id:
+            return
+        del _pending_queries[user_id]
     
-    results = []
-    
-    # Быстрые напоминания
-    quick_reminders = [
-        {
-            "title": "⏰ Напомнить через 1 час",
-            "description": f"Напомнить: {query}",
-            "time_data": "inline_1h"
-        },
-        {
-            "title": "⏰ Напомнить через 3 часа", 
-            "description": f"Напомнить: {query}",
-            "time_data": "inline_3h"
-        },
-        {
-            "title": "✏️ Настроить время",
-            "description": f"Установить свое время для: {query}",
-            "time_data": "inline_custom"
-        }
-    ]
-    
-    for reminder in quick_reminders:
-        results.append(
-            InlineQueryResultArticle(
-                id=str(uuid.uuid4()),
-                title=reminder["title"],
-                description=reminder["description"],
-                input_message_content=InputTextMessageContent(
-                    f"🔔 Напоминание: {query}\n\n"
-                    f"⏰ Время: {reminder['title'].replace('⏰ ', '').replace('✏️ ', '')}"
-                ),
-                reply_markup=get_inline_quick_reminders()
-            )
-        )
-    
-    await update.inline_query.answer(results, cache_time=1)
+    results, texts = build_inline_results(query, await get_user_zone(user_id))
+    await remember_inline_texts(texts)
+    await inline_query.answer(
+        results,
+        cache_time=config.INLINE_CACHE_TIME,
+        # Время из запроса посчитано в поясе пользователя: такой ответ
+        # Telegram не должен отдавать из кэша другим пользователям
+        is_personal=config.INLINE_IS_PERSONAL or len(results) > len(QUICK_OPTIONS)
+    )
 
 async def handle_inline_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка callback от инлайн-кнопок"""
+    """Обработка callback от кнопок под сообщениями инлайн-режима.
+
+    У такого нажатия нет ``query.message``, только ``inline_message_id``:
+    владелец — нажавший пользователь, напоминание приходит ему в личный чат,
+    текст берется из хранилища по ключу из кнопки, а сообщение меняется
+    через ``inline_message_id``.
+    """
     query = update.callback_query
+    
+    if query.data == "inline_custom":
+        await query.answer(
+            "⏰ Напишите боту в личные сообщения и укажите время, например:\n"
+            "• Через 2 часа\n"
+            "• Завтра в 15:30\n"
+            "• 20.12.2023 18:00",
+            show_alert=True
+        )
+        return
     await query.answer()
     
     user_id = query.from_user.id
-    chat_id = query.message.chat_id
-    message_text = query.message.text
+    time_key, _, text_key = query.data.rpartition('_')
+    reminder_text = await get_inline_text(text_key)
+    if reminder_text is None:
+        await query.edit_message_text("❌ Кнопка устарела: повторите инлайн-запрос")
+        return
     
-    # Извлекаем текст напоминания из сообщения
-    reminder_text = message_text.replace("🔔 Напоминание: ", "").split("\n\n")[0]
+    # Создаем напоминание для быстрых вариантов или времени из запроса
+    zone = await get_user_zone(user_id)
+    if time_key.startswith("inline_t_"):
+        reminder_time = datetime.fromtimestamp(int(time_key[len("inline_t_"):]), timezone.utc).replace(tzinfo=None)
+    else:
+        local_time = calculate_time_from_text(time_key, local_now(zone))
+        reminder_time = to_utc(local_time, zone) if local_time else None
     
-    if query.data.startswith("inline_"):
-        time_key = query.data
+    if reminder_time:
+        reminder_id = await create_reminder(user_id, user_id, reminder_text, reminder_time)
         
-        if time_key == "inline_custom":
-            await query.message.reply_text(
-                "⏰ Введите время для напоминания в формате:\n"
-                "• Через 2 часа\n" 
-                "• Завтра в 15:30\n"
-                "• 20.12.2023 18:00"
+        if reminder_id:
+            await query.edit_message_text(
+                f"✅ Напоминание создано!\n\n"
+                f"📝 Текст: {reminder_text}\n"
+                f"⏰ Время: {to_local(reminder_time, zone).strftime('%d.%m.%Y %H:%M')}",
+                reply_markup=None
             )
-            return
-        
-        # Создаем напоминание для быстрых вариантов
-        reminder_time = calculate_time_from_text(time_key)
-        
-        if reminder_time:
-            reminder_id = create_reminder(user_id, chat_id, reminder_text, reminder_time)
-            
-            if reminder_id:
-                await query.edit_message_text(
-                    f"✅ Напоминание создано!\n\n"
-                    f"📝 Текст: {reminder_text}\n"
-                    f"⏰ Время: {reminder_time.strftime('%d.%m.%Y %H:%M')}",
-                    reply_markup=None
-                )
-            else:
-                await query.edit_message_text("❌ Ошибка при создании напоминания")
         else:
-            await query.edit_message_text("❌ Не удалось распознать время")
+            await query.edit_message_text("❌ Ошибка при создании напоминания")
+    else:
+        await query.edit_message_text("❌ Не удалось распознать время")
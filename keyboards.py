@@ -37,15 +37,60 @@ def get_reminder_actions_keyboard(reminder_id):
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_inline_quick_reminders():
-    """Инлайн-кнопки для быстрых напоминаний в инлайн-режиме"""
+def get_digest_actions_keyboard(reminder_ids):
+    """Инлайн-кнопки сводки: ✅/❌ каждого напоминания с его номером в сводке"""
+    keyboard = [
+        [InlineKeyboardButton(f"{number}. {button.text}", callback_data=button.callback_data) for button in row]
+        for number, reminder_id in enumerate(reminder_ids, 1)
+        for row in get_reminder_actions_keyboard(reminder_id).inline_keyboard
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def is_digest_keyboard(reply_markup):
+    """Кнопки сводки подписаны номерами напоминаний"""
+    return reply_markup is not None and any(
+        button.text[:1].isdigit() for row in reply_markup.inline_keyboard for button in row
+    )
+
+def get_reminders_page_keyboard(reminders, page, prev_page=None, next_page=None):
+    """Инлайн-кнопки страницы «Мои напоминания».
+
+    ``page``, ``prev_page`` и ``next_page`` — закодированные курсоры текущей,
+    предыдущей и следующей страниц; удаление перерисовывает текущую страницу.
+    """
+    keyboard = [
+        [InlineKeyboardButton(f"❌ {number}. {reminder.reminder_text[:24]}",
+                              callback_data=f"list_del_{reminder.id}_{page}")]
+        for number, reminder in enumerate(reminders, 1)
+    ]
+    navigation = []
+    if prev_page:
+        navigation.append(InlineKeyboardButton("◀", callback_data=f"list_prev_{prev_page}"))
+    if next_page:
+        navigation.append(InlineKeyboardButton("▶", callback_data=f"list_next_{next_page}"))
+    if navigation:
+        keyboard.append(navigation)
+    return InlineKeyboardMarkup(keyboard)
+
+def get_inline_quick_reminders(text_key):
+    """Инлайн-кнопки для быстрых напоминаний в инлайн-режиме; ``text_key`` — ключ текста запроса"""
     keyboard = [
         [
-            InlineKeyboardButton("⏰ Через 1 час", callback_data="inline_1h"),
-            InlineKeyboardButton("⏰ Через 3 часа", callback_data="inline_3h")
+            InlineKeyboardButton("⏰ Через 1 час", callback_data=f"inline_1h_{text_key}"),
+            InlineKeyboardButton("⏰ Через 3 часа", callback_data=f"inline_3h_{text_key}")
         ],
         [
             InlineKeyboardButton("📝 Свое время", callback_data="inline_custom")
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
+
+def get_inline_time_suggestion_keyboard(timestamp, text_key):
+    """Инлайн-кнопки для времени, распознанного в тексте инлайн-запроса"""
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ Создать", callback_data=f"inline_t_{timestamp}_{text_key}"),
+            InlineKeyboardButton("📝 Свое время", callback_data="inline_custom")
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
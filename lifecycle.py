@@ -0,0 +1,232 @@
+"""Запуск и остановка бота.
+
+Импорт модулей проекта не подключается к базе, не создает ботов и не
+запускает потоков, поэтому служебные скрипты и бенчмарки стартуют быстро.
+Все это делает :class:`Lifecycle` — по шагам и в таком порядке:
+
+1. ``engine`` — проверка соединения с базой;
+2. ``schema`` — недостающие таблицы, колонки и индексы;
+3. ``bot_api`` — инициализация Application: общий HTTP-пул Bot API
+   (см. bot_api.py), через который шлют и обработчики, и пайплайн отправки;
+4. ``scheduler`` — групповая запись, пайплайн отправки, диспетчер и архивация;
+5. ``recovery`` — восстановление просроченных напоминаний (в фоне);
+6. ``bot`` — прием обновлений в режиме webhook или polling.
+
+Останавливается все в обратном порядке: бот перестает принимать обновления,
+затем пайплайн до ``SHUTDOWN_DRAIN_SECONDS`` досылает уже взятые
+напоминания, и только потом закрывается HTTP-пул. Тяжелые модули (telegram, обработчики) импортируются внутри
+шагов. Длительность каждого шага попадает в лог и метрику
+``helotime_startup_seconds``.
+"""
+import asyncio
+import logging
+import signal
+import time
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = metrics.Gauge('helotime_startup_seconds', 'Длительность шагов запуска', ('step',))
+
+
+def build_application(webhook=False):
+    """Application с обработчиками бота — одна сборка для webhook и polling.
+
+    Для webhook обновления приходят без Updater, а очередь ограничена,
+    чтобы при перегрузке отвечать Telegram 503, а не копить память.
+    """
+    from telegram.ext import Application
+
+    from bot import setup_handlers
+    from bot_api import PriorityRateLimiter, build_requests
+    from persistence import SQLPersistence
+
+    request, get_updates_request = build_requests()
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .base_url(config.BOT_API_URL)
+        .request(request)
+        .get_updates_request(get_updates_request)
+    )
+    if config.BOT_API_RATE:
+        # Ответы пользователям и отправка напоминаний делят один лимит Bot API
+        builder = builder.rate_limiter(PriorityRateLimiter())
+    if webhook:
+        builder = (
+            builder.updater(None)
+            .update_queue(asyncio.Queue(maxsize=config.WEBHOOK_QUEUE_SIZE))
+            .concurrent_updates(config.WEBHOOK_CONCURRENCY)
+        )
+    if config.PERSISTENCE_ENABLED:
+        # Состояние диалогов в базе: обновления пользователя может обработать любая реплика
+        builder = builder.persistence(SQLPersistence())
+    application = builder.build()
+    setup_handlers(application)
+    return application
+
+
+class Lifecycle:
+    """Упорядоченный запуск и остановка компонентов бота"""
+
+    def __init__(self, webhook=False):
+        self.webhook = webhook
+        self.timings = {}
+        self._application = None
+        self._stops = []
+
+    @property
+    def application(self):
+        if self._application is None:
+            self._application = build_application(self.webhook)
+        return self._application
+
+    async def start(self):
+        steps = (
+            ('engine', self._start_engine, self._stop_engine),
+            ('schema', self._check_schema, None),
+            ('bot_api', self._start_bot_api, self._stop_bot_api),
+            ('scheduler', self._start_scheduler, self._stop_scheduler),
+            ('recovery', self._start_recovery, None),
+            ('bot', self._start_bot, self._stop_bot),
+        )
+        started = time.perf_counter()
+        try:
+            for name, start, stop in steps:
+                step_started = time.perf_counter()
+                await start()
+                self.timings[name] = time.perf_counter() - step_started
+                STARTUP_SECONDS.labels(name).set(self.timings[name])
+                if stop is not None:
+                    self._stops.append((name, stop))
+        except Exception:
+            logger.exception(f"Ошибка на шаге запуска {name}, останавливаем запущенное")
+            await self.stop()
+            raise
+        logger.info(
+            f"Бот запущен за {time.perf_counter() - started:.2f} с ("
+            + ", ".join(f"{name} {elapsed:.2f}" for name, elapsed in self.timings.items()) + ")"
+        )
+
+    async def stop(self):
+        while self._stops:
+            name, stop = self._stops.pop()
+            try:
+                await stop()
+            except Exception as e:
+                logger.error(f"Ошибка при остановке {name}: {e}")
+        logger.info("Бот остановлен")
+
+    def run(self):
+        """Polling: запускает бота и работает до SIGINT или SIGTERM"""
+        asyncio.run(self._run_until_signal())
+
+    async def _run_until_signal(self):
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping.set)
+        await self.start()
+        try:
+            await stopping.wait()
+        finally:
+            await self.stop()
+
+    # --- Шаги ---
+
+    async def _start_engine(self):
+        from sqlalchemy import text
+
+        from database import engine
+
+        def ping():
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+
+        await asyncio.to_thread(ping)
+
+    async def _stop_engine(self):
+        from database import engine
+
+        engine.dispose()
+
+    async def _check_schema(self):
+        from database import init_schema
+
+        await asyncio.to_thread(init_schema)
+
+    async def _start_bot_api(self):
+        # Открывает пулы запросов и проверяет токен (getMe)
+        await self.application.initialize()
+
+    async def _stop_bot_api(self):
+        # Application.shutdown закрывает HTTP-пулы и дописывает состояние диалогов
+        await self.application.shutdown()
+
+    async def _start_scheduler(self):
+        import reminders
+
+        reminders.writer.start()
+        await reminders.delivery.start_async(self.application.bot)
+        reminders.dispatcher.start()
+        reminders.compactor.start()
+
+    async def _stop_scheduler(self):
+        import reminders
+
+        # Сначала перестаем выдавать наступившие напоминания, затем
+        # досылаем взятые и дописываем принятые вставки
+        await asyncio.to_thread(reminders.dispatcher.shutdown)
+        queued = reminders.delivery.queue_size
+        started = time.perf_counter()
+        if await reminders.delivery.stop_async(timeout=config.SHUTDOWN_DRAIN_SECONDS):
+            logger.info(f"Отправка остановлена: дослано {queued} из очереди за {time.perf_counter() - started:.2f} с")
+        else:
+            logger.warning(
+                f"Отправка не завершилась за {config.SHUTDOWN_DRAIN_SECONDS} с, "
+                f"в очереди {reminders.delivery.queue_size}; их подберут после истечения аренды"
+            )
+
+        def flush():
+            reminders.writer.shutdown()
+            reminders.compactor.shutdown()
+
+        await asyncio.to_thread(flush)
+
+    async def _start_recovery(self):
+        from reminders import start_recovery
+
+        # Бот принимает обновления, не дожидаясь восстановления
+        start_recovery()
+
+    async def _start_bot(self):
+        application = self.application
+        await application.start()
+        if self.webhook:
+            await self._setup_webhook()
+        else:
+            await application.updater.start_polling()
+
+    async def _setup_webhook(self):
+        from telegram import Update
+
+        try:
+            await self.application.bot.set_webhook(
+                config.WEBHOOK_URL,
+                secret_token=config.WEBHOOK_SECRET,
+                max_connections=min(config.WEBHOOK_CONCURRENCY, 100),
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"Webhook set to: {config.WEBHOOK_URL}")
+        except Exception as e:
+            logger.error(f"Error setting webhook: {e}")
+
+    async def _stop_bot(self):
+        application = self.application
+        if application.updater is not None and application.updater.running:
+            await application.updater.stop()
+        # Application.stop дожидается обработки принятых обновлений;
+        # HTTP-пул нужен пайплайну отправки и закрывается шагом bot_api
+        await application.stop()
@@ -0,0 +1,261 @@
+"""Метрики в текстовом формате Prometheus.
+
+Счетчики, gauge и гистограммы живут в памяти процесса и отдаются через
+``/metrics`` (см. app.py). Запись метрики — один захват блокировки и
+несколько арифметических операций, поэтому ее можно звать на горячем пути;
+стоимость измеряет ``benchmarks/bench_metrics.py``.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._function = function
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def labels(self, *values):
+        """Дочерняя метрика для набора значений меток"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        if self._function is not None:
+            yield self.name, '', self._function()
+            return
+        for values, child in list(self._children.items()):
+            yield from child.samples(self.name, _format_labels(self.labelnames, values), values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self._samples())
+        return '\n'.join(lines)
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels, values):
+        yield name, labels, self.value
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Контекстный менеджер, записывающий длительность блока"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_started')
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._started)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames, function)
+        self._default = None if self.labelnames or function else self.labels()
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Текущее значение; ``function`` вычисляет его в момент выгрузки"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames, function)
+        self._default = None if self.labelnames or function else self.labels()
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+        self._default = None if self.labelnames else self.labels()
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, values, (('le', _format_value(float(bound))),))
+                yield f'{self.name}_bucket', labels, cumulative
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+# --- Метрики бота ---
+
+HANDLER_SECONDS = Histogram('helotime_handler_seconds', 'Время обработки обновления', ['handler'])
+HANDLER_ERRORS = Counter('helotime_handler_errors_total', 'Исключения в обработчиках', ['handler'])
+DB_QUERY_SECONDS = Histogram('helotime_db_query_seconds', 'Время SQL-запроса', ['statement'])
+SEND_SECONDS = Histogram('helotime_send_seconds', 'Время вызова sendMessage для напоминания')
+DISPATCH_LAG_SECONDS = Histogram(
+    'helotime_dispatch_lag_seconds', 'Задержка отправки относительно reminder_time', buckets=LAG_BUCKETS
+)
+REMINDERS_SENT = Counter('helotime_reminders_sent_total', 'Отправленные напоминания')
+REMINDERS_FAILED = Counter('helotime_reminders_failed_total', 'Напоминания, которые не удалось отправить')
+TELEGRAM_ERRORS = Counter('helotime_telegram_errors_total', 'Ошибки Bot API при отправке', ['error'])
+DELIVERY_RETRIES = Counter('helotime_delivery_retries_total', 'Повторные попытки отправки')
+
+
+def instrument_handler(callback):
+    """Оборачивает обработчик PTB: время и исключения по имени функции"""
+    histogram = HANDLER_SECONDS.labels(callback.__name__)
+    errors = HANDLER_ERRORS.labels(callback.__name__)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def instrument_engine(engine):
+    """Замеряет время каждого SQL-запроса движка по виду запроса"""
+    children = {}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        kind = statement.lstrip()[:6].upper()
+        histogram = children.get(kind)
+        if histogram is None:
+            histogram = children[kind] = DB_QUERY_SECONDS.labels(
+                kind if kind in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+            )
+        histogram.observe(elapsed)
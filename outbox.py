@@ -0,0 +1,232 @@
+"""Outbox доставок напоминаний.
+
+Каждое срабатывание напоминания — пара ``(reminder_id, scheduled_for)`` —
+получает строку в ``deliveries`` до вызова Bot API. Статусы:
+
+* ``sending`` — идет отправка, строка арендована воркером до ``lease_until``;
+* ``sent`` — сообщение доставлено, сохранен ``message_id``;
+* ``pending`` — попытка не удалась, следующая не раньше ``next_retry_at``;
+* ``dead`` — недоставляемо или исчерпаны ``OUTBOX_MAX_ATTEMPTS`` попыток.
+
+Исход отправки записывается отдельным коммитом сразу после вызова API и
+до закрытия напоминания. Если закрыть напоминание не удалось, при
+повторной аренде оно найдется в outbox и второй раз не уйдет. Повторы
+выполняет :class:`~delivery.DeliveryPipeline`: пачками арендует строки
+``pending`` с наступившим ``next_retry_at`` и строки ``sending`` с
+истекшей арендой (воркер упал посреди отправки).
+"""
+import logging
+import random
+from datetime import timedelta
+
+from sqlalchemy import and_, func, insert, or_, select, update
+
+from database import SessionLocal, Delivery
+from timezones import utcnow
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SENDING = 'sending'
+SENT = 'sent'
+PENDING = 'pending'
+DEAD = 'dead'
+STATUSES = (SENDING, SENT, PENDING, DEAD)
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: экспонента с разбросом ±20%.
+
+    Разброс не дает повторам после общего сбоя прийти одной волной.
+    """
+    delay = min(config.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), config.OUTBOX_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def outcome(delivery_id, attempts, result, detail):
+    """Изменения строки outbox по результату ``DeliveryPipeline._send``"""
+    if result is True:
+        return {'id': delivery_id, 'status': SENT, 'message_id': detail, 'next_retry_at': None, 'last_error': None}
+    if result is None or attempts >= config.OUTBOX_MAX_ATTEMPTS:
+        return {'id': delivery_id, 'status': DEAD, 'next_retry_at': None, 'last_error': detail}
+    return {
+        'id': delivery_id, 'status': PENDING, 'last_error': detail,
+        'next_retry_at': utcnow() + timedelta(seconds=retry_delay(attempts)),
+    }
+
+
+def open_deliveries(owner, reminders):
+    """Заводит строки outbox для срабатываний пачки перед отправкой.
+
+    Возвращает словарь ``reminder_id → id строки`` только для новых
+    срабатываний. Уже известными срабатываниями распоряжается outbox
+    (отправлено, ждет повтора или dead), поэтому отправлять их нельзя.
+    """
+    if not reminders:
+        return {}
+    now = utcnow()
+    lease_until = now + timedelta(seconds=config.DISPATCH_LEASE_SECONDS)
+    occurrences = select(Delivery.reminder_id, Delivery.scheduled_for, Delivery.id).where(
+        Delivery.reminder_id.in_([reminder.id for reminder in reminders]),
+        Delivery.scheduled_for.in_(list({reminder.reminder_time for reminder in reminders}))
+    )
+
+    db_session = SessionLocal()
+    try:
+        existing = {(reminder_id, scheduled_for) for reminder_id, scheduled_for, _ in db_session.execute(occurrences)}
+        fresh = [reminder for reminder in reminders if (reminder.id, reminder.reminder_time) not in existing]
+        if not fresh:
+            return {}
+        db_session.execute(insert(Delivery), [
+            {
+                'reminder_id': reminder.id, 'scheduled_for': reminder.reminder_time,
+                'user_id': reminder.user_id, 'chat_id': reminder.chat_id,
+                'reminder_text': reminder.reminder_text, 'status': SENDING, 'attempts': 1,
+                'lease_owner': owner, 'lease_until': lease_until, 'created_at': now, 'updated_at': now,
+            }
+            for reminder in fresh
+        ])
+        opened = {
+            reminder_id: delivery_id
+            for reminder_id, scheduled_for, delivery_id in db_session.execute(occurrences)
+            if (reminder_id, scheduled_for) not in existing
+        }
+        db_session.commit()
+        return opened
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def record_outcomes(outcomes):
+    """Сохраняет исходы попыток (см. :func:`outcome`) одним коммитом и снимает аренду"""
+    if not outcomes:
+        return
+    now = utcnow()
+    db_session = SessionLocal()
+    try:
+        db_session.bulk_update_mappings(Delivery, [
+            dict(mapping, lease_owner=None, lease_until=None, updated_at=now) for mapping in outcomes
+        ])
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def claim_retries(owner, limit=None):
+    """Берет в аренду строки, которым пора повторить отправку.
+
+    Попытка засчитывается при аренде, поэтому строка, на которой воркер
+    падает, тоже рано или поздно станет dead. Возвращает строки с полями,
+    которые ждет ``DeliveryPipeline._send``: ``id`` — это id напоминания,
+    id строки outbox — ``delivery_id``.
+    """
+    now = utcnow()
+    lease_until = now + timedelta(seconds=config.DISPATCH_LEASE_SECONDS)
+    candidates = select(Delivery.id).where(or_(
+        and_(Delivery.status == PENDING, Delivery.next_retry_at <= now),
+        and_(Delivery.status == SENDING, Delivery.lease_until < now),
+    )).order_by(Delivery.next_retry_at).limit(limit or config.OUTBOX_BATCH_SIZE)
+    claim = update(Delivery).values(
+        status=SENDING, attempts=Delivery.attempts + 1,
+        lease_owner=owner, lease_until=lease_until, updated_at=now
+    )
+    columns = (
+        Delivery.id.label('delivery_id'), Delivery.reminder_id.label('id'),
+        Delivery.user_id, Delivery.chat_id, Delivery.reminder_text,
+        Delivery.scheduled_for.label('reminder_time'), Delivery.attempts,
+    )
+
+    db_session = SessionLocal()
+    try:
+        if db_session.bind.dialect.name == 'postgresql':
+            claimed = db_session.execute(
+                claim.where(Delivery.id.in_(candidates.with_for_update(skip_locked=True).scalar_subquery()))
+                .returning(*columns)
+            ).all()
+        else:
+            # SQLite: как и в claim_due_reminders, UPDATE сериализуется
+            # блокировкой базы, а свои строки находим по владельцу аренды
+            db_session.execute(
+                claim.where(Delivery.id.in_(candidates.scalar_subquery()))
+                .execution_options(synchronize_session=False)
+            )
+            claimed = db_session.execute(select(*columns).where(
+                Delivery.lease_owner == owner,
+                Delivery.lease_until == lease_until,
+                Delivery.status == SENDING
+            )).all()
+        db_session.commit()
+        return claimed
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Ошибка при аренде повторов доставки: {e}")
+        return []
+    finally:
+        db_session.close()
+
+
+def _as_dict(delivery):
+    return {
+        'id': delivery.id,
+        'reminder_id': delivery.reminder_id,
+        'chat_id': delivery.chat_id,
+        'scheduled_for': delivery.scheduled_for.isoformat(),
+        'status': delivery.status,
+        'attempts': delivery.attempts,
+        'next_retry_at': delivery.next_retry_at.isoformat() if delivery.next_retry_at else None,
+        'last_error': delivery.last_error,
+        'message_id': delivery.message_id,
+        'updated_at': delivery.updated_at.isoformat(),
+    }
+
+
+def list_deliveries(status=None, reminder_id=None, chat_id=None, limit=100):
+    """Последние строки outbox для разбора инцидентов, новые первыми"""
+    if status is not None and status not in STATUSES:
+        raise ValueError(f"Неизвестный статус: {status}")
+    query = select(Delivery)
+    if status is not None:
+        query = query.where(Delivery.status == status)
+    if reminder_id is not None:
+        query = query.where(Delivery.reminder_id == reminder_id)
+    if chat_id is not None:
+        query = query.where(Delivery.chat_id == chat_id)
+    db_session = SessionLocal()
+    try:
+        return [_as_dict(delivery) for delivery in db_session.execute(
+            query.order_by(Delivery.id.desc()).limit(limit)
+        ).scalars()]
+    finally:
+        db_session.close()
+
+
+def count_by_status():
+    """Число строк outbox в каждом статусе"""
+    db_session = SessionLocal()
+    try:
+        counts = dict(db_session.query(Delivery.status, func.count()).group_by(Delivery.status))
+    finally:
+        db_session.close()
+    return {status: counts.get(status, 0) for status in STATUSES}
+
+
+def _count(status):
+    db_session = SessionLocal()
+    try:
+        # COUNT без подзапроса со всеми колонками, как у Query.count()
+        return db_session.execute(
+            select(func.count(Delivery.id)).where(Delivery.status == status)
+        ).scalar()
+    finally:
+        db_session.close()
+
+
+metrics.Gauge('helotime_outbox_pending', 'Доставки, ожидающие повтора', function=lambda: _count(PENDING))
+metrics.Gauge('helotime_outbox_dead', 'Доставки, от которых отказались', function=lambda: _count(DEAD))
@@ -0,0 +1,256 @@
+"""Хранение состояния диалогов и ``user_data`` в базе.
+
+Без него состояние ``ConversationHandler`` живет в памяти процесса: после
+перезапуска или если следующее обновление попало на другую реплику,
+пользователь теряет напоминание, которое начал создавать.
+:class:`SQLPersistence` хранит каждую запись отдельной строкой ``bot_state``
+в компактном JSON, а не перезаписывает целиком pickle всех пользователей.
+
+* Запись отложенная: PTB раз в ``PERSISTENCE_UPDATE_INTERVAL`` секунд
+  передает затронутые записи, неизменившиеся отбрасываются сравнением с
+  последним записанным JSON, остальные пишутся одной транзакцией.
+* Загрузка ленивая: при запуске ничего не читается. :meth:`SQLPersistence.sync`
+  перед обработкой обновления читает строки его пользователя и заменяет
+  локальное состояние, если их версия изменилась на другой реплике.
+  Инлайн-запросы и обновления без чата и пользователя базу не читают.
+  Диалоги, которые так синхронизируются, — :class:`SyncedConversationHandler`,
+  зарегистрированные через :meth:`SQLPersistence.register`.
+
+Хранятся только ``user_data`` и состояния диалогов с ключом по умолчанию
+``(chat_id, user_id)``. ``chat_data``, ``bot_data`` и ``callback_data``
+бот не использует.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from sqlalchemy import and_, bindparam, delete, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+
+from database import engine, BotState
+from repository import run_db
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+USER = 'user'
+CONVERSATION = 'conversation:'
+
+# Сколько последних записанных и прочитанных строк помнить для сравнения
+KNOWN_SIZE = 10000
+
+STATE_WRITES = metrics.Counter('helotime_state_writes_total', 'Строки bot_state, записанные или удаленные')
+STATE_SKIPPED = metrics.Counter('helotime_state_skipped_total', 'Изменения состояния, совпавшие с уже записанными')
+STATE_REFRESHED = metrics.Counter('helotime_state_refreshed_total', 'Записи состояния, обновленные из базы')
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _conversation_key(key):
+    return _dumps(list(key))
+
+
+class SyncedConversationHandler(ConversationHandler):
+    """ConversationHandler, состояние которого можно заменить прочитанным из базы"""
+
+    __slots__ = ()
+
+    def set_state(self, key, state):
+        """Заменяет состояние диалога ``key``; None — диалога нет"""
+        if state is None:
+            self._conversations.pop(key, None)
+        else:
+            self._conversations[key] = state
+
+
+class SQLPersistence(BasePersistence):
+    """Persistence PTB поверх таблицы ``bot_state`` (SQLite или PostgreSQL)"""
+
+    def __init__(self, update_interval=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=config.PERSISTENCE_UPDATE_INTERVAL if update_interval is None else update_interval,
+        )
+        # (kind, key) -> (JSON, версия) последней записанной или прочитанной
+        # строки; JSON None — строки нет
+        self._known = OrderedDict()
+        # Изменения, ждущие записи, и пачка, которая пишется сейчас
+        self._pending = {}
+        self._writing = {}
+        self._flush_task = None
+        # Имя диалога -> SyncedConversationHandler (см. register)
+        self._conversations = {}
+
+    def register(self, handler):
+        """Включает синхронизацию состояния диалога ``handler`` в :meth:`sync`"""
+        self._conversations[handler.name] = handler
+
+    def _remember(self, item, payload, version):
+        self._known[item] = (payload, version)
+        self._known.move_to_end(item)
+        while len(self._known) > KNOWN_SIZE:
+            self._known.popitem(last=False)
+
+    def _stage(self, item, payload):
+        """Ставит изменение в очередь, если оно отличается от записанного"""
+        known = self._pending.get(item) or self._writing.get(item) or self._known.get(item)
+        if known is not None and known[0] == payload or known is None and payload is None:
+            STATE_SKIPPED.inc()
+            return
+        self._pending[item] = (payload, time.time_ns())
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_pending())
+
+    async def _flush_pending(self):
+        # Задача запускается после всех update_* одного прохода
+        # Application.update_persistence, поэтому проход пишется одной пачкой
+        while self._pending:
+            self._writing, self._pending = self._pending, {}
+            try:
+                await run_db(self._write, self._writing)
+            except Exception as e:
+                logger.error(f"Ошибка при записи состояния бота ({len(self._writing)} записей): {e}")
+                # Более новые изменения тех же записей важнее неудавшихся
+                self._pending = {**self._writing, **self._pending}
+                self._writing = {}
+                return
+            for item, (payload, version) in self._writing.items():
+                # У удаленной строки версии нет: так ее видит и sync
+                self._remember(item, payload, version if payload is not None else None)
+            STATE_WRITES.inc(len(self._writing))
+            self._writing = {}
+
+    @staticmethod
+    def _write(batch):
+        upserts = [
+            {'kind': kind, 'key': key, 'data': payload, 'version': version}
+            for (kind, key), (payload, version) in batch.items() if payload is not None
+        ]
+        deletes = [{'b_kind': kind, 'b_key': key} for (kind, key), (payload, _) in batch.items() if payload is None]
+        with engine.begin() as conn:
+            if upserts:
+                dialect = postgresql if engine.dialect.name == 'postgresql' else sqlite
+                statement = dialect.insert(BotState)
+                conn.execute(statement.on_conflict_do_update(
+                    index_elements=[BotState.kind, BotState.key],
+                    set_={'data': statement.excluded.data, 'version': statement.excluded.version}
+                ), upserts)
+            if deletes:
+                conn.execute(delete(BotState).where(
+                    BotState.kind == bindparam('b_kind'), BotState.key == bindparam('b_key')
+                ), deletes)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _load_statement(count):
+        # Одна и та же форма запроса на каждое обновление: собираем ее один раз
+        return select(BotState.kind, BotState.key, BotState.data, BotState.version).where(or_(*(
+            and_(BotState.kind == bindparam(f'kind_{i}'), BotState.key == bindparam(f'key_{i}'))
+            for i in range(count)
+        )))
+
+    def _load(self, items):
+        params = {}
+        for i, (kind, key) in enumerate(items):
+            params[f'kind_{i}'], params[f'key_{i}'] = kind, key
+        with engine.connect() as conn:
+            return {
+                (kind, key): (data, version)
+                for kind, key, data, version in conn.execute(self._load_statement(len(items)), params)
+            }
+
+    async def sync(self, update, context):
+        """Подтягивает из базы состояние пользователя, измененное другой репликой.
+
+        Регистрируется обработчиком группы -1 (см. ``bot.setup_handlers``):
+        состояние диалога должно быть актуальным до того, как
+        ``ConversationHandler`` проверит обновление. Инлайн-запросы (их
+        шлют на каждую букву) и обновления без чата или пользователя
+        состояния не меняют, и база для них не читается.
+        """
+        if update.inline_query is not None or update.chosen_inline_result is not None:
+            return
+        user, chat = update.effective_user, update.effective_chat
+        if user is None or chat is None:
+            return
+        items = [(USER, str(user.id))]
+        items += [(CONVERSATION + name, _conversation_key((chat.id, user.id))) for name in self._conversations]
+
+        known_before = {item: self._known.get(item) for item in items}
+        stored = await run_db(self._load, items)
+        for item in items:
+            if item in self._pending or item in self._writing or self._known.get(item) is not known_before[item]:
+                # Своя незаписанная версия или записанная во время чтения новее
+                continue
+            payload, version = stored.get(item, (None, None))
+            known = self._known.get(item)
+            if known is None and payload is None or known is not None and known[1] == version:
+                continue
+            self._remember(item, payload, version)
+            STATE_REFRESHED.inc()
+            kind, key = item
+            data = json.loads(payload) if payload is not None else None
+            if kind == USER:
+                context.user_data.clear()
+                context.user_data.update(data or {})
+            else:
+                self._conversations[kind[len(CONVERSATION):]].set_state((chat.id, user.id), data)
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        self._stage((CONVERSATION + name, _conversation_key(key)), None if new_state is None else _dumps(new_state))
+
+    async def update_user_data(self, user_id, data):
+        self._stage((USER, str(user_id)), _dumps(data) if data else None)
+
+    async def drop_user_data(self, user_id):
+        self._stage((USER, str(user_id)), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def flush(self):
+        """Дописывает накопленные изменения (вызывается при остановке Application)"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        if self._pending:
+            await self._flush_pending()
@@ -0,0 +1,79 @@
+"""Компактные правила повторения напоминаний.
+
+Правило хранится строкой в ``Reminder.recurrence``:
+
+* ``D`` — каждый день;
+* ``WD`` — по будням;
+* ``W:0,3`` — по дням недели (0 — понедельник);
+* ``M:15`` — каждый месяц в указанное число (в коротких месяцах — в последний день).
+
+Время суток берется из текущего срабатывания, а следующее срабатывание
+вычисляется только при отправке, без заранее созданных экземпляров.
+"""
+from calendar import monthrange
+from datetime import datetime, timedelta
+
+from timezones import to_local, to_utc
+
+DAILY = 'D'
+WORKDAYS = 'WD'
+
+WEEKDAY_NAMES = ('понедельникам', 'вторникам', 'средам', 'четвергам', 'пятницам', 'субботам', 'воскресеньям')
+
+
+def weekly(*weekdays):
+    return 'W:' + ','.join(str(day) for day in sorted(set(weekdays)))
+
+
+def monthly(day):
+    return f'M:{day}'
+
+
+def next_occurrence(rule, hour, minute, after):
+    """Первое срабатывание правила в ``hour:minute`` строго позже ``after``"""
+    kind, _, arg = rule.partition(':')
+
+    if kind == 'M':
+        day = int(arg)
+        year, month = after.year, after.month
+        while True:
+            candidate = datetime(year, month, min(day, monthrange(year, month)[1]), hour, minute)
+            if candidate > after:
+                return candidate
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    if kind == DAILY:
+        weekdays = range(7)
+    elif kind == WORKDAYS:
+        weekdays = range(5)
+    else:
+        weekdays = {int(day) for day in arg.split(',')}
+
+    candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    for _ in range(8):
+        if candidate > after and candidate.weekday() in weekdays:
+            return candidate
+        candidate += timedelta(days=1)
+    raise ValueError(f"Некорректное правило повторения: {rule}")
+
+
+def describe(rule):
+    """Человекочитаемое описание правила"""
+    kind, _, arg = rule.partition(':')
+    if kind == DAILY:
+        return "каждый день"
+    if kind == WORKDAYS:
+        return "по будням"
+    if kind == 'M':
+        return f"каждое {arg} число"
+    return "по " + ", ".join(WEEKDAY_NAMES[int(day)] for day in arg.split(','))
+
+
+def next_occurrence_utc(rule, reminder_time, zone, after):
+    """Следующее срабатывание после ``after`` для времени в UTC.
+
+    Правило считается в местном времени пояса ``zone``: «по будням в 8:00»
+    остается 8:00 по местному времени и после перехода на летнее время.
+    """
+    local = to_local(reminder_time, zone)
+    return to_utc(next_occurrence(rule, local.hour, local.minute, max(local, to_local(after, zone))), zone)
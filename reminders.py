@@ -1,103 +1,177 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
-from telegram import Bot
-from database import SessionLocal, Reminder
+from sqlalchemy import and_, delete, func, or_, select
+from database import SessionLocal, Reminder, UserSettings
+from dispatcher import ReminderDispatcher
+from delivery import DeliveryPipeline
+from writer import ReminderWriter
+from archive import ArchiveCompactor, is_archived, purge_archive
+from cache import ReminderRecord, user_reminders, user_zones
+from timezones import get_zone, utcnow, zone_of
 import config
-from datetime import datetime, timedelta
+import metrics
+import recurrence
+import time_parser
+from datetime import timedelta
 import logging
+import threading
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=config.BOT_TOKEN)
-scheduler = BackgroundScheduler()
+# Запись, отправку, диспетчер и архивацию запускает lifecycle.py; пайплайн
+# отправки работает в event loop Application и шлет через его бота
+delivery = DeliveryPipeline(None)
 
 def send_reminder(reminder_id):
-    """Функция для отправки напоминания"""
+    """Ставит напоминание в очередь на отправку"""
+    delivery.submit([reminder_id])
+
+dispatcher = ReminderDispatcher(delivery.submit)
+
+def count_pending_reminders():
+    """Число неотправленных напоминаний (по частичному индексу)"""
     db_session = SessionLocal()
     try:
-        reminder = db_session.query(Reminder).filter_by(id=reminder_id).first()
-        
-        if reminder and not reminder.is_sent:
-            from keyboards import get_reminder_actions_keyboard
-            
-            bot.send_message(
-                chat_id=reminder.chat_id,
-                text=f"🔔 **Напоминание!**\n\n{reminder.reminder_text}",
-                reply_markup=get_reminder_actions_keyboard(reminder_id),
-                parse_mode='Markdown'
-            )
-            reminder.is_sent = True
-            db_session.commit()
-            logger.info(f"Напоминание {reminder_id} отправлено пользователю {reminder.user_id}")
-            
-    except Exception as e:
-        logger.error(f"Ошибка при отправке напоминания {reminder_id}: {e}")
+        # COUNT без подзапроса со всеми колонками, как у Query.count()
+        return db_session.execute(
+            select(func.count(Reminder.id)).where(Reminder.is_sent == False)
+        ).scalar()
     finally:
         db_session.close()
 
+metrics.Gauge('helotime_pending_reminders', 'Неотправленные напоминания в базе', function=count_pending_reminders)
+metrics.Gauge('helotime_dispatcher_scheduled', 'Напоминания в окне диспетчера', function=lambda: len(dispatcher))
+metrics.Gauge('helotime_delivery_queue_size', 'Очередь пайплайна отправки', function=lambda: delivery.queue_size)
+
 def schedule_reminder(reminder_id, reminder_time):
-    """Добавляет напоминание в планировщик"""
-    scheduler.add_job(
-        send_reminder,
-        trigger=DateTrigger(run_date=reminder_time),
-        args=[reminder_id],
-        id=f"reminder_{reminder_id}",
-        replace_existing=True
-    )
-    logger.info(f"Напоминание {reminder_id} запланировано на {reminder_time}")
-
-def create_reminder(user_id, chat_id, text, time):
-    """Создает новое напоминание"""
-    db_session = SessionLocal()
+    """Добавляет напоминание в диспетчер"""
+    if dispatcher.schedule(reminder_id, reminder_time):
+        logger.info(f"Напоминание {reminder_id} запланировано на {reminder_time}")
+
+def _on_reminders_written(rows):
+    """Сбрасывает кэш и планирует записанную пачку одним вызовом"""
+    user_reminders.invalidate(*{values['user_id'] for _, values in rows})
+    scheduled = dispatcher.schedule_many((reminder_id, values['reminder_time']) for reminder_id, values in rows)
+    logger.info(f"Записано {len(rows)} напоминаний, в окне диспетчера {scheduled}")
+
+writer = ReminderWriter(_on_reminders_written)
+compactor = ArchiveCompactor()
+
+def submit_reminder(user_id, chat_id, text, time, recurrence=None):
+    """Ставит новое напоминание в групповую запись; Future вернет его id"""
+    return writer.submit({
+        'user_id': user_id,
+        'chat_id': chat_id,
+        'reminder_text': text,
+        'reminder_time': time,
+        'recurrence': recurrence
+    })
+
+def create_reminder(user_id, chat_id, text, time, recurrence=None):
+    """Создает новое напоминание.
+
+    Для повторяющегося напоминания ``time`` — первое срабатывание,
+    ``recurrence`` — правило повторения; вся серия хранится одной строкой.
+    Запись идет через групповой писатель (см. writer.py).
+    """
     try:
-        reminder = Reminder(
-            user_id=user_id,
-            chat_id=chat_id,
-            reminder_text=text,
-            reminder_time=time
-        )
-        db_session.add(reminder)
-        db_session.commit()
-        
-        schedule_reminder(reminder.id, time)
-        return reminder.id
+        return submit_reminder(user_id, chat_id, text, time, recurrence).result()
     except Exception as e:
-        db_session.rollback()
         logger.error(f"Ошибка при создании напоминания: {e}")
         return None
-    finally:
-        db_session.close()
+
+def _reminder_records(query):
+    return tuple(ReminderRecord(*row) for row in query.with_entities(
+        Reminder.id, Reminder.chat_id, Reminder.reminder_text,
+        Reminder.reminder_time, Reminder.recurrence
+    ))
 
 def get_user_reminders(user_id):
     """Получает все напоминания пользователя"""
     db_session = SessionLocal()
     try:
-        reminders = db_session.query(Reminder).filter_by(
+        return _reminder_records(db_session.query(Reminder).filter_by(
             user_id=user_id, 
             is_sent=False
-        ).order_by(Reminder.reminder_time.asc()).all()
-        return reminders
+        ).order_by(Reminder.reminder_time.asc(), Reminder.id.asc()))
     except Exception as e:
         logger.error(f"Ошибка при получении напоминаний: {e}")
-        return []
+        return ()
     finally:
         db_session.close()
 
-def delete_reminder(reminder_id):
-    """Удаляет напоминание"""
+def get_user_reminders_page(user_id, after=None, before=None, limit=None):
+    """Получает страницу напоминаний пользователя (keyset-пагинация).
+
+    ``after`` — курсор ``(reminder_time, id)``, после которого начинается
+    страница, ``before`` — курсор, перед которым она заканчивается (листание
+    назад). Возвращает записи страницы и курсоры предыдущей и следующей
+    страниц (``None``, если листать некуда). Первая страница читается через
+    кэш (см. cache.py).
+    """
+    limit = limit or config.REMINDERS_PAGE_SIZE
+    first_page = after is None and before is None and limit == config.REMINDERS_PAGE_SIZE
+    reminders = user_reminders.get(user_id) if first_page else None
+
+    if reminders is None:
+        generation = user_reminders.generation(user_id)
+        db_session = SessionLocal()
+        try:
+            query = db_session.query(Reminder).filter_by(
+                user_id=user_id,
+                is_sent=False
+            )
+            if after is not None:
+                after_time, after_id = after
+                query = query.filter(or_(
+                    Reminder.reminder_time > after_time,
+                    and_(Reminder.reminder_time == after_time, Reminder.id > after_id)
+                ))
+            if before is not None:
+                before_time, before_id = before
+                query = query.filter(or_(
+                    Reminder.reminder_time < before_time,
+                    and_(Reminder.reminder_time == before_time, Reminder.id < before_id)
+                )).order_by(Reminder.reminder_time.desc(), Reminder.id.desc())
+            else:
+                query = query.order_by(Reminder.reminder_time.asc(), Reminder.id.asc())
+            # Лишняя строка показывает, есть ли страница дальше
+            reminders = _reminder_records(query.limit(limit + 1))
+        except Exception as e:
+            logger.error(f"Ошибка при получении страницы напоминаний: {e}")
+            return (), None, None
+        finally:
+            db_session.close()
+        if first_page:
+            user_reminders.set(user_id, reminders, generation)
+
+    more = len(reminders) > limit
+    reminders = reminders[:limit]
+    if before is not None:
+        reminders = reminders[::-1]
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = after is not None, more
+    if not reminders:
+        return reminders, None, None
+    prev_cursor = (reminders[0].reminder_time, reminders[0].id) if has_prev else None
+    next_cursor = (reminders[-1].reminder_time, reminders[-1].id) if has_next else None
+    return reminders, prev_cursor, next_cursor
+
+def delete_reminder(reminder_id, user_id=None):
+    """Удаляет напоминание; с ``user_id`` — только если оно принадлежит этому пользователю"""
     db_session = SessionLocal()
     try:
-        reminder = db_session.query(Reminder).filter_by(id=reminder_id).first()
+        query = db_session.query(Reminder).filter_by(id=reminder_id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        reminder = query.first()
         if reminder:
             db_session.delete(reminder)
             db_session.commit()
+            user_reminders.invalidate(reminder.user_id)
             
-            # Удаляем задание из планировщика
-            try:
-                scheduler.remove_job(f"reminder_{reminder_id}")
-            except Exception as e:
-                logger.warning(f"Задание планировщика для {reminder_id} не найдено: {e}")
+            # Удаляем напоминание из диспетчера
+            dispatcher.cancel(reminder_id)
             
             return True
         return False
@@ -108,63 +182,185 @@ def delete_reminder(reminder_id):
     finally:
         db_session.close()
 
+def complete_reminder(reminder_id, user_id=None):
+    """Отмечает напоминание выполненным.
+
+    Разовое напоминание удаляется, у повторяющегося серия продолжается.
+    С ``user_id`` — только напоминание этого пользователя.
+    """
+    db_session = SessionLocal()
+    try:
+        query = db_session.query(Reminder.recurrence).filter_by(id=reminder_id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        reminder = query.first()
+    finally:
+        db_session.close()
+    if reminder is None:
+        # Давно отправленное разовое напоминание уже в архиве
+        return is_archived(reminder_id, user_id)
+    if reminder.recurrence:
+        return True
+    return delete_reminder(reminder_id, user_id)
+
+def _bulk_delete(*criteria):
+    """Удаляет напоминания по условию пачками, каждая в своей короткой транзакции.
+
+    Возвращает id удаленных напоминаний; с диспетчера они снимаются
+    одним вызовом на пачку.
+    """
+    deleted_ids = []
+    while True:
+        db_session = SessionLocal()
+        try:
+            if db_session.bind.dialect.name == 'postgresql':
+                chunk = select(Reminder.id).where(*criteria).limit(config.BULK_DELETE_CHUNK)
+                ids = db_session.execute(
+                    delete(Reminder).where(Reminder.id.in_(chunk.scalar_subquery())).returning(Reminder.id)
+                ).scalars().all()
+            else:
+                # SQLite: выбираем id и удаляем их в той же транзакции
+                ids = [reminder_id for reminder_id, in db_session.query(Reminder.id).filter(
+                    *criteria
+                ).limit(config.BULK_DELETE_CHUNK)]
+                if ids:
+                    db_session.query(Reminder).filter(
+                        Reminder.id.in_(ids)
+                    ).delete(synchronize_session=False)
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+        dispatcher.cancel_many(ids)
+        deleted_ids.extend(ids)
+        if len(ids) < config.BULK_DELETE_CHUNK:
+            return deleted_ids
+
 def delete_all_user_reminders(user_id):
     """Удаляет все напоминания пользователя"""
+    try:
+        deleted = len(_bulk_delete(Reminder.user_id == user_id))
+        purge_archive(user_id=user_id)
+        return deleted
+    except Exception as e:
+        logger.error(f"Ошибка при удалении всех напоминаний пользователя {user_id}: {e}")
+        return 0
+    finally:
+        # Часть пачек могла удалиться и при ошибке
+        user_reminders.invalidate(user_id)
+
+def purge_reminders(chat_id=None, older_than=None):
+    """Служебная очистка напоминаний чата и/или старше ``older_than`` (timedelta)"""
+    criteria = []
+    if chat_id is not None:
+        criteria.append(Reminder.chat_id == chat_id)
+    if older_than is not None:
+        criteria.append(Reminder.reminder_time < utcnow() - older_than)
+    if not criteria:
+        raise ValueError("Нужно указать chat_id или older_than")
+
+    try:
+        deleted = len(_bulk_delete(*criteria)) + purge_archive(chat_id=chat_id, older_than=older_than)
+    finally:
+        # Чьи это напоминания, не знаем: сбрасываем кэш целиком
+        user_reminders.clear()
+    logger.info(f"Очистка: удалено {deleted} напоминаний (chat_id={chat_id}, старше {older_than})")
+    return deleted
+
+# Быстрые варианты времени разбираются один раз при импорте
+QUICK_TIME_SPECS = {
+    text: time_parser.parse_spec(text)
+    for text in ("⏱ Через 1 час", "⏱ Через 3 часа", "🌆 Сегодня вечером", "🌅 Завтра утром")
+}
+QUICK_TIME_SPECS.update({
+    "inline_1h": time_parser.parse_spec("через 1 час"),
+    "inline_3h": time_parser.parse_spec("через 3 часа"),
+})
+
+def calculate_time_from_text(time_text, now):
+    """Вычисляет время быстрого варианта от ``now`` (местного времени пользователя)"""
+    spec = QUICK_TIME_SPECS.get(time_text)
+    return time_parser.resolve(spec, now) if spec else None
+
+def get_user_zone(user_id):
+    """Часовой пояс пользователя (ZoneInfo); без настройки — ``DEFAULT_TIMEZONE``"""
+    zone = user_zones.get(user_id)
+    if zone is None:
+        db_session = SessionLocal()
+        try:
+            name = db_session.query(UserSettings.timezone).filter_by(user_id=user_id).scalar()
+        finally:
+            db_session.close()
+        zone = zone_of(name)
+        user_zones.set(user_id, zone)
+    return zone
+
+def set_user_zone(user_id, name):
+    """Сохраняет часовой пояс пользователя (имя IANA)"""
+    zone = get_zone(name)
     db_session = SessionLocal()
     try:
-        reminders = db_session.query(Reminder).filter_by(user_id=user_id).all()
-        count = len(reminders)
-        
-        for reminder in reminders:
-            db_session.delete(reminder)
-            # Удаляем задания из планировщика
-            try:
-                scheduler.remove_job(f"reminder_{reminder.id}")
-            except Exception:
-                pass
-        
+        db_session.merge(UserSettings(user_id=user_id, timezone=name))
         db_session.commit()
-        return count
     except Exception as e:
         db_session.rollback()
-        logger.error(f"Ошибка при удалении всех напоминаний пользователя {user_id}: {e}")
-        return 0
+        logger.error(f"Ошибка при сохранении часового пояса пользователя {user_id}: {e}")
+        return False
     finally:
         db_session.close()
-
-def calculate_time_from_text(time_text):
-    """Вычисляет время из текстового описания"""
-    now = datetime.now()
-    
-    time_mapping = {
-        "⏱ Через 1 час": now + timedelta(hours=1),
-        "⏱ Через 3 часа": now + timedelta(hours=3),
-        "🌆 Сегодня вечером": now.replace(hour=19, minute=0, second=0, microsecond=0),
-        "🌅 Завтра утром": (now + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0),
-        "inline_1h": now + timedelta(hours=1),
-        "inline_3h": now + timedelta(hours=3)
-    }
-    
-    return time_mapping.get(time_text)
+    user_zones.set(user_id, zone)
+    return True
 
 def load_unsent_reminders():
-    """Загружает все неотправленные напоминания при запуске бота"""
+    """Обрабатывает неотправленные напоминания при запуске бота.
+
+    Разовые напоминания, опоздавшие больше чем на ``CATCHUP_GRACE_MINUTES``,
+    одним UPDATE помечаются отправленными, повторяющиеся переносятся на
+    следующее срабатывание. Опоздавшие меньше доставит диспетчер, будущие
+    он подгружает сам по мере приближения их окна.
+    """
+    started = utcnow()
+    expired_before = started - timedelta(minutes=config.CATCHUP_GRACE_MINUTES)
     db_session = SessionLocal()
     try:
-        unsent_reminders = db_session.query(Reminder).filter_by(is_sent=False).all()
-        for reminder in unsent_reminders:
-            if reminder.reminder_time > datetime.now():
-                schedule_reminder(reminder.id, reminder.reminder_time)
-                logger.info(f"Загружено напоминание {reminder.id} на {reminder.reminder_time}")
-            else:
-                # Если время уже прошло, помечаем как отправленное
-                reminder.is_sent = True
+        expired = db_session.query(Reminder).filter(
+            Reminder.is_sent == False,
+            Reminder.recurrence == None,
+            Reminder.reminder_time < expired_before
+        ).update({Reminder.is_sent: True}, synchronize_session=False)
+
+        rescheduled = [
+            {'id': reminder_id, 'reminder_time': recurrence.next_occurrence_utc(
+                rule, reminder_time, zone_of(timezone), started
+            )}
+            for reminder_id, reminder_time, rule, timezone in db_session.query(
+                Reminder.id, Reminder.reminder_time, Reminder.recurrence, UserSettings.timezone
+            ).outerjoin(
+                UserSettings, UserSettings.user_id == Reminder.user_id
+            ).filter(
+                Reminder.is_sent == False,
+                Reminder.recurrence != None,
+                Reminder.reminder_time < expired_before
+            ).yield_per(config.RECOVERY_CHUNK)
+        ]
+        db_session.bulk_update_mappings(Reminder, rescheduled)
         db_session.commit()
+        user_reminders.clear()
+        logger.info(
+            f"Восстановление завершено за {(utcnow() - started).total_seconds():.2f} с, "
+            f"просрочено {expired}, перенесено повторяющихся {len(rescheduled)}"
+        )
     except Exception as e:
         logger.error(f"Ошибка при загрузке напоминаний: {e}")
         db_session.rollback()
     finally:
         db_session.close()
 
-# Запускаем планировщик
-scheduler.start()
+def start_recovery():
+    """Запускает восстановление в фоне, чтобы бот сразу принимал обновления"""
+    thread = threading.Thread(target=load_unsent_reminders, name='reminder-recovery', daemon=True)
+    thread.start()
+    return thread
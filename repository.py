@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import InlineTextCache, inline_texts, user_zones
+import config
+import reminders
+
+logger = logging.getLogger(__name__)
+
+# Ограниченный пул: синхронные запросы SQLAlchemy не блокируют event loop бота,
+# а число одновременных обращений к базе остается предсказуемым
+_executor = ThreadPoolExecutor(max_workers=config.DB_WORKERS, thread_name_prefix='db')
+
+async def run_db(func, *args):
+    """Выполняет синхронное обращение к базе в пуле потоков базы"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args))
+
+async def create_reminder(user_id, chat_id, text, time, recurrence=None):
+    """Создает новое напоминание.
+
+    Поток пула не нужен: вставка уходит групповому писателю, а его Future
+    ожидается прямо в event loop.
+    """
+    try:
+        return await asyncio.wrap_future(reminders.submit_reminder(user_id, chat_id, text, time, recurrence))
+    except Exception as e:
+        logger.error(f"Ошибка при создании напоминания: {e}")
+        return None
+
+async def get_user_reminders(user_id):
+    """Получает все напоминания пользователя"""
+    return await run_db(reminders.get_user_reminders, user_id)
+
+async def get_user_reminders_page(user_id, after=None, before=None, limit=None):
+    """Получает страницу напоминаний пользователя"""
+    return await run_db(reminders.get_user_reminders_page, user_id, after, before, limit)
+
+async def delete_reminder(reminder_id, user_id=None):
+    """Удаляет напоминание (только напоминание ``user_id``, если он задан)"""
+    return await run_db(reminders.delete_reminder, reminder_id, user_id)
+
+async def complete_reminder(reminder_id, user_id=None):
+    """Отмечает напоминание выполненным (только напоминание ``user_id``, если он задан)"""
+    return await run_db(reminders.complete_reminder, reminder_id, user_id)
+
+async def delete_all_user_reminders(user_id):
+    """Удаляет все напоминания пользователя"""
+    return await run_db(reminders.delete_all_user_reminders, user_id)
+
+async def get_user_zone(user_id):
+    """Часовой пояс пользователя; из кэша — без обращения к пулу потоков"""
+    zone = user_zones.get(user_id)
+    if zone is None:
+        zone = await run_db(reminders.get_user_zone, user_id)
+    return zone
+
+async def set_user_zone(user_id, name):
+    """Сохраняет часовой пояс пользователя"""
+    return await run_db(reminders.set_user_zone, user_id, name)
+
+async def remember_inline_texts(texts):
+    """Сохраняет тексты инлайн-запроса для кнопок; в памяти — без пула потоков"""
+    if isinstance(inline_texts, InlineTextCache):
+        inline_texts.set_many(texts)
+    else:
+        await run_db(inline_texts.set_many, texts)
+
+async def get_inline_text(key):
+    """Текст инлайн-запроса по ключу из кнопки или None, если он забыт"""
+    if isinstance(inline_texts, InlineTextCache):
+        return inline_texts.get(key)
+    return await run_db(inline_texts.get, key)
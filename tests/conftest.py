@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database создает движок при импорте: тесты работают со своей временной базой
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tests.db')}")
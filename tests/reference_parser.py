@@ -0,0 +1,51 @@
+"""Эталон для сверки time_parser: прежний bot.parse_time_input и генератор
+фраз, которые он понимал.
+"""
+import re
+from datetime import datetime, timedelta
+
+
+def old_parse_time_input(time_text, now):
+    """Прежний bot.parse_time_input (с фиксированным now)"""
+    match = re.search(r'через\s+(\d+)\s*(час|часа|часов|ч|минут|минуты|мин)', time_text.lower())
+    if match:
+        value = int(match.group(1))
+        unit = match.group(2)
+        if unit in ['час', 'часа', 'часов', 'ч']:
+            return now + timedelta(hours=value)
+        else:
+            return now + timedelta(minutes=value)
+
+    match = re.search(r'завтра\s+в\s+(\d+):(\d+)', time_text.lower())
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        tomorrow = now + timedelta(days=1)
+        return tomorrow.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    match = re.search(r'(\d{1,2})\.(\d{1,2})\.(\d{4})\s+(\d{1,2}):(\d{2})', time_text)
+    if match:
+        day, month, year, hour, minute = map(int, match.groups())
+        return datetime(year, month, day, hour, minute)
+
+    if "сегодня вечером" in time_text.lower():
+        return now.replace(hour=19, minute=0, second=0, microsecond=0)
+    elif "сегодня утром" in time_text.lower():
+        return now.replace(hour=9, minute=0, second=0, microsecond=0)
+    elif "завтра утром" in time_text.lower():
+        return (now + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    return None
+
+
+def random_phrase(rng):
+    case = rng.choice([str.lower, str.capitalize, str.upper])
+    kind = rng.randrange(5)
+    if kind == 0:
+        unit = rng.choice(['час', 'часа', 'часов', 'ч', 'минут', 'минуты', 'мин'])
+        return case(f"через {rng.randrange(1, 100)} {unit}")
+    if kind == 1:
+        return case(f"завтра в {rng.randrange(24)}:{rng.randrange(60):02d}")
+    if kind == 2:
+        return f"{rng.randrange(1, 29)}.{rng.randrange(1, 13)}.{rng.randrange(2024, 2030)} {rng.randrange(24)}:{rng.randrange(60):02d}"
+    if kind == 3:
+        return case(rng.choice(["сегодня вечером", "сегодня утром", "завтра утром"]))
+    return rng.choice(["привет", "напомни", "когда-нибудь", "1234"])
@@ -0,0 +1,118 @@
+"""Архив: id перенесенных напоминаний не достаются новым."""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from archive import archive_sent, is_archived
+from database import SessionLocal, ArchivedReminder, Reminder, init_schema, make_engine
+from timezones import utcnow
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    init_schema()
+    yield
+    db_session = SessionLocal()
+    try:
+        db_session.query(Reminder).delete()
+        db_session.query(ArchivedReminder).delete()
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def add(user_id, is_sent=False, hours_ago=0):
+    db_session = SessionLocal()
+    try:
+        reminder = Reminder(user_id=user_id, chat_id=user_id, reminder_text='дело',
+                            reminder_time=utcnow() - timedelta(hours=hours_ago), is_sent=is_sent)
+        db_session.add(reminder)
+        db_session.commit()
+        return reminder.id
+    finally:
+        db_session.close()
+
+
+def test_archived_id_is_not_reused():
+    archived_id = add(1, is_sent=True, hours_ago=48)
+    assert archive_sent(pause=0) == 1
+
+    new_id = add(2)
+    assert new_id > archived_id
+    assert not is_archived(new_id)
+
+    # Следующий проход не упирается в уже занятый id архива
+    db_session = SessionLocal()
+    try:
+        db_session.query(Reminder).filter_by(id=new_id).update({'is_sent': True, 'reminder_time': utcnow() - timedelta(hours=48)})
+        db_session.commit()
+    finally:
+        db_session.close()
+    assert archive_sent(pause=0) == 1
+
+
+def test_reused_id_does_not_block_archiving():
+    # Наследие базы без AUTOINCREMENT: в архиве и в reminders один id
+    reminder_id = add(3, is_sent=True, hours_ago=48)
+    db_session = SessionLocal()
+    try:
+        db_session.add(ArchivedReminder(id=reminder_id, user_id=1, chat_id=1, reminder_text='старое',
+                                        reminder_time=utcnow() - timedelta(days=30), archived_at=utcnow()))
+        db_session.commit()
+    finally:
+        db_session.close()
+
+    assert archive_sent(pause=0) == 1
+    db_session = SessionLocal()
+    try:
+        assert db_session.query(ArchivedReminder).filter_by(id=reminder_id).one().user_id == 3
+        assert db_session.query(Reminder).count() == 0
+    finally:
+        db_session.close()
+
+
+def test_legacy_table_gets_autoincrement(tmp_path):
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    legacy = create_engine(url)
+    with legacy.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE reminders (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, '
+            'chat_id INTEGER NOT NULL, reminder_text VARCHAR NOT NULL, reminder_time DATETIME NOT NULL, '
+            'is_sent BOOLEAN)'
+        ))
+        conn.execute(text("INSERT INTO reminders VALUES (1, 1, 1, 'живое', '2030-01-01 09:00:00', 0)"))
+    legacy.dispose()
+
+    bind = make_engine(url)
+    init_schema(bind)
+    with bind.begin() as conn:
+        assert 'AUTOINCREMENT' in conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE name = 'reminders'"
+        )).scalar().upper()
+        assert conn.execute(text('SELECT reminder_text FROM reminders WHERE id = 1')).scalar() == 'живое'
+        conn.execute(text(
+            "INSERT INTO reminders_archive (id, user_id, chat_id, reminder_text, reminder_time, archived_at) "
+            "VALUES (7, 1, 1, 'архив', '2020-01-01', '2020-01-02')"
+        ))
+    # Счетчик подтягивается к архиву при следующем запуске
+    init_schema(bind)
+    with bind.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO reminders (user_id, chat_id, reminder_text, reminder_time, is_sent) "
+            "VALUES (2, 2, 'новое', '2030-01-01 09:00:00', 0)"
+        ))
+        assert conn.execute(text("SELECT id FROM reminders WHERE reminder_text = 'новое'")).scalar() == 8
+    bind.dispose()
+
+
+def test_only_owner_completes_reminder():
+    from reminders import complete_reminder
+
+    reminder_id = add(4, is_sent=True, hours_ago=48)
+    assert not complete_reminder(reminder_id, user_id=5)
+    assert archive_sent(pause=0) == 1
+    # Чужой id не подтверждается и из архива
+    assert not complete_reminder(reminder_id, user_id=5)
+    assert not is_archived(reminder_id, user_id=5)
+    assert complete_reminder(reminder_id, user_id=4)
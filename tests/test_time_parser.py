@@ -0,0 +1,109 @@
+"""time_parser: совпадение с прежним парсером и разбор отдельных фраз."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import time_parser
+from reference_parser import old_parse_time_input, random_phrase
+
+# Среда, 14:07
+NOW = datetime(2024, 3, 13, 14, 7, 30, 123)
+
+
+@pytest.mark.parametrize('now', [
+    NOW,
+    datetime(2024, 3, 13, 7, 0),
+    datetime(2024, 3, 13, 23, 59, 59),
+    datetime(2024, 12, 31, 20, 30),
+])
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_previous_parser(seed, now):
+    """Фразы, которые понимал прежний parse_time_input, дают то же время"""
+    rng = random.Random(seed)
+    for _ in range(1000):
+        phrase = random_phrase(rng)
+        assert time_parser.parse(phrase, now) == old_parse_time_input(phrase, now), phrase
+
+
+@pytest.mark.parametrize('phrase, expected', [
+    ("через 2 часа", NOW + timedelta(hours=2)),
+    ("через полчаса", NOW + timedelta(minutes=30)),
+    ("in an hour", NOW + timedelta(hours=1)),
+    ("завтра в 15:30", datetime(2024, 3, 14, 15, 30)),
+    ("послезавтра вечером", datetime(2024, 3, 15, 19, 0)),
+    ("25.12.2030 18:00", datetime(2030, 12, 25, 18, 0)),
+    ("2030-12-25 18:00", datetime(2030, 12, 25, 18, 0)),
+    ("25.12 в 18:00", datetime(2024, 12, 25, 18, 0)),
+    ("в пятницу в 6 вечера", datetime(2024, 3, 15, 18, 0)),
+    ("в среду в 10", datetime(2024, 3, 20, 10, 0)),
+    ("в 15:30", datetime(2024, 3, 13, 15, 30)),
+    ("в 9", datetime(2024, 3, 14, 9, 0)),
+    ("в 3 часа дня", datetime(2024, 3, 13, 15, 0)),
+    ("в 2 ночи", datetime(2024, 3, 14, 2, 0)),
+    ("в 11 ночи", datetime(2024, 3, 13, 23, 0)),
+    ("at 9pm", datetime(2024, 3, 13, 21, 0)),
+    ("Купить хлеб ЗАВТРА в 10", datetime(2024, 3, 14, 10, 0)),
+    ("через 2 дня в 10:00", datetime(2024, 3, 15, 10, 0)),
+    ("через неделю в 6 вечера", datetime(2024, 3, 20, 18, 0)),
+    ("in 2 days at 10am", datetime(2024, 3, 15, 10, 0)),
+    ("через 2 дня позвонить", NOW + timedelta(days=2)),
+    ("встреча 25.12. купить торт", datetime(2024, 12, 25, 9, 0)),
+])
+def test_parse(phrase, expected):
+    assert time_parser.parse(phrase, NOW) == expected
+
+
+@pytest.mark.parametrize('phrase', [
+    "привет", "", "31.02.2030 10:00", "в 25:00", "сегодня в 13",
+    # Дробь перед единицей — не дата
+    "через 1.5 часа", "купить 2.5 кг сахара",
+    # Смещение за пределами календаря
+    "через 99999999 дней", "in 99999999999 weeks",
+])
+def test_no_time(phrase):
+    assert time_parser.parse(phrase, NOW) is None
+
+
+@pytest.mark.parametrize('phrase, expected', [
+    # Час уже прошел: имеется в виду вечер
+    ("сегодня в 10", datetime(2024, 3, 13, 22, 0)),
+    ("today at 10", datetime(2024, 3, 13, 22, 0)),
+    ("сегодня в 3 часа", datetime(2024, 3, 13, 15, 0)),
+    ("сегодня в 15", datetime(2024, 3, 13, 15, 0)),
+    # Прошедшее время сегодня — не время в прошлом, а отказ
+    ("сегодня в 10 утра", None),
+    ("сегодня в 14:00", None),
+])
+def test_today_is_never_in_the_past(phrase, expected):
+    assert time_parser.parse(phrase, NOW) == expected
+    assert time_parser.parse(phrase, datetime(2024, 3, 13, 23, 30)) is None
+
+
+@pytest.mark.parametrize('phrase, expected', [
+    ("позвонить в 3 магазина", None),
+    ("зайти в 2 аптеки завтра", datetime(2024, 3, 14, 9, 0)),
+    ("завтра в 3 магазина", datetime(2024, 3, 14, 9, 0)),
+    ("позвонить в 3", datetime(2024, 3, 14, 3, 0)),
+    ("в 10 позвонить маме", datetime(2024, 3, 14, 10, 0)),
+    ("встреча в 3 часа", datetime(2024, 3, 14, 3, 0)),
+    ("в 10, не забыть", datetime(2024, 3, 14, 10, 0)),
+])
+def test_number_before_a_word_is_not_an_hour(phrase, expected):
+    assert time_parser.parse(phrase, NOW) == expected
+
+
+def test_find_span_covers_the_time():
+    text = "Встреча в 3 часа дня"
+    reminder_time, (start, end) = time_parser.find(text, NOW)
+    assert reminder_time == datetime(2024, 3, 13, 15, 0)
+    assert time_parser.normalize(text)[start:end] == "в 3 часа дня"
+
+
+@pytest.mark.parametrize('phrase, expected_time, expected_rule', [
+    ("каждый день в 9:00", datetime(2024, 3, 14, 9, 0), 'D'),
+    ("каждый день в 8 вечера", datetime(2024, 3, 13, 20, 0), 'D'),
+    ("каждый понедельник в 10", datetime(2024, 3, 18, 10, 0), 'W:0'),
+])
+def test_parse_recurrence(phrase, expected_time, expected_rule):
+    assert time_parser.parse_recurrence(phrase, NOW) == (expected_time, expected_rule)
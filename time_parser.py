@@ -0,0 +1,285 @@
+"""Разбор времени напоминания из текста.
+
+Все поддерживаемые формы собраны в одно заранее скомпилированное регулярное
+выражение с именованными ветками, поэтому текст просматривается за один проход.
+Результат разбора нормализованной строки (спецификация без привязки к текущему
+моменту) кэшируется, а конкретное время вычисляется от ``now`` при каждом вызове.
+"""
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import recurrence
+
+PARTS_OF_DAY = {
+    'утром': 9, 'днем': 13, 'вечером': 19, 'ночью': 23,
+    'morning': 9, 'afternoon': 13, 'evening': 19, 'night': 23,
+}
+
+DAY_OFFSETS = {
+    'сегодня': 0, 'завтра': 1, 'послезавтра': 2,
+    'today': 0, 'tomorrow': 1, 'day after tomorrow': 2,
+}
+
+WEEKDAYS = {
+    'понедельник': 0, 'вторник': 1, 'среду': 2, 'среда': 2, 'четверг': 3,
+    'пятницу': 4, 'пятница': 4, 'субботу': 5, 'суббота': 5, 'воскресенье': 6,
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6,
+}
+
+# Единица относительного времени -> секунды (по первым буквам)
+UNITS = (
+    ('мин', 60), ('min', 60),
+    ('ч', 3600), ('h', 3600),
+    ('д', 86400), ('day', 86400),
+    ('нед', 604800), ('week', 604800),
+)
+
+DEFAULT_HOUR = 9
+
+# Час без минут, «часа» и am/pm — время, только если за ним не идет другое
+# слово: «в 10», «в 10 позвонить маме», но не «позвонить в 3 магазина»
+_HOUR_FOLLOWS = (
+    r'(?=\s*(?:$|[^\w\s]|(?:в|at)\b|сегодня|завтра|послезавтра'
+    r'|\w+(?:ть|ти|чь)(?:ся)?\b|[a-z]))'
+)
+
+_CLOCK = (
+    r'(?P<{0}h>\d{{1,2}})(?:[:.](?P<{0}m>\d{{2}}))?(?P<{0}c>\s+час(?:а|ов)?\b)?'
+    r'(?:\s*(?P<{0}ap>am|pm|утра|дня|вечера|ночи)\b)?'
+    r'(?({0}m)|(?({0}ap)|(?({0}c)|' + _HOUR_FOLLOWS + ')))'
+)
+
+# Дробное число перед единицей измерения — количество, а не дата
+_NOT_A_QUANTITY = (
+    r'(?!\s*(?:минут|мин\b|час|ч\b|дн|день|недел|сек|кг|г\b|гр\b|грамм|килограмм|л\b|литр|мл\b'
+    r'|км\b|м\b|см\b|мм\b|метр|шт\b|штук|раз|руб|р\b|%|hours?\b|mins?\b|days?\b|kg\b|km\b))'
+)
+
+_GRAMMAR = re.compile('|'.join([
+    # через 2 часа, через час, через полчаса, через 15 мин, через 2 дня в 10:00
+    r'через\s+(?P<rn>\d+|пол)?\s*(?:(?P<ru>минут[уы]?|мин|час(?:а|ов)?|ч)'
+    r'|(?P<rd>дн(?:я|ей)|день|недел[юиь]|недель)(?:\s+(?:в\s+)?' + _CLOCK.format('o') + ')?)',
+    # in 2 hours, in an hour, in 2 days at 10am
+    r'\bin\s+(?P<en>\d+|an?|one)\s*(?:(?P<eu>minutes?|mins?|hours?|hrs?|h)\b'
+    r'|(?P<ed>days?|weeks?)\b(?:\s+(?:at\s+)?' + _CLOCK.format('e') + ')?)',
+    # 2023-12-25 18:00, 2023-12-25t18:00
+    r'(?P<iy>\d{4})-(?P<imo>\d{1,2})-(?P<id>\d{1,2})(?:[t\s]+(?P<ih>\d{1,2}):(?P<imi>\d{2}))?',
+    # 25.12.2023 18:00, 25.12 в 18:00; не дробь: «через 1.5 часа», «2.5 кг»
+    r'(?<!через )\b(?P<ad>\d{1,2})\.(?P<amo>\d{1,2})(?:\.(?P<ay>\d{4}))?(?!\d|\.\d)' + _NOT_A_QUANTITY +
+    r'(?:\s+(?:в\s+)?(?P<ah>\d{1,2}):(?P<ami>\d{2}))?',
+    # послезавтра в 10, завтра утром, today at 9pm, tomorrow evening
+    r'(?P<dd>послезавтра|завтра|сегодня|day after tomorrow|tomorrow|today)'
+    r'(?:\s+(?P<dp>утром|днем|вечером|ночью|morning|afternoon|evening|night)'
+    r'|\s+(?:(?:в|at)\s+)?' + _CLOCK.format('d') + ')?',
+    # в понедельник в 10:00, friday at 6pm
+    r'(?P<wd>понедельник|вторник|сред[уа]|четверг|пятниц[уа]|суббот[уа]|воскресенье'
+    r'|monday|tuesday|wednesday|thursday|friday|saturday|sunday)'
+    r'(?:\s+(?:(?:в|at)\s+)?' + _CLOCK.format('w') + ')?',
+    # в 15:30, at 9pm, 18:45
+    r'(?:\b(?:в|at)\s+)?(?P<th>\d{1,2}):(?P<tm>\d{2})(?:\s*(?P<tap>am|pm)\b)?',
+    r'\b(?:в|at)\s+' + _CLOCK.format('k'),
+]))
+
+_WEEKDAY = (
+    r'понедельник|вторник|сред[уа]|четверг|пятниц[уа]|суббот[уа]|воскресенье'
+    r'|monday|tuesday|wednesday|thursday|friday|saturday|sunday'
+)
+
+_RECURRENCE = re.compile(
+    r'(?:(?P<daily>каждый день|ежедневно|every day|daily)'
+    r'|(?P<workdays>каждый будний день|по будням|every weekday|on weekdays)'
+    r'|(?:кажд(?:ый|ую|ое)|every)\s+(?P<wd>' + _WEEKDAY + ')'
+    r'|(?:каждое|каждый месяц)\s+(?P<md>\d{1,2})(?:-?(?:е|го))?(?:\s+числ[оа])?'
+    r'|every month on the (?P<emd>\d{1,2})(?:st|nd|rd|th)?'
+    r')(?:,?\s+(?:(?:в|at)\s+)?' + _CLOCK.format('r') + ')?'
+)
+
+
+# «в 6 вечера», «в 2 ночи»: ночью до 5 — после полуночи, позже — до нее
+MERIDIEMS = {'утра': 'am', 'дня': 'pm', 'вечера': 'pm'}
+
+
+def _hour(hour, ampm):
+    hour = int(hour)
+    if ampm == 'ночи':
+        ampm = 'am' if hour <= 5 or hour == 12 else 'pm'
+    ampm = MERIDIEMS.get(ampm, ampm)
+    if ampm == 'pm' and hour < 12:
+        hour += 12
+    elif ampm == 'am' and hour == 12:
+        hour = 0
+    return hour
+
+
+def _unit_seconds(unit):
+    for prefix, seconds in UNITS:
+        if unit.startswith(prefix):
+            return seconds
+    return None
+
+
+def _spec_from_match(match):
+    """Превращает совпадение грамматики в спецификацию времени"""
+    groups = match.groupdict()
+
+    unit = groups['ru'] or groups['rd'] or groups['eu'] or groups['ed']
+    if unit:
+        count = groups['rn'] if groups['ru'] or groups['rd'] else groups['en']
+        seconds = _unit_seconds(unit)
+        clock = 'o' if groups['oh'] else 'e' if groups['eh'] else None
+        if clock:
+            # «через 2 дня в 10:00» — день по смещению, время из фразы
+            if count == 'пол':
+                return None
+            days = seconds // 86400 * (int(count) if count and count.isdigit() else 1)
+            return ('day', days, _hour(groups[clock + 'h'], groups[clock + 'ap']),
+                    int(groups[clock + 'm'] or 0))
+        if count == 'пол':
+            return ('rel', seconds // 2)
+        if count is None or not count.isdigit():
+            return ('rel', seconds)
+        return ('rel', int(count) * seconds)
+
+    if groups['iy']:
+        return ('abs', int(groups['iy']), int(groups['imo']), int(groups['id']),
+                int(groups['ih'] or DEFAULT_HOUR), int(groups['imi'] or 0))
+
+    if groups['ad']:
+        year = int(groups['ay']) if groups['ay'] else None
+        return ('abs', year, int(groups['amo']), int(groups['ad']),
+                int(groups['ah'] or DEFAULT_HOUR), int(groups['ami'] or 0))
+
+    if groups['dd']:
+        offset = DAY_OFFSETS[groups['dd']]
+        if groups['dp']:
+            return ('day', offset, PARTS_OF_DAY[groups['dp']], 0)
+        if groups['dh']:
+            hour, minute = _hour(groups['dh'], groups['dap']), int(groups['dm'] or 0)
+            if offset == 0:
+                return ('today', hour, minute, groups['dap'] is None and hour < 12)
+            return ('day', offset, hour, minute)
+        return ('day', offset, DEFAULT_HOUR, 0)
+
+    if groups['wd']:
+        hour = _hour(groups['wh'], groups['wap']) if groups['wh'] else DEFAULT_HOUR
+        return ('weekday', WEEKDAYS[groups['wd']], hour, int(groups['wm'] or 0))
+
+    if groups['th']:
+        return ('time', _hour(groups['th'], groups['tap']), int(groups['tm']))
+
+    return ('time', _hour(groups['kh'], groups['kap']), int(groups['km'] or 0))
+
+
+@lru_cache(maxsize=4096)
+def _parse_spec(normalized):
+    match = _GRAMMAR.search(normalized)
+    if match is None:
+        return None, None
+    return _spec_from_match(match), match.span()
+
+
+def normalize(text):
+    """Приводит текст к виду, по которому кэшируется разбор"""
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def resolve(spec, now):
+    """Вычисляет время по спецификации относительно ``now``"""
+    kind = spec[0]
+    try:
+        if kind == 'rel':
+            return now + timedelta(seconds=spec[1])
+
+        if kind == 'day':
+            _, offset, hour, minute = spec
+            return (now + timedelta(days=offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+        if kind == 'today':
+            # «Сегодня в 10» в 14:00 — это 22:00; прошедшее время не подходит
+            _, hour, minute, twelve_hour = spec
+            result = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if result <= now and twelve_hour:
+                result += timedelta(hours=12)
+            return result if result > now else None
+
+        if kind == 'weekday':
+            _, weekday, hour, minute = spec
+            days = (weekday - now.weekday()) % 7
+            result = (now + timedelta(days=days)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+            return result if result > now else result + timedelta(days=7)
+
+        if kind == 'time':
+            _, hour, minute = spec
+            result = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            return result if result > now else result + timedelta(days=1)
+
+        _, year, month, day, hour, minute = spec
+        if year is not None:
+            return datetime(year, month, day, hour, minute)
+        result = datetime(now.year, month, day, hour, minute)
+        return result if result > now else result.replace(year=now.year + 1)
+    except (ValueError, OverflowError):
+        # Несуществующая дата или время вроде 31.02 или 25:00,
+        # либо смещение за пределами календаря («через 99999999 дней»)
+        return None
+
+
+def parse_spec(text):
+    """Возвращает спецификацию времени из текста без привязки к моменту"""
+    return _parse_spec(normalize(text))[0]
+
+
+@lru_cache(maxsize=1024)
+def _parse_recurrence_spec(normalized):
+    match = _RECURRENCE.search(normalized)
+    if match is None:
+        return None
+    groups = match.groupdict()
+    if groups['daily']:
+        rule = recurrence.DAILY
+    elif groups['workdays']:
+        rule = recurrence.WORKDAYS
+    elif groups['wd']:
+        rule = recurrence.weekly(WEEKDAYS[groups['wd']])
+    else:
+        day = int(groups['md'] or groups['emd'])
+        if not 1 <= day <= 31:
+            return None
+        rule = recurrence.monthly(day)
+    hour = _hour(groups['rh'], groups['rap']) if groups['rh'] else DEFAULT_HOUR
+    minute = int(groups['rm'] or 0)
+    if hour > 23 or minute > 59:
+        return None
+    return rule, hour, minute
+
+
+def parse_recurrence(text, now=None):
+    """Парсит повторяющееся время («каждый день в 9:00»).
+
+    Возвращает пару (первое срабатывание, правило) или None.
+    """
+    spec = _parse_recurrence_spec(normalize(text))
+    if spec is None:
+        return None
+    rule, hour, minute = spec
+    return recurrence.next_occurrence(rule, hour, minute, now or datetime.now()), rule
+
+
+def find(text, now=None):
+    """Ищет время в тексте.
+
+    Возвращает пару (время, (начало, конец) найденного фрагмента в
+    нормализованном тексте) или (None, None).
+    """
+    spec, span = _parse_spec(normalize(text))
+    if spec is None:
+        return None, None
+    result = resolve(spec, now or datetime.now())
+    return (result, span) if result is not None else (None, None)
+
+
+def parse(text, now=None):
+    """Парсит текстовый ввод времени"""
+    return find(text, now)[0]
@@ -0,0 +1,77 @@
+"""Часовые пояса пользователей.
+
+Время напоминаний хранится в базе как наивное UTC (SQLite не хранит
+смещение). Текст пользователя разбирается от текущего времени в его поясе,
+результат переводится в UTC, а при показе — обратно. Пояс пользователя —
+имя IANA из ``user_settings``, без настройки — ``DEFAULT_TIMEZONE``.
+Объекты ZoneInfo кэшируются здесь, пояса пользователей — в
+``cache.user_zones``, поэтому перевод на горячем пути — это только
+арифметика смещений.
+"""
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, available_timezones
+
+import config
+
+ALIASES = {
+    'мск': 'Europe/Moscow', 'msk': 'Europe/Moscow', 'москва': 'Europe/Moscow',
+    'utc': 'UTC', 'gmt': 'UTC',
+}
+_OFFSET = re.compile(r'(?:utc|gmt)?([+-])(\d{1,2})')
+
+
+def utcnow():
+    """Текущее время как наивное UTC — в том виде, в котором оно хранится в базе"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    return ZoneInfo(name)
+
+
+def to_local(utc_time, zone):
+    """Наивное UTC -> наивное местное время пояса ``zone``"""
+    return utc_time.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+
+
+def to_utc(local_time, zone):
+    """Наивное местное время пояса ``zone`` -> наивное UTC"""
+    return local_time.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_now(zone):
+    return datetime.now(zone).replace(tzinfo=None)
+
+
+@lru_cache(maxsize=1)
+def _zone_names():
+    return {name.lower(): name for name in available_timezones()}
+
+
+def resolve_zone_name(text):
+    """Имя пояса IANA по вводу пользователя или None.
+
+    Понимает имена IANA в любом регистре (``europe/moscow``), смещения
+    (``UTC+3``, ``-5``) и несколько сокращений (``мск``).
+    """
+    key = '_'.join(text.lower().split())
+    if key in ALIASES:
+        return ALIASES[key]
+    match = _OFFSET.fullmatch(key.replace('_', ''))
+    if match:
+        sign, hours = match.groups()
+        hours = int(hours)
+        if hours == 0:
+            return 'UTC'
+        # В именах Etc/GMT знак обратный: Etc/GMT-3 — это UTC+3
+        name = f"Etc/GMT{'-' if sign == '+' else '+'}{hours}"
+        return name if name.lower() in _zone_names() else None
+    return _zone_names().get(key)
+
+
+def zone_of(name):
+    """ZoneInfo по имени из ``user_settings`` (None — пояс по умолчанию)"""
+    return get_zone(name or config.DEFAULT_TIMEZONE)
@@ -0,0 +1,133 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import func, insert, select
+
+from database import engine, Reminder
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_ROWS = metrics.Histogram(
+    'helotime_write_batch_rows', 'Напоминаний в одной групповой записи', buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+
+
+class ReminderWriter:
+    """Групповая запись новых напоминаний.
+
+    Вставки из параллельных обработчиков копятся в очереди и пишутся одной
+    транзакцией: пока идет коммит, следующие вставки собираются в новую
+    пачку. Если предыдущая пачка была больше одной строки (идет всплеск),
+    писатель после первой вставки еще до ``delay_ms`` ждет остальные;
+    одиночные вставки пишутся без ожидания. Каждый вызов :meth:`submit`
+    получает Future с id своей строки. После коммита ``on_commit`` получает
+    список пар ``(id, значения)`` всей пачки — например, чтобы запланировать
+    ее одним вызовом.
+    """
+
+    def __init__(self, on_commit=None, batch_size=None, delay_ms=None):
+        self._on_commit = on_commit
+        self.batch_size = batch_size or config.WRITE_BATCH_SIZE
+        self.delay = (config.WRITE_BATCH_DELAY_MS if delay_ms is None else delay_ms) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._last_batch_size = 0
+
+    def start(self):
+        """Запускает поток писателя"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='reminder-writer', daemon=True)
+        self._thread.start()
+        logger.info("Групповая запись напоминаний запущена")
+
+    def shutdown(self):
+        """Дописывает уже принятые вставки и останавливает поток"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, values):
+        """Ставит вставку в очередь; Future вернет id новой строки"""
+        if self._thread is None:
+            raise RuntimeError("Групповая запись не запущена")
+        future = Future()
+        self._queue.put((values, future))
+        return future
+
+    def _next_batch(self):
+        item = self._queue.get()
+        batch = []
+        deadline = time.monotonic() + (self.delay if self._last_batch_size > 1 else 0)
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return batch, False
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    return batch, False
+        return batch, True
+
+    def _run(self):
+        while True:
+            batch, stopping = self._next_batch()
+            self._last_batch_size = len(batch)
+            if batch:
+                self._write(batch)
+            if stopping:
+                break
+
+    def _write(self, batch):
+        try:
+            ids = self._insert([values for values, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Ошибка при записи напоминания: {e}")
+                batch[0][1].set_exception(e)
+                return
+            # Одна плохая строка не должна ронять всю пачку: пишем по одной
+            logger.warning(f"Ошибка групповой записи {len(batch)} напоминаний, пишем по одной: {e}")
+            for item in batch:
+                self._write([item])
+            return
+
+        WRITE_BATCH_ROWS.observe(len(batch))
+        if self._on_commit is not None:
+            try:
+                self._on_commit([(reminder_id, values) for reminder_id, (values, _) in zip(ids, batch)])
+            except Exception as e:
+                logger.error(f"Ошибка после записи напоминаний {ids}: {e}")
+        for reminder_id, (_, future) in zip(ids, batch):
+            future.set_result(reminder_id)
+
+    def _insert(self, rows):
+        """Вставляет строки одной транзакцией и возвращает их id по порядку"""
+        with engine.begin() as conn:
+            if engine.dialect.name == 'postgresql':
+                # Порядок строк RETURNING не гарантирован: id берем из
+                # последовательности заранее, одним запросом на пачку, и
+                # вставляем явно — так id каждой строки известен
+                sequence = func.pg_get_serial_sequence(Reminder.__tablename__, 'id')
+                ids = conn.execute(
+                    select(func.nextval(sequence)).select_from(func.generate_series(1, len(rows)))
+                ).scalars().all()
+                conn.execute(insert(Reminder), [dict(row, id=reminder_id) for row, reminder_id in zip(rows, ids)])
+                return ids
+            # SQLite (без RETURNING в SQLAlchemy 1.4): строки по одной, но
+            # в одной транзакции — коммит, а с ним и fsync, один на пачку
+            statement = insert(Reminder)
+            return [conn.execute(statement, row).inserted_primary_key[0] for row in rows]